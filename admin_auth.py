@@ -0,0 +1,25 @@
+# admin_auth.py - Access checks for admin-only endpoints and request options
+from functools import wraps
+
+from flask import request, jsonify
+
+from config import Config
+
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+def is_admin_request(current=None):
+    """Whether the request carries the X-Admin-Token header matching
+    ADMIN_TOKEN, or is local when no token is configured"""
+    current = current if current is not None else request
+    if Config.ADMIN_TOKEN:
+        return current.headers.get('X-Admin-Token') == Config.ADMIN_TOKEN
+    return current.remote_addr in LOCAL_ADDRESSES
+
+def require_admin(view):
+    """Reject requests that fail is_admin_request with 403"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_admin_request():
+            return jsonify({'error': 'Forbidden'}), 403
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,333 @@
+# alert_outbox.py - Durable alert outbox on weather_alerts.delivery_status
+import os
+import threading
+import atexit
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from database.db import db_pool
+from utils.metrics import counter
+from utils.notification_dispatcher import bulk_dispatcher
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SEVERITY_ORDER = ['low', 'medium', 'high', 'critical']
+
+# Channels every alert is sent over
+CHANNELS = ('sms', 'whatsapp')
+
+# Rows per IN (...) lookup, well under SQLite's bound-parameter limit
+QUERY_CHUNK = 500
+
+OUTBOX_FAILED_LEGS = counter(
+    'smartcrop_outbox_failed_channel_total',
+    'Alerts marked sent although one channel failed', ['channel']
+)
+
+def highest_severity(alerts):
+    """Most severe level among a list of alerts, or None"""
+    levels = [alert.get('severity') for alert in alerts if alert.get('severity') in SEVERITY_ORDER]
+    return max(levels, key=SEVERITY_ORDER.index) if levels else None
+
+class AlertOutbox:
+    def __init__(self, dispatcher=None, batch_size=None, poll_interval=None,
+                 lease_seconds=None, max_attempts=None, workers=None, dedup_window=None, pool=None):
+        """Persist alerts as pending rows and deliver them from a background worker
+
+        Rows move pending -> sending -> sent/failed. A row stuck in
+        'sending' longer than lease_seconds (e.g. the process died mid-send)
+        is claimed again, so crashed sends are retried after a restart.
+        An alert whose content hash is already queued for the farmer, or
+        was sent within dedup_window seconds, is not queued again; failed
+        rows do not count, so a failed alert can be re-sent at once.
+
+        The worker is started per process at startup (create_app, or
+        Gunicorn's post_fork), so rows left over from a previous run are
+        delivered without waiting for a new alert. The outbox columns come
+        from database/schema.sql (init_db at startup).
+        """
+        self.dispatcher = dispatcher or bulk_dispatcher
+        self.pool = pool or db_pool
+        self.batch_size = batch_size or Config.OUTBOX_BATCH_SIZE
+        self.poll_interval = poll_interval or Config.OUTBOX_POLL_INTERVAL
+        self.lease_seconds = lease_seconds or Config.OUTBOX_LEASE_SECONDS
+        self.max_attempts = max_attempts or Config.OUTBOX_MAX_ATTEMPTS
+        self.workers = workers or Config.NOTIFICATION_WORKERS
+        self.dedup_window = Config.ALERT_DEDUP_WINDOW if dedup_window is None else dedup_window
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.stop)
+
+    def is_duplicate(self, conn, farmer_id, message_hash):
+        """True if the same content is queued for, or was recently sent to, a farmer"""
+        if not message_hash or self.dedup_window <= 0:
+            return False
+        row = conn.execute('''
+            SELECT 1 FROM weather_alerts
+            WHERE farmer_id = ? AND message_hash = ?
+              AND (delivery_status IN ('pending', 'sending')
+                   OR (delivery_status = 'sent' AND sent_at >= datetime('now', ?)))
+            LIMIT 1
+        ''', (farmer_id, message_hash, f'-{int(self.dedup_window)} seconds')).fetchone()
+        return row is not None
+
+    def enqueue(self, phone, district, message, alert_type='weather', severity=None, message_hash=None):
+        """Insert a pending alert and return its id, or None for a duplicate
+
+        Delivery happens later, on the worker.
+        """
+        with self.pool.connection() as conn:
+            # BEGIN IMMEDIATE makes the duplicate check and the insert one
+            # step across workers
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = conn.cursor()
+
+                # Get or create farmer
+                cursor.execute('SELECT id FROM farmers WHERE phone = ?', (phone,))
+                farmer = cursor.fetchone()
+
+                if not farmer:
+                    cursor.execute('INSERT INTO farmers (phone, district) VALUES (?, ?)', (phone, district))
+                    farmer_id = cursor.lastrowid
+                else:
+                    farmer_id = farmer[0]
+
+                if self.is_duplicate(conn, farmer_id, message_hash):
+                    conn.rollback()
+                    return None
+
+                cursor.execute('''
+                    INSERT INTO weather_alerts
+                        (farmer_id, district, alert_type, alert_message, message_hash, severity, delivery_status)
+                    VALUES (?, ?, ?, ?, ?, ?, 'pending')
+                ''', (farmer_id, district, alert_type, message, message_hash, severity))
+                alert_id = cursor.lastrowid
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        # Deliver now rather than at the next poll
+        self._wake.set()
+        return alert_id
+
+    def enqueue_many(self, message, district, phones=None, alert_type='weather', severity=None, message_hash=None):
+        """Insert one pending alert per farmer and return a summary
+
+        Recipients are the given phones (registered in the district if
+        new), or every farmer registered in the district. Farmers already
+        queued or recently sent the same content are skipped. All rows
+        are written in one transaction, so their ids are consecutive.
+        """
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if phones is None:
+                    farmer_ids = [row[0] for row in conn.execute(
+                        'SELECT id FROM farmers WHERE district = ? COLLATE NOCASE ORDER BY id', (district,)
+                    )]
+                else:
+                    farmer_ids = self.farmer_ids(conn, list(dict.fromkeys(phones)), district)
+
+                duplicates = self.duplicates(conn, farmer_ids, message_hash)
+                rows = [
+                    (farmer_id, district, alert_type, message, message_hash, severity)
+                    for farmer_id in farmer_ids if farmer_id not in duplicates
+                ]
+                conn.executemany('''
+                    INSERT INTO weather_alerts
+                        (farmer_id, district, alert_type, alert_message, message_hash, severity, delivery_status)
+                    VALUES (?, ?, ?, ?, ?, ?, 'pending')
+                ''', rows)
+                last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0] if rows else None
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        if rows:
+            self._wake.set()
+        return {
+            'recipients': len(farmer_ids),
+            'queued': len(rows),
+            'duplicates_skipped': len(farmer_ids) - len(rows),
+            'first_alert_id': last_id - len(rows) + 1 if rows else None,
+            'last_alert_id': last_id
+        }
+
+    def farmer_ids(self, conn, phones, district):
+        """Farmer ids of phones in order, registering unknown phones in district"""
+        known = {}
+        for start in range(0, len(phones), QUERY_CHUNK):
+            chunk = phones[start:start + QUERY_CHUNK]
+            known.update(conn.execute(
+                f"SELECT phone, id FROM farmers WHERE phone IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall())
+        for phone in phones:
+            if phone not in known:
+                known[phone] = conn.execute(
+                    'INSERT INTO farmers (phone, district) VALUES (?, ?)', (phone, district)
+                ).lastrowid
+        return [known[phone] for phone in phones]
+
+    def duplicates(self, conn, farmer_ids, message_hash):
+        """Farmers among farmer_ids already queued or recently sent message_hash"""
+        if not message_hash or self.dedup_window <= 0:
+            return set()
+        found = set()
+        for start in range(0, len(farmer_ids), QUERY_CHUNK):
+            chunk = farmer_ids[start:start + QUERY_CHUNK]
+            found.update(row[0] for row in conn.execute(f'''
+                SELECT farmer_id FROM weather_alerts
+                WHERE message_hash = ? AND farmer_id IN ({','.join('?' * len(chunk))})
+                  AND (delivery_status IN ('pending', 'sending')
+                       OR (delivery_status = 'sent' AND sent_at >= datetime('now', ?)))
+            ''', [message_hash, *chunk, f'-{int(self.dedup_window)} seconds']))
+        return found
+
+    def get_status(self, alert_id):
+        """Delivery status of one alert, or None if unknown"""
+        with self.pool.connection() as conn:
+            row = conn.execute('''
+                SELECT id, district, alert_type, delivery_status, attempts, sent_at, last_error
+                FROM weather_alerts WHERE id = ?
+            ''', (alert_id,)).fetchone()
+        if row is None:
+            return None
+        keys = ['alert_id', 'district', 'alert_type', 'delivery_status', 'attempts', 'sent_at', 'last_error']
+        return dict(zip(keys, row))
+
+    def claim_batch(self):
+        """Atomically mark a batch of due alerts as 'sending' and return them"""
+        with self.pool.connection() as conn:
+            # BEGIN IMMEDIATE takes the write lock up front, so two workers
+            # (threads or processes) can never claim the same rows
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = conn.execute('''
+                    SELECT w.id, f.phone, w.district, w.alert_message, w.attempts
+                    FROM weather_alerts w
+                    JOIN farmers f ON f.id = w.farmer_id
+                    WHERE w.delivery_status = 'pending'
+                       OR (w.delivery_status = 'sending' AND w.claimed_at < datetime('now', ?))
+                    ORDER BY w.id
+                    LIMIT ?
+                ''', (f'-{int(self.lease_seconds)} seconds', self.batch_size)).fetchall()
+                if rows:
+                    conn.executemany('''
+                        UPDATE weather_alerts
+                        SET delivery_status = 'sending', claimed_at = datetime('now'), attempts = attempts + 1
+                        WHERE id = ?
+                    ''', [(row[0],) for row in rows])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return rows
+
+    def _deliver(self, row):
+        """Send one claimed alert over SMS and WhatsApp in parallel
+
+        The alert counts as sent when either channel delivered it; the
+        error of a failed channel is kept in last_error.
+        """
+        alert_id, phone, district, message, attempts = row
+        with ThreadPoolExecutor(max_workers=len(CHANNELS)) as pool:
+            futures = [pool.submit(self.dispatcher.send_with_retry, channel, phone, message) for channel in CHANNELS]
+            results = dict(zip(CHANNELS, (future.result()[0] for future in futures)))
+
+        failed = {channel: result for channel, result in results.items() if result.get('status') != 'success'}
+        error = '; '.join(f"{channel}: {result.get('error')}" for channel, result in failed.items()) or None
+
+        if len(failed) < len(CHANNELS):
+            for channel in failed:
+                OUTBOX_FAILED_LEGS.inc(channel=channel)
+            if failed:
+                logger.warning(f"Alert {alert_id} sent without {', '.join(failed)}: {error}")
+            return ('sent', error, alert_id)
+
+        # attempts was already incremented when the row was claimed; an
+        # alert no channel can ever deliver (e.g. an invalid number) fails now
+        retryable = any(result.get('retryable') for result in failed.values())
+        status = 'failed' if not retryable or attempts + 1 >= self.max_attempts else 'pending'
+        return (status, error, alert_id)
+
+    def process_batch(self):
+        """Claim, send and record one batch; returns the number of alerts handled"""
+        rows = self.claim_batch()
+        if not rows:
+            return 0
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(rows)), thread_name_prefix='outbox-send') as pool:
+            outcomes = list(pool.map(self._deliver, rows))
+
+        # One bulk status update for the whole batch
+        with self.pool.transaction() as conn:
+            conn.executemany('''
+                UPDATE weather_alerts
+                SET delivery_status = ?, last_error = ?, claimed_at = NULL,
+                    sent_at = CASE WHEN ? = 'sent' THEN CURRENT_TIMESTAMP ELSE sent_at END
+                WHERE id = ?
+            ''', [(status, error, status, alert_id) for status, error, alert_id in outcomes])
+
+        sent = sum(1 for status, _, _ in outcomes if status == 'sent')
+        logger.info(f"Outbox delivered {sent}/{len(outcomes)} alerts")
+        return len(outcomes)
+
+    def _run(self):
+        """Worker loop: drain due alerts, then sleep until woken or polled"""
+        while not self._stopping.is_set():
+            try:
+                if self.process_batch():
+                    continue
+            except Exception as e:
+                logger.error(f"Error processing alert outbox: {str(e)}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def start(self):
+        """Start the background worker, once per process"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='alert-outbox', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Stop the worker after its current batch"""
+        thread = self._thread
+        if thread is None or self._pid != os.getpid():
+            return
+        self._stopping.set()
+        self._wake.set()
+        thread.join(timeout)
+        self._thread = None
+
+# Global alert outbox instance
+alert_outbox = AlertOutbox()
+
+def enqueue_alert(phone, district, message, alert_type='weather', severity=None, message_hash=None):
+    """Public interface for queueing an alert for delivery; None for a duplicate"""
+    return alert_outbox.enqueue(phone, district, message, alert_type, severity, message_hash)
+
+def enqueue_bulk_alert(message, district, phones=None, alert_type='weather', severity=None, message_hash=None):
+    """Public interface for queueing one alert for many farmers"""
+    return alert_outbox.enqueue_many(message, district, phones, alert_type, severity, message_hash)
+
+def get_alert_status(alert_id):
+    """Public interface for alert delivery status"""
+    return alert_outbox.get_status(alert_id)
+
+def start_outbox_worker():
+    """Public interface for starting delivery (e.g. at app startup)"""
+    alert_outbox.start()
@@ -0,0 +1,204 @@
+# alert_rules.py - Table-driven, vectorized weather alert rules
+import json
+import os
+import threading
+import time
+import logging
+from datetime import datetime
+
+import numpy as np
+
+from config import Config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Built-in rules, used when no rules file is configured. Rules that share a
+# group are exclusive: only the first matching rule in a group fires.
+DEFAULT_ALERT_RULES = [
+    {
+        'type': 'heat_wave', 'field': 'temperature', 'op': '>', 'threshold': 35,
+        'severity': 'high', 'group': 'temperature',
+        'message': 'High temperature alert: {value:.1f}°C. Increase irrigation frequency.',
+        'recommendation': 'Water crops early morning or late evening to prevent heat stress.'
+    },
+    {
+        'type': 'frost', 'field': 'temperature', 'op': '<', 'threshold': 5,
+        'severity': 'high', 'group': 'temperature',
+        'message': 'Frost warning: {value:.1f}°C. Protect tender crops.',
+        'recommendation': 'Cover crops with protective sheets or use irrigation to prevent frost damage.'
+    },
+    {
+        'type': 'high_humidity', 'field': 'humidity', 'op': '>', 'threshold': 80,
+        'severity': 'medium', 'group': 'humidity',
+        'message': 'High humidity: {value}%. Watch for fungal diseases.',
+        'recommendation': 'Apply preventive fungicide and ensure proper ventilation.'
+    },
+    {
+        'type': 'low_humidity', 'field': 'humidity', 'op': '<', 'threshold': 30,
+        'severity': 'medium', 'group': 'humidity',
+        'message': 'Low humidity: {value}%. Increase irrigation.',
+        'recommendation': 'Water crops more frequently to maintain soil moisture.'
+    },
+    {
+        'type': 'strong_wind', 'field': 'wind_speed', 'op': '>', 'threshold': 15,
+        'severity': 'medium',
+        'message': 'Strong winds: {value:.1f} m/s. Secure farm equipment.',
+        'recommendation': 'Tie down loose equipment and check for wind damage.'
+    },
+    {
+        'type': 'heavy_rain', 'field': 'rainfall', 'op': '>', 'threshold': 10, 'default': 0,
+        'severity': 'high',
+        'message': 'Heavy rainfall: {value:.1f}mm. Check drainage.',
+        'recommendation': 'Ensure proper drainage and cover harvested crops.'
+    }
+]
+
+OPERATORS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal
+}
+
+def current_season(date=None):
+    """Punjab cropping season for a date: kharif, rabi or zaid"""
+    month = (date or datetime.now()).month
+    if 6 <= month <= 10:
+        return 'kharif'
+    if month in (4, 5):
+        return 'zaid'
+    return 'rabi'
+
+class AlertRuleEngine:
+    def __init__(self, rules=None, overrides=None, rules_path=None, check_interval=5.0):
+        """Evaluate alert rules for many districts at once
+
+        overrides has the shape {'districts': {name: {rule_type: {...}}},
+        'seasons': {season: {rule_type: {...}}}}; district overrides take
+        precedence over season overrides, which take precedence over the
+        rule itself.
+        """
+        self.rules_path = rules_path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._last_check = None
+        self._mtime_ns = None
+        self._set_rules(rules or DEFAULT_ALERT_RULES, overrides or {})
+
+    def _set_rules(self, rules, overrides):
+        """Validate and install a rule table"""
+        for rule in rules:
+            if rule['op'] not in OPERATORS:
+                raise ValueError(f"Unknown operator in alert rule {rule['type']}: {rule['op']}")
+        district_overrides = {
+            district.strip().lower(): rule_overrides
+            for district, rule_overrides in overrides.get('districts', {}).items()
+        }
+        # Swapped as one tuple so evaluation never mixes two rule tables
+        self._table = (list(rules), district_overrides, overrides.get('seasons', {}))
+
+    def _refresh(self):
+        """Reload the rules file if it changed on disk"""
+        if not self.rules_path:
+            return
+        now = time.monotonic()
+        if self._last_check is not None and now - self._last_check < self.check_interval:
+            return
+
+        with self._lock:
+            if self._last_check is not None and now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+            try:
+                if not os.path.exists(self.rules_path):
+                    return
+                mtime_ns = os.stat(self.rules_path).st_mtime_ns
+                if mtime_ns == self._mtime_ns:
+                    return
+                with open(self.rules_path, 'r') as f:
+                    config = json.load(f)
+                self._set_rules(config.get('rules') or DEFAULT_ALERT_RULES, config.get('overrides', {}))
+                self._mtime_ns = mtime_ns
+                logger.info(f"Loaded {len(self._table[0])} alert rules from {self.rules_path}")
+            except Exception as e:
+                # Keep the last good rule table
+                logger.error(f"Error loading alert rules: {str(e)}")
+
+    @property
+    def rules(self):
+        self._refresh()
+        return self._table[0]
+
+    def evaluate(self, weather_records, districts=None, season=None):
+        """Evaluate every rule against every record in one vectorized pass
+
+        Returns one alert list per weather record, in input order.
+        """
+        self._refresh()
+        rules, district_overrides, season_overrides = self._table
+        season_overrides = season_overrides.get(season or current_season(), {})
+
+        n_records = len(weather_records)
+        if districts is None:
+            districts = [record.get('district', '') for record in weather_records]
+        keys = [str(district).strip().lower() for district in districts]
+
+        alerts = [[] for _ in range(n_records)]
+        if n_records == 0:
+            return alerts
+
+        columns = {}
+        claimed = {}
+        for rule in rules:
+            field = rule['field']
+            default = rule.get('default')
+            column_key = (field, default)
+            if column_key not in columns:
+                fill = np.nan if default is None else default
+                columns[column_key] = np.array(
+                    [fill if record.get(field) is None else record[field] for record in weather_records],
+                    dtype=float
+                )
+            values = columns[column_key]
+
+            rule = dict(rule, **season_overrides.get(rule['type'], {}))
+            thresholds = np.full(n_records, float(rule['threshold']))
+            if any(rule['type'] in overrides for overrides in district_overrides.values()):
+                for index, key in enumerate(keys):
+                    override = district_overrides.get(key, {}).get(rule['type'])
+                    if override and 'threshold' in override:
+                        thresholds[index] = override['threshold']
+
+            # NaN (missing value) never matches any comparison
+            with np.errstate(invalid='ignore'):
+                matches = OPERATORS[rule['op']](values, thresholds)
+
+            group = rule.get('group')
+            if group:
+                taken = claimed.setdefault(group, np.zeros(n_records, dtype=bool))
+                matches &= ~taken
+                taken |= matches
+
+            for index in np.flatnonzero(matches):
+                value = weather_records[index].get(field, default)
+                alerts[index].append(self._render(rule, value, district_overrides.get(keys[index], {})))
+
+        return alerts
+
+    def _render(self, rule, value, district_rule_overrides):
+        """Build the alert dict for one matched rule"""
+        rule = dict(rule, **district_rule_overrides.get(rule['type'], {}))
+        return {
+            'type': rule['type'],
+            'severity': rule['severity'],
+            'message': rule['message'].format(value=value),
+            'recommendation': rule.get('recommendation', '')
+        }
+
+# Global alert rule engine instance
+alert_engine = AlertRuleEngine(rules_path=Config.ALERT_RULES_PATH)
+
+def evaluate_alerts(weather_records, districts=None, season=None):
+    """Public interface for alert rule evaluation"""
+    return alert_engine.evaluate(weather_records, districts, season)
@@ -0,0 +1,127 @@
+# api_logger.py - Request timing middleware that writes api_logs in batches
+import time
+import logging
+from datetime import datetime, timezone
+
+from flask import request
+
+from config import Config
+from database.db import db_pool
+from database.write_behind import WriteBehindQueue
+from utils.request_timing import start_request, end_request
+from utils.metrics import histogram
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# WSGI environ key holding the request start time
+STARTED_KEY = 'smartcrop.request_started'
+
+REQUEST_SECONDS = histogram(
+    'smartcrop_http_request_duration_seconds', 'Request latency by endpoint', ['endpoint', 'method', 'status']
+)
+
+class APILogger:
+    def __init__(self, enabled=None, batch_size=None, flush_interval_ms=None, max_queue_size=None, pool=None):
+        """Time every request and insert one api_logs row per request
+
+        The request path only takes timestamps and queues a tuple; rows
+        are formatted and bulk-inserted by a write-behind thread. When the
+        queue is full, records are dropped rather than slowing requests.
+        api_logs comes from database/schema.sql (init_db at startup).
+        """
+        self.pool = pool or db_pool
+        self.enabled = Config.API_LOG_ENABLED if enabled is None else enabled
+        self.queue = WriteBehindQueue(
+            self.write_logs,
+            batch_size=batch_size or Config.API_LOG_FLUSH_ROWS,
+            flush_interval_ms=flush_interval_ms or Config.API_LOG_FLUSH_INTERVAL_MS,
+            max_queue_size=max_queue_size or Config.API_LOG_QUEUE_SIZE,
+            name='api-log-writer',
+            drop_when_full=True
+        )
+
+    def before_request(self):
+        # The app and the blueprint may both be instrumented; time once
+        if not self.enabled:
+            return
+        environ = request.environ
+        if STARTED_KEY not in environ:
+            environ[STARTED_KEY] = time.perf_counter()
+            start_request()
+
+    def after_request(self, response):
+        # Every access through the request proxy costs a context lookup,
+        # so resolve it once
+        current = request._get_current_object()
+        environ = current.environ
+        started = environ.pop(STARTED_KEY, None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        rule = current.url_rule
+        self.record(rule.rule if rule is not None else None, environ.get('PATH_INFO'),
+                    environ.get('REQUEST_METHOD'), response.status_code, elapsed, end_request(),
+                    environ.get('REMOTE_ADDR'), environ.get('HTTP_USER_AGENT'))
+        return response
+
+    def record(self, rule, path, method, status, elapsed, timings, ip_address, user_agent):
+        """Observe one finished request and queue its api_logs row
+
+        Also used by the async handlers, which do not go through Flask.
+        """
+        # Unmatched paths share one label so they cannot blow up the series count
+        REQUEST_SECONDS.observe(elapsed, endpoint=rule if rule is not None else 'unmatched',
+                                method=method, status=status)
+        self.queue.put((
+            rule if rule is not None else path,
+            method,
+            status,
+            elapsed,
+            timings.get('inference'),
+            timings.get('db'),
+            ip_address,
+            user_agent,
+            time.time()
+        ))
+
+    def init_app(self, target):
+        """Instrument a Flask app or blueprint"""
+        target.before_request(self.before_request)
+        target.after_request(self.after_request)
+
+    def write_logs(self, records):
+        """Insert a batch of request records (runs on the writer thread)"""
+        rows = [
+            (
+                endpoint, method, status,
+                round(elapsed * 1000, 3),
+                round(inference * 1000, 3) if inference is not None else None,
+                round(db * 1000, 3) if db is not None else None,
+                ip_address, user_agent,
+                datetime.fromtimestamp(logged_at, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            )
+            for endpoint, method, status, elapsed, inference, db, ip_address, user_agent, logged_at in records
+        ]
+        with self.pool.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO api_logs (endpoint, method, response_status, response_time,
+                                      inference_time, db_time, ip_address, user_agent, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+
+# Global API logger instance
+api_logger = APILogger()
+
+def init_request_logging(target):
+    """Public interface for timing the requests of an app or blueprint"""
+    api_logger.init_app(target)
+
+def record_request(rule, path, method, status, elapsed, timings, ip_address, user_agent):
+    """Public interface for logging a request served outside Flask"""
+    if api_logger.enabled:
+        api_logger.record(rule, path, method, status, elapsed, timings, ip_address, user_agent)
+
+def get_api_log_stats():
+    """Public interface for the api_logs writer counters"""
+    return api_logger.queue.stats()
@@ -0,0 +1,144 @@
+# asgi.py - ASGI entry point with async handlers for the I/O-bound endpoints
+import time
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import wraps
+
+try:
+    from a2wsgi import WSGIMiddleware
+    from starlette.applications import Starlette
+    from starlette.concurrency import run_in_threadpool
+    from starlette.middleware import Middleware
+    from starlette.middleware.cors import CORSMiddleware
+    from starlette.responses import JSONResponse
+    from starlette.routing import Mount, Route
+except ImportError as e:
+    raise ImportError(
+        f"The async serving mode needs the packages in requirements-async.txt ({str(e)})"
+    ) from e
+
+from app import create_app
+from api.endpoints import ALERT_TYPES, queue_alert, queue_bulk_alert, parse_bulk_alert
+from models.hot_swap import start_model_watcher
+from utils.api_logger import record_request
+from utils.async_http import close_async_clients
+from utils.request_timing import start_request, end_request
+from utils.weather_api import get_weather_for_district_async, get_alerts_for_district_async
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def logged(rule, error_message):
+    """Time an async handler into api_logs and the request metrics
+
+    Unhandled errors are logged and answered with error_message, as the
+    Flask handlers do.
+    """
+    def decorate(handler):
+        @wraps(handler)
+        async def wrapper(request):
+            started = time.perf_counter()
+            start_request()
+            try:
+                response = await handler(request)
+            except Exception as e:
+                logger.error(f"{error_message}: {str(e)}")
+                response = JSONResponse({'error': error_message}, status_code=500)
+            record_request(rule, request.url.path, request.method, response.status_code,
+                           time.perf_counter() - started, end_request(),
+                           request.client.host if request.client else None, request.headers.get('user-agent'))
+            return response
+        return wrapper
+    return decorate
+
+async def json_body(request):
+    """Request JSON, or None when the body is not valid JSON"""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+@logged('/api/weather', 'Failed to fetch weather data')
+async def get_weather(request):
+    """Get weather data for a district"""
+    district = request.query_params.get('district')
+    if not district:
+        return JSONResponse({'error': 'District parameter required'}, status_code=400)
+    return JSONResponse(await get_weather_for_district_async(district))
+
+@logged('/api/weather-alerts', 'Failed to fetch weather alerts')
+async def get_weather_alerts(request):
+    """Get weather alerts for a district"""
+    district = request.query_params.get('district')
+    if not district:
+        return JSONResponse({'error': 'District parameter required'}, status_code=400)
+    return JSONResponse(await get_alerts_for_district_async(district))
+
+@logged('/api/send-alert', 'Failed to send alert')
+async def send_alert(request):
+    """Send weather or crop alert to farmer"""
+    data = await json_body(request) or {}
+    phone = data.get('phone')
+    district = data.get('district')
+    alert_type = data.get('type', 'weather')
+
+    if not phone or not district:
+        return JSONResponse({'error': 'Phone and district required'}, status_code=400)
+
+    if alert_type not in ALERT_TYPES:
+        return JSONResponse({'error': 'Invalid alert type'}, status_code=400)
+
+    alerts_data = await get_alerts_for_district_async(district) if alert_type == 'weather' else None
+    # Enqueueing writes to SQLite, which blocks
+    result = await run_in_threadpool(queue_alert, phone, district, alert_type, alerts_data)
+
+    return JSONResponse({
+        'status': 'success',
+        'alert_type': alert_type,
+        'result': result,
+        'timestamp': datetime.now().isoformat()
+    })
+
+@logged('/api/send-alert/bulk', 'Failed to send bulk alert')
+async def send_bulk_alert(request):
+    """Queue one alert for every farmer in a district or a list of phones"""
+    try:
+        district, phones, message = parse_bulk_alert(await json_body(request) or {})
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    alerts_data = None if message else await get_alerts_for_district_async(district)
+    # Enqueueing writes to SQLite, which blocks
+    result = await run_in_threadpool(queue_bulk_alert, district, phones, message, alerts_data)
+
+    return JSONResponse({
+        'status': 'accepted',
+        'district': district,
+        'result': result,
+        'timestamp': datetime.now().isoformat()
+    }, status_code=202)
+
+@asynccontextmanager
+async def lifespan(app):
+    # Each worker process follows model promotions, as under Gunicorn
+    start_model_watcher()
+    yield
+    await close_async_clients()
+
+def create_asgi_app(config_name=None):
+    """ASGI application: async handlers for the upstream-bound endpoints,
+    every other route served by the Flask app from create_app"""
+    routes = [
+        Route('/api/weather', get_weather, methods=['GET']),
+        Route('/api/weather-alerts', get_weather_alerts, methods=['GET']),
+        Route('/api/send-alert', send_alert, methods=['POST']),
+        Route('/api/send-alert/bulk', send_bulk_alert, methods=['POST']),
+        Mount('/', app=WSGIMiddleware(create_app(config_name)))
+    ]
+    # Same policy as flask_cors's defaults; it also answers preflights
+    # for the async routes
+    middleware = [Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])]
+    return Starlette(routes=routes, middleware=middleware, lifespan=lifespan)
+
+app = create_asgi_app()
@@ -0,0 +1,81 @@
+# async_http.py - Pooled async HTTP clients for the ASGI serving mode
+import asyncio
+import logging
+
+from config import Config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class AsyncClientPool:
+    def __init__(self, max_connections=None, timeout=None, name='http'):
+        """One shared aiohttp.ClientSession per event loop
+
+        aiohttp is an optional dependency of the async mode and is only
+        imported when the first session is created. A session is bound to
+        the loop it was created in, so a new one is made when the running
+        loop changes (e.g. a fresh loop per test). Idle connections are
+        kept alive and reused, up to max_connections per pool.
+        """
+        self.max_connections = max_connections or Config.ASYNC_HTTP_MAX_CONNECTIONS
+        self.timeout = timeout or Config.NOTIFICATION_TIMEOUT
+        self.name = name
+        self._session = None
+        self._loop = None
+
+    def session(self):
+        """The session for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._loop is not loop:
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections)
+            )
+            self._loop = loop
+        return self._session
+
+    async def request_json(self, method, url, timeout=None, auth=None, **kwargs):
+        """Send a request and return its JSON body
+
+        Takes the same keyword arguments as the requests-based sync
+        clients (params, data, json, headers, auth as a (user, password)
+        tuple). Raises ConnectionError when the connection fails and
+        aiohttp.ClientResponseError (with .status) for error statuses.
+        """
+        import aiohttp
+
+        if auth is not None:
+            auth = aiohttp.BasicAuth(*auth)
+        try:
+            async with self.session().request(
+                method, url, auth=auth, timeout=aiohttp.ClientTimeout(total=timeout or self.timeout), **kwargs
+            ) as response:
+                response.raise_for_status()
+                return await response.json(content_type=None)
+        except aiohttp.ClientConnectionError as e:
+            # Same type for a dropped connection whichever client is used
+            raise ConnectionError(str(e)) from e
+
+    async def aclose(self):
+        """Close the session of the running loop, if any"""
+        session, self._session, self._loop = self._session, None, None
+        if session is not None:
+            try:
+                await session.close()
+            except Exception as e:
+                logger.error(f"Error closing {self.name} client: {str(e)}")
+
+# Every pool, closed together when the ASGI app shuts down
+_pools = []
+
+def client_pool(name, **kwargs):
+    """Public interface for creating a registered client pool"""
+    pool = AsyncClientPool(name=name, **kwargs)
+    _pools.append(pool)
+    return pool
+
+async def close_async_clients():
+    """Public interface for closing every pooled client"""
+    for pool in _pools:
+        await pool.aclose()
@@ -0,0 +1,264 @@
+# bench_async_load.py - Load comparison of the sync (WSGI) and async (ASGI) serving modes
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+HOST = '127.0.0.1'
+
+# Settings for the servers under test: every weather request goes
+# upstream, sends are not rate limited or de-duplicated
+SERVER_ENV = {
+    'WEATHER_CACHE_TTL': '0',
+    'WEATHER_STALE_TTL': '0',
+    'SMS_RATE_LIMIT': '0',
+    'WHATSAPP_RATE_LIMIT': '0',
+    'ALERT_DEDUP_WINDOW': '0',
+    'MODEL_WATCH_INTERVAL': '0'
+}
+
+def upstream_response(target):
+    """Canned OpenWeather, Twilio or WhatsApp response for a request path"""
+    if target.startswith('/weather'):
+        return {
+            'main': {'temp': 31.5, 'humidity': 58, 'pressure': 1008},
+            'weather': [{'description': 'haze'}],
+            'wind': {'speed': 3.1}
+        }
+    if target.endswith('/Messages.json'):
+        return {'sid': 'SM00000000000000000000000000000000'}
+    return {'messages': [{'id': 'wamid.0000'}]}
+
+async def handle_upstream(reader, writer, latency):
+    """Minimal keep-alive HTTP/1.1 server answering after a fixed delay"""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            target = request_line.decode('latin-1').split(' ')[1]
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            if length:
+                await reader.readexactly(length)
+            await asyncio.sleep(latency)
+            body = json.dumps(upstream_response(target)).encode()
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s'
+                         % (len(body), body))
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def serve_upstream(port, latency):
+    server = await asyncio.start_server(lambda r, w: handle_upstream(r, w, latency), HOST, port, backlog=4096)
+    async with server:
+        await server.serve_forever()
+
+def point_at_upstream(upstream):
+    """Use real (non-demo) credentials against the stub upstream"""
+    from utils.weather_api import weather_api
+    from utils.sms_api import notification_api
+
+    weather_api.api_key = 'bench'
+    weather_api.base_url = upstream
+    notification_api.twilio_sid = 'bench'
+    notification_api.whatsapp_token = 'bench'
+    notification_api.twilio_url = f'{upstream}/Accounts'
+    notification_api.whatsapp_url = f'{upstream}/messages'
+
+def serve_sync(port, threads):
+    """The Flask app on a fixed pool of threads, like Gunicorn's gthread workers"""
+    from werkzeug.serving import BaseWSGIServer
+    from app import app
+
+    class PooledWSGIServer(BaseWSGIServer):
+        request_queue_size = 4096
+
+        def __init__(self):
+            super().__init__(HOST, port, app)
+            self.pool = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.handle, request, client_address)
+
+        def handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    PooledWSGIServer().serve_forever()
+
+def serve_async(port):
+    """The ASGI app on uvicorn's event loop"""
+    import uvicorn
+    from asgi import app
+
+    uvicorn.run(app, host=HOST, port=port, log_level='warning', backlog=4096)
+
+def start(args, env=None, verbose=False):
+    """Run this module with args in a child process"""
+    return subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.bench_async_load', *args],
+        env=dict(os.environ, **(env or {})),
+        stdout=None if verbose else subprocess.DEVNULL,
+        stderr=None if verbose else subprocess.DEVNULL
+    )
+
+async def fetch(session, method, url, **kwargs):
+    """(status, JSON body) of one request"""
+    async with session.request(method, url, **kwargs) as response:
+        return response.status, await response.json(content_type=None)
+
+async def wait_ready(session, url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await fetch(session, 'GET', url))[0] == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start")
+
+def latency_report(latencies, errors, wall_time):
+    latencies = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0, 0, 0)
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / wall_time, 1),
+        'p50_ms': round(float(p50), 1),
+        'p95_ms': round(float(p95), 1),
+        'p99_ms': round(float(p99), 1),
+        'wall_time_s': round(wall_time, 2)
+    }
+
+async def run_load(requests, concurrency, make_request):
+    """Issue requests with concurrency in flight; make_request(i) returns (status, body)"""
+    latencies, errors = [], 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                ok = (await make_request(i))[0] == 200
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+    return latencies, errors, time.perf_counter() - started
+
+async def measure_mode(base_url, args):
+    """Weather and bulk-send load against one running server"""
+    import aiohttp
+
+    # No keep-alive, so neither mode gains from connection reuse
+    connector = aiohttp.TCPConnector(limit=args.concurrency, force_close=True)
+    timeout = aiohttp.ClientTimeout(total=300)
+    async with aiohttp.ClientSession(base_url, connector=connector, timeout=timeout) as session:
+        await wait_ready(session, '/api/health')
+
+        # Warm up imports and pools before timing
+        await run_load(20, 10, lambda i: fetch(session, 'GET', '/api/weather', params={'district': f'warmup{i}'}))
+
+        latencies, errors, wall_time = await run_load(
+            args.requests, args.concurrency,
+            lambda i: fetch(session, 'GET', '/api/weather', params={'district': f'bench{i}'})
+        )
+        weather = latency_report(latencies, errors, wall_time)
+
+        phones = [f'9198{i:08d}' for i in range(args.bulk_phones)]
+        queued = []
+
+        async def bulk(i):
+            status, body = await fetch(session, 'POST', '/api/send-alert/bulk',
+                                       json={'district': 'Bench', 'phones': phones, 'message': f'Load test {i}'})
+            if status == 202:
+                queued.append(body['result']['queued'])
+                status = 200
+            return status, body
+
+        latencies, errors, wall_time = await run_load(args.bulk_requests, args.bulk_concurrency, bulk)
+        bulk_report = latency_report(latencies, errors, wall_time)
+        bulk_report['queued_per_second'] = round(sum(queued) / wall_time, 1)
+    return {'weather': weather, 'bulk_send': bulk_report}
+
+def run_benchmark(args):
+    """Start the stub upstream, then each server mode in turn, and load them"""
+    upstream = f'http://{HOST}:{args.upstream_port}'
+    stub = start(['--stub', str(args.upstream_port), '--latency-ms', str(args.latency_ms)])
+    report = {
+        'upstream_latency_ms': args.latency_ms,
+        'concurrency': args.concurrency,
+        'sync_threads': args.threads,
+        'bulk_phones': args.bulk_phones
+    }
+    try:
+        for mode in args.modes:
+            server = start(['--serve', mode, '--port', str(args.port), '--upstream', upstream,
+                            '--threads', str(args.threads)], env=SERVER_ENV, verbose=args.verbose)
+            try:
+                report[mode] = asyncio.run(measure_mode(f'http://{HOST}:{args.port}', args))
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        stub.terminate()
+        stub.wait()
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare sync and async serving against slow local upstreams')
+    parser.add_argument('--modes', nargs='+', default=['sync', 'async'], choices=['sync', 'async'])
+    parser.add_argument('--requests', type=int, default=2000, help='Weather requests per mode')
+    parser.add_argument('--concurrency', type=int, default=200, help='Weather requests in flight')
+    parser.add_argument('--threads', type=int, default=32, help='Request threads of the sync server')
+    parser.add_argument('--latency-ms', type=float, default=100, help='Delay of every upstream response')
+    parser.add_argument('--bulk-requests', type=int, default=4)
+    parser.add_argument('--bulk-concurrency', type=int, default=2)
+    parser.add_argument('--bulk-phones', type=int, default=500, help='Recipients per bulk alert')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--upstream-port', type=int, default=5056)
+    parser.add_argument('--verbose', action='store_true', help='Show the servers\' output')
+    # Child process roles
+    parser.add_argument('--stub', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--serve', choices=['sync', 'async'], help=argparse.SUPPRESS)
+    parser.add_argument('--upstream', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stub:
+        asyncio.run(serve_upstream(args.stub, args.latency_ms / 1000))
+    elif args.serve:
+        point_at_upstream(args.upstream)
+        if args.serve == 'sync':
+            serve_sync(args.port, args.threads)
+        else:
+            serve_async(args.port)
+    else:
+        # Children resolve 'app' and 'benchmarks' from the project root
+        os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        print(json.dumps(run_benchmark(args), indent=2))
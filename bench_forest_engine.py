@@ -0,0 +1,65 @@
+# bench_forest_engine.py - sklearn vs flat-array forest inference latency
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import joblib
+import numpy as np
+
+from config import Config
+from models.forest_engine import export_forest, load_forest
+
+def load_or_train_model(n_trees=100):
+    """The trained crop model, or a synthetic forest of similar shape"""
+    if os.path.exists(Config.MODEL_PATH):
+        return joblib.load(Config.MODEL_PATH)
+
+    from sklearn.ensemble import RandomForestClassifier
+    rng = np.random.default_rng(42)
+    X = rng.normal(size=(5000, 8))
+    y = rng.choice(['Wheat', 'Rice', 'Maize', 'Cotton', 'Bajra'], size=len(X))
+    return RandomForestClassifier(n_estimators=n_trees, random_state=42).fit(X, y)
+
+def time_call(fn, X, repeats):
+    """Median latency of fn(X) in milliseconds"""
+    fn(X)  # warm up
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn(X)
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(float(np.median(timings)), 3)
+
+def run_benchmark(batch_sizes=(1, 1000), repeats=50, n_trees=100):
+    """Compare latency and check both engines give the same probabilities"""
+    model = load_or_train_model(n_trees)
+    rng = np.random.default_rng(0)
+    report = {'trees': len(model.estimators_), 'results': []}
+
+    with tempfile.TemporaryDirectory() as directory:
+        export_forest(model, directory)
+        forest = load_forest(directory)
+
+        for batch_size in batch_sizes:
+            X = rng.normal(size=(batch_size, model.n_features_in_))
+            sklearn_ms = time_call(model.predict_proba, X, repeats)
+            flat_ms = time_call(forest.predict_proba, X, repeats)
+            report['results'].append({
+                'rows': batch_size,
+                'sklearn_ms': sklearn_ms,
+                'flat_ms': flat_ms,
+                'speedup': round(sklearn_ms / flat_ms, 2),
+                'max_abs_diff': float(np.abs(model.predict_proba(X) - forest.predict_proba(X)).max())
+            })
+
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the flat-array forest engine')
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--trees', type=int, default=100)
+    args = parser.parse_args()
+
+    print(json.dumps(run_benchmark(repeats=args.repeats, n_trees=args.trees), indent=2))
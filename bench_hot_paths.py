@@ -0,0 +1,170 @@
+# bench_hot_paths.py - Latency and allocation benchmarks for the request hot paths
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from flask import Flask
+
+from api.endpoints import api_bp
+from models.predict import get_predictor
+from utils.message_templates import MessageRenderer, weather_alert_payload, crop_alert_payload
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Metrics checked against the baseline; p99 is reported but too noisy to gate on
+GATED_METRICS = ['p50_ms', 'p95_ms', 'alloc_peak_kb']
+# Differences smaller than this never count as a regression
+MIN_DELTA = {'p50_ms': 0.02, 'p95_ms': 0.05, 'alloc_peak_kb': 1.0}
+
+SOIL = {'nitrogen': 25, 'phosphorus': 18, 'potassium': 220, 'ph': 7.2}
+ALERT_DATA = {
+    'temperature': 41, 'humidity': 82,
+    'alerts': [{'message': 'Heat wave expected', 'recommendation': 'Irrigate in the evening'}]
+}
+CROP_DATA = {
+    'crop': 'Wheat', 'confidence': 0.87,
+    'fertilizer_gap': {'nitrogen_gap': 95, 'phosphorus_gap': 42, 'potassium_gap': 0}
+}
+
+def build_cases():
+    """Benchmark name -> zero-argument callable"""
+    app = Flask(__name__)
+    app.register_blueprint(api_bp)
+    client = app.test_client()
+    predictor = get_predictor()
+    predictor.ensure_loaded()
+    # A TTL of 0 makes every render a cache miss, so the builders do real work
+    renderer = MessageRenderer(ttl=0)
+
+    return {
+        'api.recommend': lambda: client.post('/api/recommend', json=dict(SOIL, district='Patiala', last_crop='Rice')),
+        'api.market_prices': lambda: client.get('/api/market-prices?district=Patiala'),
+        'api.weather_alerts': lambda: client.get('/api/weather-alerts?district=Patiala'),
+        'predict.predict_crop': lambda: predictor.predict_crop(
+            SOIL['nitrogen'], SOIL['phosphorus'], SOIL['potassium'], SOIL['ph'], 'Patiala', 'alluvial', 'Rice'
+        ),
+        'predict.fertilizer': lambda: predictor.get_fertilizer_recommendation(
+            SOIL['nitrogen'], SOIL['phosphorus'], SOIL['potassium'], 'Wheat'
+        ),
+        'messages.weather_alert': lambda: renderer.render(weather_alert_payload('Patiala', ALERT_DATA)),
+        'messages.crop_alert': lambda: renderer.render(crop_alert_payload('Patiala', CROP_DATA))
+    }
+
+def measure(fn, repeats, warmup, alloc_repeats):
+    """Latency percentiles and per-call allocation peak of fn"""
+    for _ in range(warmup):
+        fn()
+
+    timings = np.empty(repeats)
+    for i in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings[i] = time.perf_counter() - started
+    timings *= 1000
+
+    # Allocations are traced in a separate pass; tracing slows every call
+    tracemalloc.start()
+    peaks = []
+    try:
+        for _ in range(alloc_repeats):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            fn()
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    return {
+        'p50_ms': round(float(p50), 4),
+        'p95_ms': round(float(p95), 4),
+        'p99_ms': round(float(p99), 4),
+        'mean_ms': round(float(timings.mean()), 4),
+        'alloc_peak_kb': round(float(np.median(peaks)) / 1024, 2)
+    }
+
+def environment():
+    predictor = get_predictor()
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'model': type(predictor.model).__name__ if predictor.model is not None else None,
+        'model_version': predictor.model_version
+    }
+
+def run_benchmarks(names=None, repeats=300, warmup=30, alloc_repeats=30):
+    """Run the selected benchmarks (default: all) and return a report"""
+    cases = build_cases()
+    unknown = set(names or []) - set(cases)
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for name, fn in cases.items():
+        if not names or name in names:
+            results[name] = measure(fn, repeats, warmup, alloc_repeats)
+    return {'environment': environment(), 'repeats': repeats, 'results': results}
+
+def compare_to_baseline(report, baseline, threshold):
+    """Regressions of report against baseline
+
+    A gated metric regresses when it is more than threshold (a fraction)
+    above its baseline and by more than its MIN_DELTA.
+    """
+    regressions = []
+    for name, result in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None:
+            continue
+        for metric in GATED_METRICS:
+            old, new = previous.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + threshold) and new - old > MIN_DELTA[metric]:
+                regressions.append({
+                    'benchmark': name,
+                    'metric': metric,
+                    'baseline': old,
+                    'current': new,
+                    'change': round(new / old - 1, 3) if old else None
+                })
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the API hot paths against a stored baseline')
+    parser.add_argument('names', nargs='*', help='Benchmarks to run (default: all)')
+    parser.add_argument('--repeats', type=int, default=300)
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='Store this run as the new baseline')
+    parser.add_argument('--threshold', type=float, default=float(os.environ.get('BENCH_REGRESSION_THRESHOLD', 0.25)),
+                        help='Allowed slowdown as a fraction of the baseline (default 0.25)')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.names, repeats=args.repeats)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(json.dumps(report, indent=2))
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(json.dumps(report, indent=2))
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one", file=sys.stderr)
+        sys.exit(0)
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    if baseline.get('environment') != report['environment']:
+        print("Warning: baseline was recorded in a different environment", file=sys.stderr)
+
+    report['threshold'] = args.threshold
+    report['regressions'] = compare_to_baseline(report, baseline, args.threshold)
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report['regressions'] else 0)
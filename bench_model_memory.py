@@ -0,0 +1,79 @@
+# bench_model_memory.py - Per-worker memory with and without a preloaded model
+import argparse
+import json
+import multiprocessing
+import time
+
+import numpy as np
+
+from models.predict import get_predictor, preload_models
+
+def memory_usage():
+    """RSS and PSS of the current process in MB (Linux /proc only)
+
+    PSS divides every shared page between the processes mapping it, so
+    summing it over workers gives their real combined footprint.
+    """
+    usage = {}
+    with open('/proc/self/smaps_rollup', 'r') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('Rss', 'Pss'):
+                usage[key.lower() + '_mb'] = round(int(value.split()[0]) / 1024, 1)
+    return usage
+
+def _use_model(predictor):
+    """Run one prediction through every tree so all model pages are touched"""
+    predictor.ensure_loaded()
+    if predictor.model is not None:
+        predictor.model.predict_proba(np.zeros((1, predictor.model.n_features_in_)))
+    predictor.predict_crop(25, 18, 220, 7.2, 'patiala', 'alluvial', 'wheat')
+
+def _worker(ready, done, results):
+    predictor = get_predictor()
+    started = time.perf_counter()
+    _use_model(predictor)
+    load_ms = (time.perf_counter() - started) * 1000
+    # Measure while every worker is alive so shared pages are split fairly
+    ready.wait()
+    results.put(dict(memory_usage(), first_request_ms=round(load_ms, 1)))
+    done.wait()
+
+def run_workers(workers):
+    """Fork workers from this process and collect their memory reports"""
+    context = multiprocessing.get_context('fork')
+    ready = context.Barrier(workers)
+    done = context.Barrier(workers + 1)
+    results = context.Queue()
+    processes = [context.Process(target=_worker, args=(ready, done, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    done.wait()
+    for process in processes:
+        process.join()
+    return {
+        'workers': workers,
+        'rss_mb_per_worker': round(sum(r['rss_mb'] for r in reports) / workers, 1),
+        'pss_mb_per_worker': round(sum(r['pss_mb'] for r in reports) / workers, 1),
+        'pss_mb_total': round(sum(r['pss_mb'] for r in reports), 1),
+        'first_request_ms': round(max(r['first_request_ms'] for r in reports), 1)
+    }
+
+def run_benchmark(workers=4):
+    """Compare lazy per-worker loading with a model preloaded before fork"""
+    report = {'mmap_mode': get_predictor().mmap_mode, 'master_before_mb': memory_usage()}
+    # Lazy: the master never loads the model, each worker loads its own copy
+    report['lazy'] = run_workers(workers)
+    # Preloaded: load once in the master, then fork (gunicorn --preload)
+    preload_models()
+    report['master_after_mb'] = memory_usage()
+    report['preloaded'] = run_workers(workers)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Report model memory per worker process')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    print(json.dumps(run_benchmark(args.workers), indent=2))
@@ -0,0 +1,108 @@
+# bench_startup.py - Cold start benchmark: app import and first-request latency
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# Modules that should only be imported once a request needs them
+HEAVY_MODULES = ['pandas', 'sklearn', 'scipy', 'joblib']
+
+SOIL = {'district': 'Patiala', 'nitrogen': 25, 'phosphorus': 18, 'potassium': 220, 'ph': 7.2, 'last_crop': 'Rice'}
+
+# Requests run in this order by a fresh process, each once cold and once warm
+FIRST_REQUESTS = [
+    ('health', lambda client: client.get('/api/health')),
+    ('recommend', lambda client: client.post('/api/recommend', json=SOIL)),
+    ('market_prices', lambda client: client.get('/api/market-prices?district=Patiala')),
+    ('weather_alerts', lambda client: client.get('/api/weather-alerts?district=Patiala'))
+]
+
+def child():
+    """Measure this fresh interpreter's startup and print it as JSON"""
+    started = time.perf_counter()
+    from app import app
+    import_ms = (time.perf_counter() - started) * 1000
+    loaded_at_import = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    client = app.test_client()
+    report = {'import_ms': import_ms, 'first_request_ms': {}, 'warm_request_ms': {}}
+    for phase in ('first_request_ms', 'warm_request_ms'):
+        for name, call in FIRST_REQUESTS:
+            started = time.perf_counter()
+            response = call(client)
+            report[phase][name] = (time.perf_counter() - started) * 1000
+            if response.status_code >= 500:
+                raise RuntimeError(f"{name} returned {response.status_code}")
+    report['heavy_modules_at_import'] = loaded_at_import
+    print(json.dumps(report))
+
+def run_child(extra_args=()):
+    """One cold start in a new interpreter; returns its report and stderr"""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, *extra_args, '-m', 'benchmarks.bench_startup', '--child'],
+        capture_output=True, text=True, check=True
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report['process_ms'] = (time.perf_counter() - started) * 1000
+    return report, result.stderr
+
+def slowest_imports(limit):
+    """Top-level imports of a cold start by cumulative time (python -X importtime)"""
+    _, stderr = run_child(['-X', 'importtime'])
+    imports, pending = [], []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        # Children are reported before their parent; keep the direct
+        # imports of the app module
+        if depth == 1:
+            pending.append({'module': name.strip(), 'cumulative_ms': round(int(cumulative) / 1000, 1)})
+        elif depth == 0:
+            if name.strip() == 'app':
+                imports = pending
+            pending = []
+    return sorted(imports, key=lambda item: item['cumulative_ms'], reverse=True)[:limit]
+
+def median(values):
+    return round(float(np.median(values)), 2)
+
+def run_benchmark(repeats=5, imports=10):
+    """Median cold start over repeats fresh processes"""
+    reports = [run_child()[0] for _ in range(repeats)]
+    summary = {
+        'repeats': repeats,
+        'process_ms': median([r['process_ms'] for r in reports]),
+        'import_ms': median([r['import_ms'] for r in reports]),
+        'first_request_ms': {
+            name: median([r['first_request_ms'][name] for r in reports]) for name, _ in FIRST_REQUESTS
+        },
+        'warm_request_ms': {
+            name: median([r['warm_request_ms'][name] for r in reports]) for name, _ in FIRST_REQUESTS
+        },
+        'heavy_modules_at_import': reports[0]['heavy_modules_at_import']
+    }
+    summary['time_to_first_response_ms'] = round(summary['import_ms'] + summary['first_request_ms']['health'], 2)
+    if imports:
+        summary['slowest_imports'] = slowest_imports(imports)
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure cold start: app import and first-request latency')
+    parser.add_argument('--repeats', type=int, default=5, help='Fresh processes to start (default 5)')
+    parser.add_argument('--imports', type=int, default=10, help='Slowest imports to list, 0 to skip')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        sys.exit(0)
+    # Children resolve 'app' and 'benchmarks' from the project root
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    print(json.dumps(run_benchmark(args.repeats, args.imports), indent=2))
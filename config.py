@@ -10,20 +10,121 @@ class Config:
     DATABASE_URL = os.environ.get('DATABASE_URL') or 'sqlite:///datasets/smartcrop.db'
     DEBUG = os.environ.get('DEBUG', 'False').lower() == 'true'
     
+    # SQLite connection pool
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+    DB_BUSY_TIMEOUT = int(os.environ.get('DB_BUSY_TIMEOUT', 5000))  # milliseconds
+    DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 16384))
+    
+    # Write-behind batching for recommendation history
+    HISTORY_FLUSH_ROWS = int(os.environ.get('HISTORY_FLUSH_ROWS', 200))
+    HISTORY_FLUSH_INTERVAL_MS = int(os.environ.get('HISTORY_FLUSH_INTERVAL_MS', 250))
+    HISTORY_QUEUE_SIZE = int(os.environ.get('HISTORY_QUEUE_SIZE', 10000))
+    
+    # Request timing logged to api_logs in batches
+    API_LOG_ENABLED = os.environ.get('API_LOG_ENABLED', 'true').lower() == 'true'
+    API_LOG_FLUSH_ROWS = int(os.environ.get('API_LOG_FLUSH_ROWS', 500))
+    API_LOG_FLUSH_INTERVAL_MS = int(os.environ.get('API_LOG_FLUSH_INTERVAL_MS', 1000))
+    API_LOG_QUEUE_SIZE = int(os.environ.get('API_LOG_QUEUE_SIZE', 20000))  # excess records are dropped
+    
+    # Metrics; each worker writes its own file to METRICS_DIR so any worker
+    # can report the totals (unset: this process only; gunicorn.conf.py sets it)
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))  # seconds
+    
+    # Request profiling; admins send X-Profile: 1, or a share of traffic is sampled
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', 'logs/profiles')
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0.0))  # fraction of requests
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 200))  # older profiles are deleted
+    PROFILE_AGGREGATE_RECENT = int(os.environ.get('PROFILE_AGGREGATE_RECENT', 50))
+    
     # API Keys
     OPENWEATHER_API_KEY = os.environ.get('OPENWEATHER_API_KEY')
     TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
     TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
     WHATSAPP_TOKEN = os.environ.get('WHATSAPP_TOKEN')
     
+    # Weather cache
+    WEATHER_CACHE_TTL = int(os.environ.get('WEATHER_CACHE_TTL', 600))  # seconds
+    WEATHER_STALE_TTL = int(os.environ.get('WEATHER_STALE_TTL', 3600))  # seconds
+    WEATHER_CACHE_ENTRIES = int(os.environ.get('WEATHER_CACHE_ENTRIES', 256))  # districts kept
+    WEATHER_HTTP_POOL_SIZE = int(os.environ.get('WEATHER_HTTP_POOL_SIZE', 20))
+    WEATHER_PREFETCH_CONCURRENCY = int(os.environ.get('WEATHER_PREFETCH_CONCURRENCY', 10))
+    WEATHER_PREFETCH_TIMEOUT = float(os.environ.get('WEATHER_PREFETCH_TIMEOUT', 5))  # seconds
+    ALERT_RULES_PATH = os.environ.get('ALERT_RULES_PATH') or 'datasets/alert_rules.json'
+    
+    # Notification delivery
+    NOTIFICATION_WORKERS = int(os.environ.get('NOTIFICATION_WORKERS', 32))
+    NOTIFICATION_TIMEOUT = float(os.environ.get('NOTIFICATION_TIMEOUT', 10))  # seconds
+    NOTIFICATION_MAX_RETRIES = int(os.environ.get('NOTIFICATION_MAX_RETRIES', 3))
+    NOTIFICATION_BACKOFF_BASE = float(os.environ.get('NOTIFICATION_BACKOFF_BASE', 0.5))  # seconds
+    SMS_RATE_LIMIT = float(os.environ.get('SMS_RATE_LIMIT', 100))  # messages per second
+    WHATSAPP_RATE_LIMIT = float(os.environ.get('WHATSAPP_RATE_LIMIT', 80))  # messages per second
+    TWILIO_API_URL = os.environ.get('TWILIO_API_URL', 'https://api.twilio.com/2010-04-01/Accounts')
+    WHATSAPP_API_URL = os.environ.get('WHATSAPP_API_URL', 'https://graph.facebook.com/v17.0/YOUR_PHONE_NUMBER_ID/messages')
+    MESSAGE_TEMPLATE_TTL = int(os.environ.get('MESSAGE_TEMPLATE_TTL', 300))  # seconds
+    ALERT_DEDUP_WINDOW = int(os.environ.get('ALERT_DEDUP_WINDOW', 3600))  # seconds
+    
+    # Async serving mode (asgi.py): one pooled client per upstream
+    ASYNC_HTTP_MAX_CONNECTIONS = int(os.environ.get('ASYNC_HTTP_MAX_CONNECTIONS', 1000))
+    ASYNC_NOTIFICATION_CONCURRENCY = int(os.environ.get('ASYNC_NOTIFICATION_CONCURRENCY', 500))  # sends in flight
+    
+    # Alert outbox
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 100))
+    OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', 2))  # seconds
+    OUTBOX_LEASE_SECONDS = int(os.environ.get('OUTBOX_LEASE_SECONDS', 120))
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 5))
+    # create_app starts the worker; gunicorn.conf.py turns this off and
+    # starts one per worker after the fork instead
+    OUTBOX_AUTOSTART = os.environ.get('OUTBOX_AUTOSTART', 'true').lower() == 'true'
+    
     # Model paths
     MODEL_PATH = 'models/crop_recommendation_model.pkl'
     SCALER_PATH = 'models/feature_scaler.pkl'
+    ENCODER_PATH = 'models/label_encoder.pkl'
+    FEATURE_PIPELINE_PATH = 'models/feature_pipeline.json'  # replaces scaler + encoder
+    FOREST_PATH = 'models/crop_forest'  # flat node arrays exported by train_model.py
+    # Batches of more rows are scored by the pickled sklearn model, which is
+    # faster than the flat forest on large batches
+    FLAT_FOREST_MAX_BATCH = int(os.environ.get('FLAT_FOREST_MAX_BATCH', 200))
+    # A promoted registry version overrides the model paths above
+    MODEL_REGISTRY_PATH = os.environ.get('MODEL_REGISTRY_PATH') or 'models/registry'
+    
+    # Model hot swap and shadow evaluation
+    MODEL_WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', 5))  # seconds, 0 disables
+    SHADOW_SAMPLE_RATE = float(os.environ.get('SHADOW_SAMPLE_RATE', 0.1))  # fraction of /recommend
+    SHADOW_MAX_PENDING = int(os.environ.get('SHADOW_MAX_PENDING', 100))  # excess samples are dropped
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')  # unset: admin endpoints are localhost-only
+    
+    # Prediction cache
+    PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 10000))  # 0 disables
+    PREDICTION_CACHE_TTL = int(os.environ.get('PREDICTION_CACHE_TTL', 0))  # seconds, 0 = no expiry
+    PREDICTION_NPK_STEP = float(os.environ.get('PREDICTION_NPK_STEP', 1))  # kg/ha
+    PREDICTION_PH_STEP = float(os.environ.get('PREDICTION_PH_STEP', 0.1))
+    MODEL_MMAP_MODE = os.environ.get('MODEL_MMAP_MODE', 'r') or None  # '' loads private copies
     
     # Data paths
     SOIL_DATA_PATH = 'datasets/soil_data.csv'
     MARKET_DATA_PATH = 'datasets/market_prices.csv'
     TRAINING_DATA_PATH = 'datasets/training_data.csv'
+    TRAINING_CACHE_PATH = 'datasets/training_cache'
+    
+    # Reference data responses (districts, soil data, market prices), served
+    # with ETags and rebuilt when the data reloads
+    REFERENCE_CACHE_MAX_AGE = int(os.environ.get('REFERENCE_CACHE_MAX_AGE', 300))  # seconds
+    REFERENCE_CACHE_ENTRIES = int(os.environ.get('REFERENCE_CACHE_ENTRIES', 1024))
+    
+    # Incremental retraining. Each recommendation is read once, when it is
+    # RETRAIN_SETTLE_DAYS old; one whose feedback or yield is recorded later
+    # is skipped for good, so every run only scans recommendations it has
+    # not seen
+    RETRAIN_CHUNK_ROWS = int(os.environ.get('RETRAIN_CHUNK_ROWS', 5000))
+    RETRAIN_MIN_NEW_ROWS = int(os.environ.get('RETRAIN_MIN_NEW_ROWS', 500))
+    RETRAIN_MAX_ROWS = int(os.environ.get('RETRAIN_MAX_ROWS', 200000))  # newest rows used per training run
+    RETRAIN_SETTLE_DAYS = int(os.environ.get('RETRAIN_SETTLE_DAYS', 120))  # wait for feedback and yields
+    RETRAIN_AUTO_PROMOTE = os.environ.get('RETRAIN_AUTO_PROMOTE', 'false').lower() == 'true'
+    
+    # Batch recommendation limits
+    MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 5000))
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -0,0 +1,165 @@
+# db.py - Pooled SQLite access layer shared by all handlers
+import os
+import queue
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+from config import Config
+from utils.request_timing import timed
+from utils.metrics import histogram
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DB_QUERY_SECONDS = histogram('smartcrop_db_query_duration_seconds', 'Time a pooled connection is held per query block')
+
+def database_path(database_url=None):
+    """Turn a sqlite:/// URL from config into a filesystem path"""
+    url = database_url or Config.DATABASE_URL
+    if url.startswith('sqlite:///'):
+        return url[len('sqlite:///'):]
+    return url
+
+class ConnectionPool:
+    def __init__(self, db_path=None, pool_size=None, busy_timeout=None,
+                 cache_size_kb=None, cached_statements=256):
+        self.db_path = db_path or database_path()
+        self.pool_size = pool_size or Config.DB_POOL_SIZE
+        self.busy_timeout = busy_timeout or Config.DB_BUSY_TIMEOUT
+        self.cache_size_kb = cache_size_kb or Config.DB_CACHE_SIZE_KB
+        # sqlite3 keeps a per-connection cache of prepared statements; since
+        # pooled connections live for the whole process the cache stays warm
+        self.cached_statements = cached_statements
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        """Drop all pooled connections (used after a fork)"""
+        self._pool = queue.LifoQueue(maxsize=self.pool_size)
+        self._created = 0
+        self._pid = os.getpid()
+
+    def _connect(self):
+        """Open a connection with the pool's pragmas applied"""
+        in_memory = self.db_path == ':memory:'
+        # A shared-cache URI keeps every pooled connection on the same
+        # in-memory database instead of one private database each
+        target = 'file:smartcrop?mode=memory&cache=shared' if in_memory else self.db_path
+
+        conn = sqlite3.connect(
+            target,
+            timeout=self.busy_timeout / 1000,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            uri=in_memory
+        )
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout)}')
+        if not in_memory:
+            conn.execute('PRAGMA journal_mode = WAL')
+        # NORMAL is durable across application crashes in WAL mode and
+        # only syncs at checkpoints instead of on every commit
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_size_kb)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    def acquire(self):
+        """Take a connection from the pool, opening one if needed"""
+        with self._lock:
+            # Connections must never cross a fork (e.g. gunicorn --preload)
+            if self._pid != os.getpid():
+                self._reset()
+
+            try:
+                return self._pool.get_nowait()
+            except queue.Empty:
+                pass
+
+            if self._created < self.pool_size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        try:
+            return self._pool.get(timeout=self.busy_timeout / 1000)
+        except queue.Empty:
+            raise sqlite3.OperationalError('Database connection pool exhausted')
+
+    def release(self, conn):
+        """Return a connection to the pool"""
+        if self._pid != os.getpid():
+            return
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._pool.put_nowait(conn)
+        except Exception as e:
+            logger.error(f"Discarding database connection: {str(e)}")
+            with self._lock:
+                self._created -= 1
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection for the duration of a block
+
+        The time the connection is held counts as the current request's
+        database time.
+        """
+        started = time.perf_counter()
+        with timed('db'):
+            conn = self.acquire()
+            try:
+                yield conn
+            finally:
+                self.release(conn)
+                DB_QUERY_SECONDS.observe(time.perf_counter() - started)
+
+    @contextmanager
+    def transaction(self):
+        """Borrow a connection and commit on success, roll back on error"""
+        with self.connection() as conn:
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def close_all(self):
+        """Close every idle pooled connection"""
+        with self._lock:
+            while True:
+                try:
+                    self._pool.get_nowait().close()
+                    self._created -= 1
+                except queue.Empty:
+                    break
+
+# Global connection pool instance
+db_pool = ConnectionPool()
+
+def get_connection():
+    """Public interface for borrowing a pooled connection"""
+    return db_pool.connection()
+
+def transaction():
+    """Public interface for a pooled connection wrapped in a transaction"""
+    return db_pool.transaction()
+
+def fetchone(sql, params=()):
+    """Run a query and return the first row"""
+    with db_pool.connection() as conn:
+        return conn.execute(sql, params).fetchone()
+
+def fetchall(sql, params=()):
+    """Run a query and return all rows"""
+    with db_pool.connection() as conn:
+        return conn.execute(sql, params).fetchall()
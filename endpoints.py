@@ -1,19 +1,42 @@
 # endpoints.py - API endpoints for SmartCrop Advisory System
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, send_file
 import logging
+import time
 from datetime import datetime
 import sqlite3
-import pandas as pd
 
-from models.predict import get_crop_recommendation, get_fertilizer_recommendation
+from config import Config
+from database.db import transaction
+from database.write_behind import WriteBehindQueue
+from models.predict import (
+    get_crop_recommendation, get_fertilizer_recommendation,
+    get_crop_recommendations_batch, get_fertilizer_recommendations_batch,
+    get_prediction_cache_stats
+)
+from models.hot_swap import shadow_recommendation, start_shadow, stop_shadow, swap_model, get_model_status
+from utils.soil_registry import get_district_soil, get_all_districts, get_soil_data_version, normalize_district
+from utils.market_store import get_market_prices as lookup_market_prices, get_market_data_version
+from utils.response_cache import cached_json_response, get_response_cache_stats
 from utils.weather_api import get_weather_for_district, get_alerts_for_district
-from utils.sms_api import send_weather_alert_to_farmer, send_crop_alert_to_farmer
+from utils.message_templates import render_weather_alert, render_crop_alert, content_hash
+from utils.alert_outbox import enqueue_alert, enqueue_bulk_alert, get_alert_status, highest_severity
+from utils.api_logger import init_request_logging, get_api_log_stats
+from utils.metrics import render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from utils.admin_auth import require_admin
+from utils.request_profiler import (
+    init_request_profiling, get_hottest_functions, list_request_profiles, get_profile_path
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Create Blueprint for API routes
 api_bp = Blueprint('api', __name__, url_prefix='/api')
+init_request_logging(api_bp)
+init_request_profiling(api_bp)
+
+# Fields every recommendation request must carry
+RECOMMEND_REQUIRED_FIELDS = ['district', 'nitrogen', 'phosphorus', 'potassium', 'ph']
 
 @api_bp.route('/recommend', methods=['POST'])
 def recommend_crop():
@@ -22,8 +45,7 @@ def recommend_crop():
         data = request.get_json()
         
         # Validate required fields
-        required_fields = ['district', 'nitrogen', 'phosphorus', 'potassium', 'ph']
-        for field in required_fields:
+        for field in RECOMMEND_REQUIRED_FIELDS:
             if field not in data:
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
@@ -36,19 +58,25 @@ def recommend_crop():
         last_crop = data.get('last_crop', '')
         
         # Get soil type for district
-        soil_df = pd.read_csv('datasets/soil_data.csv')
-        district_info = soil_df[soil_df['district'].str.lower() == district.lower()]
+        district_info = get_district_soil(district)
         
-        if district_info.empty:
+        if district_info is None:
             return jsonify({'error': 'District not found in database'}), 400
         
-        soil_type = district_info.iloc[0]['soil_type']
+        soil_type = district_info['soil_type']
         
         # Get crop recommendation
+        started = time.perf_counter()
         crop_prediction = get_crop_recommendation(
             nitrogen, phosphorus, potassium, ph, district, soil_type, last_crop
         )
         
+        # Compare against the shadow candidate, if any, off the request path
+        shadow_recommendation({
+            'nitrogen': nitrogen, 'phosphorus': phosphorus, 'potassium': potassium, 'ph': ph,
+            'district': district, 'soil_type': soil_type, 'last_crop': last_crop
+        }, crop_prediction, time.perf_counter() - started)
+        
         # Get fertilizer recommendation
         fertilizer_rec = get_fertilizer_recommendation(
             nitrogen, phosphorus, potassium, crop_prediction['crop']
@@ -75,35 +103,113 @@ def recommend_crop():
         logger.error(f"Error in crop recommendation: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@api_bp.route('/recommend/batch', methods=['POST'])
+def recommend_crop_batch():
+    """Get crop recommendations for many soil samples in one request"""
+    try:
+        data = request.get_json()
+        samples = data.get('samples') if isinstance(data, dict) else data
+        
+        if not isinstance(samples, list) or not samples:
+            return jsonify({'error': 'Request must contain a non-empty samples list'}), 400
+        
+        if len(samples) > Config.MAX_BATCH_SIZE:
+            return jsonify({'error': f'Batch too large, maximum is {Config.MAX_BATCH_SIZE} samples'}), 400
+        
+        # Validate each sample; invalid rows get an error entry in place
+        results = [None] * len(samples)
+        valid_rows = []
+        valid_samples = []
+        for index, sample in enumerate(samples):
+            if not isinstance(sample, dict):
+                results[index] = {'error': 'Sample must be an object'}
+                continue
+            
+            missing = [field for field in RECOMMEND_REQUIRED_FIELDS if field not in sample]
+            if missing:
+                results[index] = {'error': f'Missing required field: {missing[0]}'}
+                continue
+            
+            district_info = get_district_soil(sample['district'])
+            if district_info is None:
+                results[index] = {'error': 'District not found in database'}
+                continue
+            
+            try:
+                valid_samples.append({
+                    'district': sample['district'],
+                    'nitrogen': float(sample['nitrogen']),
+                    'phosphorus': float(sample['phosphorus']),
+                    'potassium': float(sample['potassium']),
+                    'ph': float(sample['ph']),
+                    'soil_type': district_info['soil_type'],
+                    'last_crop': sample.get('last_crop', '')
+                })
+                valid_rows.append(index)
+            except (TypeError, ValueError):
+                results[index] = {'error': 'Soil values must be numeric'}
+        
+        # One vectorized pass for predictions and fertilizer gaps
+        crop_predictions = get_crop_recommendations_batch(valid_samples)
+        fertilizer_recs = get_fertilizer_recommendations_batch(
+            [s['nitrogen'] for s in valid_samples],
+            [s['phosphorus'] for s in valid_samples],
+            [s['potassium'] for s in valid_samples],
+            [p['crop'] for p in crop_predictions]
+        )
+        
+        timestamp = datetime.now().isoformat()
+        records = []
+        for index, sample, crop_prediction, fertilizer_rec in zip(
+                valid_rows, valid_samples, crop_predictions, fertilizer_recs):
+            recommendation = {
+                'crop': crop_prediction['crop'],
+                'confidence': crop_prediction['confidence'],
+                'method': crop_prediction['method'],
+                'soil_type': sample['soil_type'],
+                'fertilizer_gap': fertilizer_rec,
+                'district': sample['district'].title(),
+                'timestamp': timestamp,
+                'reasoning': crop_prediction.get('reasoning', '')
+            }
+            results[index] = recommendation
+            records.append((samples[index], recommendation))
+        
+        # Queue all recommendations for the background history writer
+        recommendation_writer.put_many(records)
+        
+        return jsonify({
+            'results': results,
+            'count': len(results),
+            'errors': len(results) - len(valid_rows),
+            'timestamp': timestamp
+        })
+        
+    except Exception as e:
+        logger.error(f"Error in batch crop recommendation: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @api_bp.route('/market-prices', methods=['GET'])
 def get_market_prices():
     """Get current market prices"""
     try:
         district = request.args.get('district')
         
-        # Load market data
-        prices_df = pd.read_csv('datasets/market_prices.csv')
-        
-        # Filter by district if specified
-        if district:
-            prices_df = prices_df[prices_df['district'].str.lower() == district.lower()]
-        
-        # Get latest prices (today's data)
+        # Today's prices if available, otherwise the latest price per
+        # commodity per mandi, straight from the in-memory index
         today = datetime.now().strftime('%Y-%m-%d')
-        latest_prices = prices_df[prices_df['date'] == today]
-        
-        if latest_prices.empty:
-            # Return latest available data
-            latest_prices = prices_df.sort_values('date', ascending=False).head(10)
-        
-        prices = latest_prices.to_dict('records')
+        version, updated_at = get_market_data_version()
+        
+        def build():
+            prices = lookup_market_prices(district, today)
+            return {
+                'prices': prices,
+                'count': len(prices),
+                'date': today,
+                'timestamp': updated_at
+            }
         
-        return jsonify({
-            'prices': prices,
-            'count': len(prices),
-            'date': today,
-            'timestamp': datetime.now().isoformat()
-        })
+        return cached_json_response(('market-prices', normalize_district(district), today), version, build)
         
     except Exception as e:
         logger.error(f"Error fetching market prices: {str(e)}")
@@ -159,34 +265,61 @@ def register_farmer():
         name = data.get('name', '')
         
         # Save to database
-        conn = sqlite3.connect('datasets/smartcrop.db')
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('''
-                INSERT INTO farmers (phone, name, district, taluk)
-                VALUES (?, ?, ?, ?)
-            ''', (phone, name, district, taluk))
-            
-            farmer_id = cursor.lastrowid
-            conn.commit()
-            
-            return jsonify({
-                'status': 'success',
-                'farmer_id': farmer_id,
-                'message': 'Farmer registered successfully',
-                'timestamp': datetime.now().isoformat()
-            })
-            
+            with transaction() as conn:
+                cursor = conn.execute('''
+                    INSERT INTO farmers (phone, name, district, taluk)
+                    VALUES (?, ?, ?, ?)
+                ''', (phone, name, district, taluk))
+                farmer_id = cursor.lastrowid
         except sqlite3.IntegrityError:
             return jsonify({'error': 'Phone number already registered'}), 400
-        finally:
-            conn.close()
+        
+        return jsonify({
+            'status': 'success',
+            'farmer_id': farmer_id,
+            'message': 'Farmer registered successfully',
+            'timestamp': datetime.now().isoformat()
+        })
         
     except Exception as e:
         logger.error(f"Error registering farmer: {str(e)}")
         return jsonify({'error': 'Registration failed'}), 500
 
+# Alert types /send-alert accepts
+ALERT_TYPES = ('weather', 'crop')
+
+def queue_alert(phone, district, alert_type, alerts_data=None):
+    """Render, de-duplicate and enqueue one alert for the outbox worker
+
+    alerts_data holds the district's weather alerts for weather alerts.
+    Shared by the sync and async /send-alert handlers.
+    """
+    if alert_type == 'weather':
+        message_hash, message = render_weather_alert(district, alerts_data)
+        severity = highest_severity(alerts_data.get('alerts') or [])
+    else:
+        # Get crop recommendation and render it
+        # This would typically use saved recommendation data
+        crop_data = {
+            'crop': 'Wheat',
+            'confidence': 0.85,
+            'fertilizer_gap': {
+                'nitrogen_gap': 20,
+                'phosphorus_gap': 10,
+                'potassium_gap': 15
+            }
+        }
+        message_hash, message = render_crop_alert(district, crop_data)
+        severity = None
+    
+    # Queue for the outbox worker; delivery happens after we respond.
+    # The outbox skips content already queued or sent to this phone
+    alert_id = enqueue_alert(phone, district, message, alert_type, severity, message_hash)
+    if alert_id is None:
+        return {'status': 'duplicate', 'phone': phone, 'district': district}
+    return {'alert_id': alert_id, 'delivery_status': 'pending', 'phone': phone, 'district': district}
+
 @api_bp.route('/send-alert', methods=['POST'])
 def send_alert():
     """Send weather or crop alert to farmer"""
@@ -200,28 +333,12 @@ def send_alert():
         if not phone or not district:
             return jsonify({'error': 'Phone and district required'}), 400
         
-        if alert_type == 'weather':
-            # Get weather alerts and send
-            alerts_data = get_alerts_for_district(district)
-            result = send_weather_alert_to_farmer(phone, district, alerts_data)
-            
-        elif alert_type == 'crop':
-            # Get crop recommendation and send
-            # This would typically use saved recommendation data
-            crop_data = {
-                'crop': 'Wheat',
-                'confidence': 0.85,
-                'fertilizer_gap': {
-                    'nitrogen_gap': 20,
-                    'phosphorus_gap': 10,
-                    'potassium_gap': 15
-                }
-            }
-            result = send_crop_alert_to_farmer(phone, district, crop_data)
-            
-        else:
+        if alert_type not in ALERT_TYPES:
             return jsonify({'error': 'Invalid alert type'}), 400
         
+        alerts_data = get_alerts_for_district(district) if alert_type == 'weather' else None
+        result = queue_alert(phone, district, alert_type, alerts_data)
+        
         return jsonify({
             'status': 'success',
             'alert_type': alert_type,
@@ -233,20 +350,133 @@ def send_alert():
         logger.error(f"Error sending alert: {str(e)}")
         return jsonify({'error': 'Failed to send alert'}), 500
 
-@api_bp.route('/districts', methods=['GET'])
-def get_districts():
-    """Get list of all Punjab districts"""
+@api_bp.route('/weather-alert', methods=['POST'])
+def send_weather_alert():
+    """Queue a weather alert for a farmer
+
+    Sends the given message, or the district's current weather alert
+    when there is none.
+    """
+    try:
+        data = request.get_json() or {}
+        phone = data.get('phone')
+        district = data.get('district')
+        message = data.get('message')
+        
+        if not phone or not district:
+            return jsonify({'error': 'Phone and district required'}), 400
+        
+        if message is not None and (not isinstance(message, str) or not message.strip()):
+            return jsonify({'error': 'message must be a non-empty string'}), 400
+        
+        if message:
+            alert_id = enqueue_alert(phone, district, message, 'weather', None, content_hash(message))
+        else:
+            alert_id = queue_alert(phone, district, 'weather', get_alerts_for_district(district)).get('alert_id')
+        
+        if alert_id is None:
+            return jsonify({'status': 'duplicate', 'message': 'Alert already queued or sent'})
+        logger.info(f"Weather alert {alert_id} queued for {phone}")
+        return jsonify({'status': 'success', 'message': 'Alert queued for delivery', 'alert_id': alert_id})
+        
+    except Exception as e:
+        logger.error(f"Error sending weather alert: {str(e)}")
+        return jsonify({'error': 'Failed to send alert'}), 500
+
+@api_bp.route('/alerts/<int:alert_id>', methods=['GET'])
+def alert_status(alert_id):
+    """Get delivery status of a queued alert"""
     try:
-        # Load district data
-        districts_df = pd.read_csv('datasets/soil_data.csv')
-        districts = districts_df[['district', 'region', 'soil_type']].to_dict('records')
+        status = get_alert_status(alert_id)
+        if status is None:
+            return jsonify({'error': 'Alert not found'}), 404
         
         return jsonify({
-            'districts': districts,
-            'count': len(districts),
+            'status': 'success',
+            'alert': status,
             'timestamp': datetime.now().isoformat()
         })
         
+    except Exception as e:
+        logger.error(f"Error getting alert status: {str(e)}")
+        return jsonify({'error': 'Failed to get alert status'}), 500
+
+def parse_bulk_alert(data):
+    """(district, phones, message) of a bulk alert request
+
+    Raises ValueError with the client-facing error for invalid requests.
+    """
+    district = data.get('district')
+    phones = data.get('phones')
+    message = data.get('message')
+    
+    # Queued alerts and newly registered farmers are recorded per district
+    if not district:
+        raise ValueError('District required')
+    
+    if phones is not None and not isinstance(phones, list):
+        raise ValueError('phones must be a list')
+    
+    if message is not None and not isinstance(message, str):
+        raise ValueError('message must be a string')
+    return district, phones, message
+
+def queue_bulk_alert(district, phones, message, alerts_data=None):
+    """Render a bulk alert once and queue one pending row per farmer
+
+    Without a message, the district's weather alert (alerts_data) is
+    sent. Delivery happens on the outbox worker. Shared by the sync and
+    async /send-alert/bulk handlers.
+    """
+    if message:
+        return enqueue_bulk_alert(message, district, phones, 'custom', None, content_hash(message))
+    message_hash, message = render_weather_alert(district, alerts_data)
+    severity = highest_severity(alerts_data.get('alerts') or [])
+    return enqueue_bulk_alert(message, district, phones, 'weather', severity, message_hash)
+
+@api_bp.route('/send-alert/bulk', methods=['POST'])
+def send_bulk_alert():
+    """Queue one alert for every farmer in a district or a list of phones"""
+    try:
+        district, phones, message = parse_bulk_alert(request.get_json() or {})
+        
+        # Default to the district's current weather alert
+        alerts_data = None if message else get_alerts_for_district(district)
+        result = queue_bulk_alert(district, phones, message, alerts_data)
+        
+        # Accepted: the outbox worker delivers after we respond
+        return jsonify({
+            'status': 'accepted',
+            'district': district,
+            'result': result,
+            'timestamp': datetime.now().isoformat()
+        }), 202
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error sending bulk alert: {str(e)}")
+        return jsonify({'error': 'Failed to send bulk alert'}), 500
+
+@api_bp.route('/districts', methods=['GET'])
+def get_districts():
+    """Get list of all Punjab districts"""
+    try:
+        version, updated_at = get_soil_data_version()
+        
+        def build():
+            districts = [
+                {'district': row['district'], 'region': row['region'], 'soil_type': row['soil_type']}
+                for row in get_all_districts()
+            ]
+            return {
+                'districts': districts,
+                'count': len(districts),
+                'timestamp': updated_at
+            }
+        
+        return cached_json_response(('districts',), version, build)
+        
     except Exception as e:
         logger.error(f"Error fetching districts: {str(e)}")
         return jsonify({'error': 'Failed to fetch districts'}), 500
@@ -255,63 +485,190 @@ def get_districts():
 def get_soil_data(district):
     """Get soil data for a specific district"""
     try:
-        soil_df = pd.read_csv('datasets/soil_data.csv')
-        district_data = soil_df[soil_df['district'].str.lower() == district.lower()]
+        version, updated_at = get_soil_data_version()
+        
+        def build():
+            district_data = get_district_soil(district)
+            if district_data is None:
+                return None
+            return {
+                'district': district.title(),
+                'soil_data': dict(district_data),
+                'timestamp': updated_at
+            }
         
-        if district_data.empty:
+        response = cached_json_response(('soil-data', district.title()), version, build)
+        if response is None:
             return jsonify({'error': 'District not found'}), 404
-        
-        soil_info = district_data.iloc[0].to_dict()
-        
-        return jsonify({
-            'district': district.title(),
-            'soil_data': soil_info,
-            'timestamp': datetime.now().isoformat()
-        })
+        return response
         
     except Exception as e:
         logger.error(f"Error fetching soil data: {str(e)}")
         return jsonify({'error': 'Failed to fetch soil data'}), 500
 
 def save_recommendation_to_db(request_data, recommendation):
-    """Save recommendation to database"""
-    try:
-        conn = sqlite3.connect('datasets/smartcrop.db')
+    """Queue recommendation for the background history writer"""
+    recommendation_writer.put((request_data, recommendation))
+
+def write_recommendations_to_db(records):
+    """Save (request_data, recommendation) pairs to database in one transaction
+
+    Errors propagate to the write-behind queue, which counts the batch as
+    failed; returns the number of rows rejected by constraints, if any.
+    """
+    if not records:
+        return
+    
+    with transaction() as conn:
         cursor = conn.cursor()
         
-        # Get farmer ID if phone provided
-        farmer_id = None
-        if 'phone' in request_data:
-            cursor.execute('SELECT id FROM farmers WHERE phone = ?', (request_data['phone'],))
-            farmer = cursor.fetchone()
-            if farmer:
-                farmer_id = farmer[0]
-        
-        # Save recommendation
-        cursor.execute('''
+        # Get farmer IDs for any phones provided, in one query
+        phones = list({request_data['phone'] for request_data, _ in records if 'phone' in request_data})
+        farmer_ids = {}
+        if phones:
+            placeholders = ','.join('?' * len(phones))
+            cursor.execute(f'SELECT phone, id FROM farmers WHERE phone IN ({placeholders})', phones)
+            farmer_ids = dict(cursor.fetchall())
+        
+        rows = [
+            (
+                farmer_ids.get(request_data.get('phone')),
+                request_data['district'],
+                recommendation['soil_type'],
+                request_data['nitrogen'],
+                request_data['phosphorus'],
+                request_data['potassium'],
+                request_data['ph'],
+                request_data.get('last_crop', ''),
+                recommendation['crop'],
+                recommendation['confidence'],
+                recommendation['method']
+            )
+            for request_data, recommendation in records
+        ]
+        
+        insert_sql = '''
             INSERT INTO recommendations (
                 farmer_id, district, soil_type, nitrogen, phosphorus, potassium, ph,
                 last_crop, recommended_crop, confidence_score, method
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            farmer_id,
-            request_data['district'],
-            recommendation['soil_type'],
-            request_data['nitrogen'],
-            request_data['phosphorus'],
-            request_data['potassium'],
-            request_data['ph'],
-            request_data.get('last_crop', ''),
-            recommendation['crop'],
-            recommendation['confidence'],
-            recommendation['method']
-        ))
-        
-        conn.commit()
-        conn.close()
+        '''
         
+        try:
+            cursor.executemany(insert_sql, rows)
+        except sqlite3.IntegrityError:
+            # One bad row must not drop the whole batch; retry row by row
+            conn.rollback()
+            failed = 0
+            for row in rows:
+                try:
+                    cursor.execute(insert_sql, row)
+                except sqlite3.IntegrityError:
+                    failed += 1
+            logger.error(f"Error saving recommendation: {failed} of {len(rows)} rows rejected")
+            return failed
+
+# Recommendation history is written off the request thread, in batches
+recommendation_writer = WriteBehindQueue(
+    write_recommendations_to_db,
+    batch_size=Config.HISTORY_FLUSH_ROWS,
+    flush_interval_ms=Config.HISTORY_FLUSH_INTERVAL_MS,
+    max_queue_size=Config.HISTORY_QUEUE_SIZE,
+    name='recommendation-writer'
+)
+
+@api_bp.route('/admin/models', methods=['GET'])
+@require_admin
+def model_status():
+    """Served model version, reload state and shadow stats for this worker"""
+    try:
+        return jsonify(get_model_status())
     except Exception as e:
-        logger.error(f"Error saving recommendation: {str(e)}")
+        logger.error(f"Error getting model status: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api_bp.route('/admin/models/reload', methods=['POST'])
+@require_admin
+def reload_model():
+    """Load a model version in the background and swap it in
+
+    With a version in the body it is promoted first, so every worker's
+    registry watcher follows.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        version = data.get('version')
+        swap_model(version)
+        return jsonify({'status': 'reloading', 'version': version or get_model_status()['promoted_version']}), 202
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        logger.error(f"Error reloading model: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api_bp.route('/admin/models/shadow', methods=['POST', 'DELETE'])
+@require_admin
+def shadow_model():
+    """Start (POST {"version": ...}) or stop (DELETE) shadow evaluation"""
+    try:
+        if request.method == 'DELETE':
+            stop_shadow()
+            return jsonify({'status': 'stopped'})
+        
+        data = request.get_json(silent=True) or {}
+        if not data.get('version'):
+            return jsonify({'error': 'Missing required field: version'}), 400
+        start_shadow(data['version'])
+        return jsonify({'status': 'shadowing', 'shadow': get_model_status()['shadow']})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        logger.error(f"Error updating shadow model: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api_bp.route('/admin/profiles', methods=['GET'])
+@require_admin
+def profile_summary():
+    """Hottest functions over the most recent request profiles
+
+    Query parameters: limit (functions, default 20), recent (profiles,
+    default PROFILE_AGGREGATE_RECENT), endpoint (URL rule, e.g.
+    /api/recommend) and sort (tottime, cumtime or calls).
+    """
+    try:
+        limit = min(request.args.get('limit', 20, type=int), 200)
+        recent = request.args.get('recent', type=int)
+        endpoint = request.args.get('endpoint')
+        summary = get_hottest_functions(limit, recent, endpoint, request.args.get('sort', 'tottime'))
+        summary['recent_profiles'] = list_request_profiles(endpoint)[:10]
+        return jsonify(summary)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error summarizing profiles: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api_bp.route('/admin/profiles/<name>', methods=['GET'])
+@require_admin
+def download_profile(name):
+    """One stored profile, for pstats, snakeviz or gprof2dot"""
+    try:
+        path = get_profile_path(name)
+        if path is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=name)
+    except Exception as e:
+        logger.error(f"Error sending profile: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Metrics of every worker in the Prometheus text format"""
+    try:
+        return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+    except Exception as e:
+        logger.error(f"Error rendering metrics: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
 
 @api_bp.route('/health', methods=['GET'])
 def health_check():
@@ -320,5 +677,9 @@ def health_check():
         'status': 'healthy',
         'service': 'SmartCrop Advisory API',
         'version': '1.0.0',
+        'recommendation_queue_depth': recommendation_writer.depth(),
+        'prediction_cache': get_prediction_cache_stats(),
+        'api_log': get_api_log_stats(),
+        'response_cache': get_response_cache_stats(),
         'timestamp': datetime.now().isoformat()
     })
@@ -0,0 +1,110 @@
+# feature_pipeline.py - Versioned feature pipeline shared by training and serving
+import json
+import os
+import logging
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PIPELINE_FORMAT_VERSION = 1
+
+# Numeric inputs in model order; the encoded categoricals follow them
+NUMERIC_FEATURES = ['nitrogen', 'phosphorus', 'potassium', 'ph', 'rainfall', 'temperature']
+CATEGORICAL_FEATURES = ['district', 'soil_type']
+UNKNOWN_CODE = -1
+
+def normalize_category(value):
+    """Lookup key for a categorical value ('  Patiala' -> 'patiala')"""
+    return str(value).strip().lower()
+
+class FeaturePipeline:
+    def __init__(self, encodings, mean, scale, feature_order=None, version=PIPELINE_FORMAT_VERSION):
+        """Everything needed to turn raw inputs into model features
+
+        encodings maps each categorical column to a plain {value: code}
+        dict; mean and scale are the fitted StandardScaler statistics.
+        """
+        self.encodings = encodings
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.feature_order = feature_order or NUMERIC_FEATURES + [f'{c}_encoded' for c in CATEGORICAL_FEATURES]
+        self.version = version
+        unknown = set(self.feature_order) - set(NUMERIC_FEATURES) - {f'{c}_encoded' for c in CATEGORICAL_FEATURES}
+        if unknown:
+            raise ValueError(f"Unknown features in feature_order: {sorted(unknown)}")
+
+    @staticmethod
+    def fit_encodings(data):
+        """Code every categorical column like LabelEncoder: sorted unique values"""
+        encodings = {}
+        for column in CATEGORICAL_FEATURES:
+            values = sorted({normalize_category(value) for value in data[column]})
+            encodings[column] = {value: code for code, value in enumerate(values)}
+        return encodings
+
+    def encode(self, column, values):
+        """Codes for a column, UNKNOWN_CODE where the value was never seen"""
+        table = self.encodings[column]
+        return np.array([table.get(normalize_category(value), UNKNOWN_CODE) for value in values], dtype=float)
+
+    def build(self, columns):
+        """Unscaled feature matrix from raw columns, plus a known-category mask
+
+        columns maps every NUMERIC_FEATURES and CATEGORICAL_FEATURES name
+        to a sequence of equal length. Feature columns are laid out in
+        feature_order, the order the model was trained on.
+        """
+        codes = {f'{column}_encoded': self.encode(column, columns[column]) for column in CATEGORICAL_FEATURES}
+        features = np.column_stack([
+            codes[name] if name in codes else np.asarray(columns[name], dtype=float)
+            for name in self.feature_order
+        ])
+        known = np.logical_and.reduce([code != UNKNOWN_CODE for code in codes.values()])
+        return features, known
+
+    def scale_features(self, features):
+        """Standardize a feature matrix (same arithmetic as StandardScaler)"""
+        return (features - self.mean) / self.scale
+
+    def transform(self, columns):
+        """Scaled model features and known-category mask for raw columns"""
+        features, known = self.build(columns)
+        return self.scale_features(features), known
+
+    def to_dict(self):
+        return {
+            'format_version': self.version,
+            'feature_order': self.feature_order,
+            'encodings': self.encodings,
+            'scaler': {'mean': self.mean.tolist(), 'scale': self.scale.tolist()}
+        }
+
+    def save(self, path):
+        """Write the pipeline as one JSON artifact"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        logger.info(f"Feature pipeline saved to {path}")
+
+    @classmethod
+    def load(cls, path):
+        """Read a pipeline artifact written by save()"""
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if data.get('format_version') != PIPELINE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported feature pipeline version: {data.get('format_version')}")
+        return cls(
+            encodings=data['encodings'],
+            mean=data['scaler']['mean'],
+            scale=data['scaler']['scale'],
+            feature_order=data['feature_order'],
+            version=data['format_version']
+        )
+
+def load_pipeline(path):
+    """Public interface for loading a feature pipeline artifact"""
+    return FeaturePipeline.load(path)
@@ -0,0 +1,176 @@
+# forest_engine.py - Flat-array RandomForest inference engine
+import json
+import os
+import logging
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Node arrays stored one .npy file each so they can be memory-mapped
+NODE_ARRAYS = ['feature', 'threshold', 'children', 'value']
+META_FILE = 'forest.json'
+
+class FlatForest:
+    def __init__(self, feature, threshold, children, value, roots, classes, max_depth):
+        """A RandomForestClassifier flattened into contiguous node arrays
+
+        All trees share one set of arrays and roots holds each tree's
+        first node. children interleaves absolute node indices as
+        [right, left] per node, so the next node is
+        children[2 * node + went_left]. Leaves have feature -1 and point
+        to themselves. value holds each node's class probabilities.
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.max_depth = max_depth
+        self.n_features_in_ = int(feature.max()) + 1 if len(feature) else 0
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Flatten a fitted single-output RandomForestClassifier"""
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            leaf = tree.children_left < 0
+            node_ids = np.arange(offset, offset + n_nodes, dtype=np.int32)
+
+            features.append(np.where(leaf, -1, tree.feature).astype(np.int32))
+            thresholds.append(tree.threshold.astype(np.float64))
+            children.append(np.column_stack([
+                np.where(leaf, node_ids, tree.children_right + offset),
+                np.where(leaf, node_ids, tree.children_left + offset)
+            ]).astype(np.int32).ravel())
+
+            # Older sklearn stores class counts and normalizes in
+            # predict_proba; newer versions store fractions already, which
+            # must be kept bit-for-bit
+            value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[np.isclose(normalizer, 1.0) | (normalizer == 0.0)] = 1.0
+            values.append(value / normalizer)
+
+            roots.append(offset)
+            offset += n_nodes
+            max_depth = max(max_depth, tree.max_depth)
+
+        forest = cls(
+            np.concatenate(features),
+            np.concatenate(thresholds),
+            np.concatenate(children),
+            np.concatenate(values),
+            np.array(roots, dtype=np.int32),
+            np.asarray(model.classes_),
+            int(max_depth)
+        )
+        forest.n_features_in_ = int(model.n_features_in_)
+        return forest
+
+    def save(self, directory):
+        """Write the node arrays as .npy files plus a small JSON header"""
+        os.makedirs(directory, exist_ok=True)
+        for name in NODE_ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(getattr(self, name)))
+        np.save(os.path.join(directory, 'roots.npy'), self.roots)
+
+        meta = {
+            'classes': self.classes_.tolist(),
+            'max_depth': self.max_depth,
+            'n_features': self.n_features_in_,
+            'n_trees': len(self.roots),
+            'n_nodes': len(self.feature)
+        }
+        with open(os.path.join(directory, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2)
+        logger.info(f"Exported {meta['n_trees']} trees ({meta['n_nodes']} nodes) to {directory}")
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Load an exported forest; with mmap_mode='r' the arrays are
+        memory-mapped and shared by every process that loads them"""
+        with open(os.path.join(directory, META_FILE), 'r') as f:
+            meta = json.load(f)
+        # Plain ndarray views keep the mapping but skip np.memmap's
+        # subclass overhead on every gather
+        arrays = {
+            name: np.asarray(np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode))
+            for name in NODE_ARRAYS
+        }
+        forest = cls(
+            roots=np.load(os.path.join(directory, 'roots.npy')),
+            classes=np.array(meta['classes'], dtype=object),
+            max_depth=meta['max_depth'],
+            **arrays
+        )
+        forest.n_features_in_ = meta['n_features']
+        return forest
+
+    @staticmethod
+    def exists(directory):
+        """Whether an exported forest is present in directory"""
+        return os.path.exists(os.path.join(directory, META_FILE))
+
+    def apply(self, X):
+        """Leaf node reached by every row in every tree, shape (n_trees, n_rows)
+
+        All (tree, row) pairs advance one level per step as a single
+        vectorized gather; pairs that reach a leaf drop out of the active
+        set, so later steps only touch the deeper paths.
+        """
+        # sklearn compares float32 inputs against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        flat_X = X.ravel()
+
+        leaves = np.repeat(self.roots.astype(np.intp), n_rows)
+        row_offsets = np.tile(np.arange(n_rows, dtype=np.intp) * n_features, len(self.roots))
+        active = np.arange(len(leaves))
+        nodes = leaves.copy()
+
+        while True:
+            features = self.feature[nodes]
+            internal = features >= 0
+            if not internal.all():
+                leaves[active[~internal]] = nodes[~internal]
+                active = active[internal]
+                nodes = nodes[internal]
+                features = features[internal]
+                if not len(active):
+                    break
+            went_left = flat_X[row_offsets[active] + features] <= self.threshold[nodes]
+            nodes = self.children[2 * nodes + went_left]
+
+        return leaves.reshape(len(self.roots), n_rows)
+
+    def predict_proba(self, X):
+        """Class probabilities averaged over trees, as sklearn computes them"""
+        leaves = self.apply(X)
+        proba = np.zeros((leaves.shape[1], len(self.classes_)))
+        # Accumulate tree by tree in order so rounding matches sklearn
+        for tree_leaves in leaves:
+            proba += self.value[tree_leaves]
+        proba /= len(self.roots)
+        return proba
+
+    def predict(self, X):
+        """Most probable class for each row"""
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+def export_forest(model, directory):
+    """Public interface for flattening a trained forest to disk"""
+    forest = FlatForest.from_sklearn(model)
+    forest.save(directory)
+    return forest
+
+def load_forest(directory, mmap_mode='r'):
+    """Public interface for loading a flattened forest"""
+    return FlatForest.load(directory, mmap_mode)
@@ -0,0 +1,40 @@
+# gunicorn.conf.py - Gunicorn settings for production deployment
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+# Import the application once in the master process; workers are forked
+# from it and share its memory pages copy-on-write
+preload_app = True
+
+# Workers write their metrics here, so /api/metrics on any worker reports
+# the totals of all of them
+os.environ.setdefault('METRICS_DIR', 'logs/metrics')
+
+# Threads do not survive fork, so the alert outbox worker is started in
+# post_fork rather than by create_app in the master
+os.environ['OUTBOX_AUTOSTART'] = 'false'
+
+def on_starting(server):
+    """Drop metrics files left by a previous run"""
+    from utils.metrics import clear_metrics
+    clear_metrics()
+
+def when_ready(server):
+    """Load the ML models in the master before any worker is forked"""
+    from models.predict import preload_models
+    preload_models()
+
+def post_fork(server, worker):
+    """Start the background threads in every worker; threads do not survive fork
+
+    The outbox worker resumes alerts left pending, or stuck in 'sending',
+    by a previous run.
+    """
+    from models.hot_swap import start_model_watcher
+    from utils.alert_outbox import start_outbox_worker
+    start_model_watcher()
+    start_outbox_worker()
@@ -0,0 +1,280 @@
+# hot_swap.py - Zero-downtime model reloads and shadow evaluation
+import os
+import random
+import threading
+import time
+import atexit
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from config import Config
+from models.model_registry import model_registry
+from models.predict import CropPredictor, get_predictor
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Latency samples kept per model for the shadow stats
+LATENCY_WINDOW = 1000
+
+def latency_summary(samples):
+    """Mean and p95 of a latency window, in milliseconds"""
+    if not samples:
+        return {'mean_ms': None, 'p95_ms': None}
+    values = np.fromiter(samples, dtype=float) * 1000
+    return {'mean_ms': round(float(values.mean()), 3), 'p95_ms': round(float(np.percentile(values, 95)), 3)}
+
+class ShadowEvaluator:
+    def __init__(self, sample_rate=None, max_pending=None, mmap_mode=None, registry=None):
+        """Run a sampled share of live recommendations through a candidate model
+
+        Comparisons run on a single background thread, never on the
+        request path; when more than max_pending samples are waiting, new
+        ones are dropped instead of queueing without bound.
+        """
+        self.sample_rate = Config.SHADOW_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.max_pending = max_pending or Config.SHADOW_MAX_PENDING
+        self.mmap_mode = mmap_mode if mmap_mode is not None else Config.MODEL_MMAP_MODE
+        self.registry = registry or model_registry
+        self.candidate = None
+        self.candidate_version = None
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self.pending = 0  # survives reset_stats: queued samples still finish
+        self.reset_stats()
+        atexit.register(self.shutdown)
+
+    def reset_stats(self):
+        self.sampled = 0
+        self.compared = 0
+        self.agreed = 0
+        self.errors = 0
+        self.dropped = 0
+        self.primary_latency = deque(maxlen=LATENCY_WINDOW)
+        self.candidate_latency = deque(maxlen=LATENCY_WINDOW)
+
+    def start(self, version):
+        """Load a registry version as the shadow candidate
+
+        Raises ValueError for unknown versions or artifacts that do not
+        load a model.
+        """
+        if version == self.candidate_version:
+            return
+        try:
+            self.registry.get_metadata(version)
+        except FileNotFoundError:
+            raise ValueError(f"Unknown model version: {version}")
+        artifacts = self.registry.artifacts(version)
+
+        candidate = CropPredictor(
+            model_path=artifacts['model'], pipeline_path=artifacts['pipeline'],
+            forest_path=artifacts['forest'], mmap_mode=self.mmap_mode, lazy=False, record_metrics=False
+        )
+        if candidate.model is None:
+            raise ValueError(f"Model version {version} has no loadable model")
+
+        with self._lock:
+            self.candidate, self.candidate_version = candidate, version
+            self.reset_stats()
+        logger.info(f"Shadow evaluation started for model version {version}")
+
+    def stop(self):
+        """Stop sampling and release the candidate model"""
+        with self._lock:
+            if self.candidate is None:
+                return
+            self.candidate, self.candidate_version = None, None
+        logger.info("Shadow evaluation stopped")
+
+    def _pool(self):
+        """Comparison thread, created lazily once per process"""
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shadow')
+        return self._executor
+
+    def submit(self, inputs, primary_result, primary_seconds):
+        """Maybe compare one served recommendation against the candidate
+
+        inputs holds the predict_crop keyword arguments. Returns whether
+        the request was sampled.
+        """
+        candidate = self.candidate
+        if candidate is None or random.random() >= self.sample_rate:
+            return False
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.dropped += 1
+                return False
+            self.sampled += 1
+            self.pending += 1
+        self._pool().submit(self._compare, candidate, inputs, primary_result['crop'], primary_seconds)
+        return True
+
+    def _compare(self, candidate, inputs, primary_crop, primary_seconds):
+        started = time.perf_counter()
+        try:
+            result = candidate.predict_crop(**inputs)
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                if candidate is not self.candidate:
+                    return  # the candidate changed while this sample waited
+                self.compared += 1
+                self.agreed += int(result['crop'] == primary_crop)
+                self.primary_latency.append(primary_seconds)
+                self.candidate_latency.append(elapsed)
+        except Exception as e:
+            logger.error(f"Error in shadow comparison: {str(e)}")
+            with self._lock:
+                self.errors += 1
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def stats(self):
+        """Agreement and latency of the candidate against the served model"""
+        with self._lock:
+            return {
+                'candidate_version': self.candidate_version,
+                'sample_rate': self.sample_rate,
+                'sampled': self.sampled,
+                'compared': self.compared,
+                'agreement_rate': round(self.agreed / self.compared, 4) if self.compared else None,
+                'errors': self.errors,
+                'dropped': self.dropped,
+                'pending': self.pending,
+                'latency': {
+                    'primary': latency_summary(self.primary_latency),
+                    'candidate': latency_summary(self.candidate_latency)
+                }
+            }
+
+    def shutdown(self, wait=True):
+        """Finish queued comparisons and stop the comparison thread"""
+        executor = self._executor
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=wait)
+        self._executor = None
+
+class RegistryWatcher:
+    def __init__(self, predictor=None, shadow=None, registry=None, interval=None):
+        """Poll the registry pointers and follow them in this process
+
+        Every worker runs its own watcher, so promoting a version (CLI or
+        admin endpoint) reaches all workers within one interval. Reloads
+        run on the watcher thread; requests keep using the previous model
+        until the new one is loaded.
+        """
+        self.predictor = predictor or get_predictor()
+        self.shadow = shadow
+        self.registry = registry or model_registry
+        self.interval = Config.MODEL_WATCH_INTERVAL if interval is None else interval
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._failed_shadow = None
+        atexit.register(self.stop)
+
+    def check(self):
+        """Apply pointer changes once; returns whether anything changed"""
+        changed = False
+        current = self.registry.current_version()
+        # An unloaded predictor picks up the current version lazily
+        if self.predictor.loaded and current and current != self.predictor.model_version:
+            logger.info(f"Promoted model version changed to {current}, reloading")
+            changed = self.predictor.reload()
+
+        if self.shadow is not None:
+            shadow = self.registry.shadow_version()
+            if shadow is None:
+                self._failed_shadow = None
+                if self.shadow.candidate_version is not None:
+                    self.shadow.stop()
+                    changed = True
+            elif shadow is not None and shadow != self.shadow.candidate_version and shadow != self._failed_shadow:
+                try:
+                    self.shadow.start(shadow)
+                    changed = True
+                except ValueError as e:
+                    # Do not retry a broken candidate on every poll
+                    self._failed_shadow = shadow
+                    logger.error(f"Error starting shadow evaluation: {str(e)}")
+        return changed
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Error watching model registry: {str(e)}")
+
+    def start(self):
+        """Start the watcher thread, once per process"""
+        if self.interval <= 0:
+            return
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='model-watcher', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        thread = self._thread
+        if thread is None or self._pid != os.getpid():
+            return
+        self._stopping.set()
+        thread.join(timeout)
+        self._thread = None
+
+# Global shadow evaluator and registry watcher instances
+shadow_evaluator = ShadowEvaluator()
+registry_watcher = RegistryWatcher(shadow=shadow_evaluator)
+
+def start_model_watcher():
+    """Public interface for following registry promotions (e.g. per worker)"""
+    registry_watcher.start()
+
+def shadow_recommendation(inputs, primary_result, primary_seconds):
+    """Public interface for sampling a served recommendation into shadow mode"""
+    return shadow_evaluator.submit(inputs, primary_result, primary_seconds)
+
+def start_shadow(version):
+    """Public interface for shadowing a version in every worker"""
+    shadow_evaluator.start(version)
+    model_registry.set_shadow(version)
+
+def stop_shadow():
+    """Public interface for turning shadow mode off in every worker"""
+    model_registry.clear_shadow()
+    shadow_evaluator.stop()
+
+def swap_model(version=None):
+    """Public interface for a background reload, optionally promoting version first"""
+    if version:
+        model_registry.promote(version)
+    get_predictor().reload_async()
+
+def get_model_status():
+    """Public interface for the served model, reload and shadow state"""
+    predictor = get_predictor()
+    return {
+        'pid': os.getpid(),
+        'served_version': predictor.model_version,
+        'promoted_version': model_registry.current_version(),
+        'load_count': predictor.version,
+        'reloading': predictor.reloading,
+        'versions': [metadata['version'] for metadata in model_registry.list_versions()],
+        'shadow': shadow_evaluator.stats()
+    }
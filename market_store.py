@@ -0,0 +1,208 @@
+# market_store.py - Indexed market price store with latest-price views
+import csv
+import io
+import os
+import threading
+import time
+import logging
+from datetime import datetime
+
+from config import Config
+from utils.soil_registry import normalize_district, column_types, typed_records
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Key used for views spanning every district
+ALL_DISTRICTS = None
+
+# Bytes before the read offset that must be unchanged for the CSV to be
+# treated as appended to rather than rewritten
+TAIL_CHECK_BYTES = 256
+
+class MarketIndex:
+    """Lookup tables built from market price rows"""
+    def __init__(self):
+        self.rows = []
+        self.by_key = {}        # (district, commodity, date) -> {mandi: row}
+        self.by_district = {}   # district -> rows in arrival order
+        self.by_date = {}       # date -> {district: rows}
+        self.latest = {}        # district -> {(mandi, commodity): row}
+        self.latest_views = {}  # district -> latest rows, newest first
+
+    def add(self, rows):
+        """Index rows and return the set of districts whose views changed"""
+        touched = set()
+        for row in rows:
+            district = normalize_district(row['district'])
+            commodity = str(row['commodity']).strip().lower()
+            date = str(row['date'])
+            mandi = row.get('mandi')
+
+            self.rows.append(row)
+            # Replaced rather than updated, so a reader holding the old dict
+            # can iterate it while rows arrive
+            key = (district, commodity, date)
+            self.by_key[key] = dict(self.by_key.get(key, {}), **{mandi: row})
+            for key in (district, ALL_DISTRICTS):
+                self.by_district.setdefault(key, []).append(row)
+                self.by_date.setdefault(date, {}).setdefault(key, []).append(row)
+
+                latest = self.latest.setdefault(key, {})
+                current = latest.get((mandi, commodity))
+                if current is None or str(current['date']) <= date:
+                    latest[(mandi, commodity)] = row
+            touched.add(district)
+
+        if touched:
+            touched.add(ALL_DISTRICTS)
+            for key in touched:
+                # Sorting happens here, once per update, never per request
+                self.latest_views[key] = sorted(
+                    self.latest[key].values(), key=lambda r: str(r['date']), reverse=True
+                )
+        return touched
+
+class MarketPriceStore:
+    def __init__(self, data_path=None, check_interval=1.0):
+        self.data_path = data_path or Config.MARKET_DATA_PATH
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._last_check = None
+        self._mtime_ns = None
+        self._index = MarketIndex()
+        # Where the last read stopped, the bytes before it, and the CSV
+        # header and column types, for reading only appended rows
+        self._offset = 0
+        self._tail = b''
+        self._fieldnames = None
+        self._types = None
+        self.version = 0
+        self.updated_at = None
+
+    def _parse(self, data, fieldnames=None):
+        """csv.DictReader over the complete lines of data, and their length"""
+        end = data.rfind(b'\n') + 1
+        reader = csv.DictReader(io.StringIO(data[:end].decode('utf-8'), newline=''), fieldnames=fieldnames)
+        return reader, end
+
+    def _load(self, mtime_ns):
+        """Parse the market CSV into a fresh index and swap it in"""
+        with open(self.data_path, 'rb') as f:
+            data = f.read()
+        reader, end = self._parse(data)
+        rows = list(reader)
+        types = column_types(rows) if rows else None
+        index = MarketIndex()
+        index.add(typed_records(rows, types) if rows else [])
+
+        self._index = index
+        self._fieldnames, self._types = reader.fieldnames, types
+        self._offset, self._tail = end, data[max(0, end - TAIL_CHECK_BYTES):end]
+        self._mtime_ns = mtime_ns
+        self.version += 1
+        self.updated_at = datetime.fromtimestamp(mtime_ns / 1e9).isoformat()
+        logger.info(f"Market store loaded {len(index.rows)} prices (version {self.version})")
+
+    def _append(self, mtime_ns):
+        """Index only the rows appended since the last read
+
+        Returns False, leaving the index untouched, when the file was
+        rewritten rather than appended to (the bytes before the offset
+        changed) or a new row does not fit the column types; the caller
+        then reloads it in full. A partly written last line is left for
+        the next check.
+        """
+        if self._types is None or not self._tail:
+            return False
+        with open(self.data_path, 'rb') as f:
+            f.seek(self._offset - len(self._tail))
+            data = f.read()
+        if not data.startswith(self._tail):
+            return False
+
+        reader, end = self._parse(data[len(self._tail):], self._fieldnames)
+        try:
+            rows = typed_records(list(reader), self._types)
+        except ValueError:
+            return False
+
+        self._index.add(rows)
+        self._offset += end
+        self._tail = data[max(0, len(self._tail) + end - TAIL_CHECK_BYTES):len(self._tail) + end]
+        self._mtime_ns = mtime_ns
+        if rows:
+            self.version += 1
+            self.updated_at = datetime.fromtimestamp(mtime_ns / 1e9).isoformat()
+            logger.info(f"Market store indexed {len(rows)} appended prices (version {self.version})")
+        return True
+
+    def _refresh(self):
+        """Reload the index if the CSV changed on disk"""
+        now = time.monotonic()
+        if self._last_check is not None and now - self._last_check < self.check_interval:
+            return
+
+        with self._lock:
+            if self._last_check is not None and now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+            try:
+                mtime_ns = os.stat(self.data_path).st_mtime_ns
+                if mtime_ns != self._mtime_ns and not self._append(mtime_ns):
+                    self._load(mtime_ns)
+            except Exception as e:
+                # Keep serving the last good index
+                logger.error(f"Error loading market prices: {str(e)}")
+
+    def get_prices(self, district=None, date=None):
+        """Get prices for a date, or the latest price per commodity per mandi"""
+        self._refresh()
+        index = self._index
+        key = normalize_district(district) if district else ALL_DISTRICTS
+
+        if date:
+            prices = index.by_date.get(str(date), {}).get(key)
+            if prices:
+                return prices
+
+        return index.latest_views.get(key, [])
+
+    def get_price(self, district, commodity, date):
+        """Get the prices of one commodity on one day, keyed by mandi"""
+        self._refresh()
+        key = (normalize_district(district), commodity.strip().lower(), str(date))
+        return self._index.by_key.get(key, {})
+
+    def all_prices(self, district=None):
+        """Get every known price row, optionally for one district"""
+        self._refresh()
+        key = normalize_district(district) if district else ALL_DISTRICTS
+        return self._index.by_district.get(key, [])
+
+    def data_version(self):
+        """(version, updated_at) of the prices, after checking the CSV for changes"""
+        self._refresh()
+        return self.version, self.updated_at
+
+    def reload(self):
+        """Force a full reload on the next lookup"""
+        with self._lock:
+            self._mtime_ns = None
+            self._tail = b''
+            self._last_check = None
+
+# Global market price store instance
+market_store = MarketPriceStore()
+
+def get_market_prices(district=None, date=None):
+    """Public interface for market price lookups"""
+    return market_store.get_prices(district, date)
+
+def get_all_market_prices(district=None):
+    """Public interface for the full market price history"""
+    return market_store.all_prices(district)
+
+def get_market_data_version():
+    """Public interface for the (version, updated_at) of the market prices"""
+    return market_store.data_version()
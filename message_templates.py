@@ -0,0 +1,195 @@
+# message_templates.py - Render-once alert templates with delivery de-duplication
+import hashlib
+import json
+import threading
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime
+
+from config import Config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Compiled message templates; the static text is parsed once at import and
+# only the placeholders are filled per render
+WEATHER_HEADER = (
+    "🌦️ Weather Alert for {district}\n\n"
+    "📍 District: {district}\n"
+    "🌡️ Temperature: {temperature}°C\n"
+    "💧 Humidity: {humidity}%\n\n"
+).format
+WEATHER_ALERTS_HEADER = "⚠️ Alerts:\n"
+ALERT_LINE = "• {}\n".format
+RECOMMENDATION_LINE = "  💡 {}\n".format
+
+CROP_HEADER = (
+    "🌱 Crop Alert for {district}\n\n"
+    "📍 District: {district}\n"
+    "🌾 Recommended Crop: {crop}\n"
+    "📊 Confidence: {confidence:.1f}%\n\n"
+).format
+FERTILIZER_HEADER = "💊 Fertilizer Recommendations:\n"
+FERTILIZER_LINE = "• {}: {:.1f} kg/ha\n".format
+FERTILIZER_NUTRIENTS = [
+    ('Nitrogen', 'nitrogen_gap'),
+    ('Phosphorus', 'phosphorus_gap'),
+    ('Potassium', 'potassium_gap')
+]
+
+FOOTER = "\n🕒 Time: {}\n📱 SmartCrop Advisory System".format
+
+def weather_alert_payload(district, alert_data):
+    """The parts of a weather alert that end up in the message text"""
+    return {
+        'kind': 'weather',
+        'district': district,
+        'temperature': alert_data.get('temperature', 'N/A'),
+        'humidity': alert_data.get('humidity', 'N/A'),
+        'alerts': [
+            [alert['message'], alert.get('recommendation')]
+            for alert in alert_data.get('alerts') or []
+        ]
+    }
+
+def crop_alert_payload(district, crop_data):
+    """The parts of a crop alert that end up in the message text"""
+    gap = crop_data.get('fertilizer_gap') or {}
+    return {
+        'kind': 'crop',
+        'district': district,
+        'crop': crop_data.get('crop', 'N/A'),
+        'confidence': crop_data.get('confidence', 0),
+        'fertilizer_gap': {key: gap.get(key, 0) for _, key in FERTILIZER_NUTRIENTS} if gap else None
+    }
+
+def content_hash(payload):
+    """Stable hash of a message payload or text"""
+    if not isinstance(payload, str):
+        payload = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _render_weather(payload, now):
+    parts = [WEATHER_HEADER(**payload)]
+    if payload['alerts']:
+        parts.append(WEATHER_ALERTS_HEADER)
+        for message, recommendation in payload['alerts']:
+            parts.append(ALERT_LINE(message))
+            if recommendation:
+                parts.append(RECOMMENDATION_LINE(recommendation))
+    parts.append(FOOTER(now.strftime('%d-%m-%Y %H:%M')))
+    return ''.join(parts)
+
+def _render_crop(payload, now):
+    parts = [CROP_HEADER(
+        district=payload['district'],
+        crop=payload['crop'],
+        confidence=payload['confidence'] * 100
+    )]
+    gap = payload['fertilizer_gap']
+    if gap:
+        parts.append(FERTILIZER_HEADER)
+        for label, key in FERTILIZER_NUTRIENTS:
+            if gap[key] > 0:
+                parts.append(FERTILIZER_LINE(label, gap[key]))
+    parts.append(FOOTER(now.strftime('%d-%m-%Y %H:%M')))
+    return ''.join(parts)
+
+RENDERERS = {
+    'weather': _render_weather,
+    'crop': _render_crop
+}
+
+class MessageRenderer:
+    def __init__(self, ttl=None, max_entries=1024):
+        """Cache rendered messages by payload hash
+
+        A cached text is reused for ttl seconds, so everyone in a district
+        gets the same rendering and the timestamp line stays recent.
+        """
+        self.ttl = Config.MESSAGE_TEMPLATE_TTL if ttl is None else ttl
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # hash -> (rendered_at, text)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, payload):
+        """Render a payload, returning (content_hash, text)"""
+        key = content_hash(payload)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return key, entry[1]
+
+        text = RENDERERS[payload['kind']](payload, datetime.now())
+
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = (now, text)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return key, text
+
+class DeliveryDeduplicator:
+    def __init__(self, window=None):
+        """Remember (phone, content hash) pairs sent within window seconds
+
+        A pair is claimed before sending, so concurrent sends of the same
+        content cannot both go out, and released if the delivery fails,
+        so a retry is not suppressed. The pairs live in this process
+        only: under Gunicorn each worker de-duplicates its own sends.
+        Alerts queued through the outbox are de-duplicated against its
+        table instead, across workers.
+        """
+        self.window = Config.ALERT_DEDUP_WINDOW if window is None else window
+        self._sent = {}  # (phone, hash) -> sent_at
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+
+    def claim(self, phone, message_hash):
+        """Reserve a delivery; False if the same content was sent or is being sent to phone"""
+        if self.window <= 0:
+            return True
+        now = time.monotonic()
+        key = (phone, message_hash)
+        with self._lock:
+            sent_at = self._sent.get(key)
+            if sent_at is not None and now - sent_at < self.window:
+                return False
+            self._sent[key] = now
+            if now - self._last_prune > self.window:
+                self._prune(now)
+            return True
+
+    def release(self, phone, message_hash):
+        """Forget a claim whose delivery failed"""
+        with self._lock:
+            self._sent.pop((phone, message_hash), None)
+
+    def filter(self, phones, message_hash):
+        """Keep only the phones that have not received this content yet"""
+        return [phone for phone in phones if self.claim(phone, message_hash)]
+
+    def _prune(self, now):
+        """Forget deliveries older than the window"""
+        self._sent = {key: sent_at for key, sent_at in self._sent.items() if now - sent_at < self.window}
+        self._last_prune = now
+
+# Global renderer and de-duplication instances
+message_renderer = MessageRenderer()
+delivery_deduplicator = DeliveryDeduplicator()
+
+def render_weather_alert(district, alert_data):
+    """Public interface for rendering a weather alert: (hash, text)"""
+    return message_renderer.render(weather_alert_payload(district, alert_data))
+
+def render_crop_alert(district, crop_data):
+    """Public interface for rendering a crop alert: (hash, text)"""
+    return message_renderer.render(crop_alert_payload(district, crop_data))
@@ -0,0 +1,261 @@
+# metrics.py - In-process metrics registry with Prometheus text exposition
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+import atexit
+import logging
+
+from config import Config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from sub-millisecond model and DB calls up
+# to slow upstream APIs
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_labels(names, values, extra=None):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # label values tuple -> value
+
+    def key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def reset(self):
+        self.values = {}
+
+    def describe(self):
+        return {'type': self.kind, 'help': self.documentation, 'labelnames': list(self.labelnames)}
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.ensure_flushing()
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """Record one observation; value is in seconds for latencies"""
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, an overflow slot, sum
+                state = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+        self.registry.ensure_flushing()
+
+    def describe(self):
+        return dict(super().describe(), buckets=list(self.buckets))
+
+class MetricsRegistry:
+    def __init__(self, directory=None, flush_interval=None):
+        """Metrics for this process, merged with the other workers' on export
+
+        Each process keeps its values in memory and a background thread
+        writes them to its own file in directory every flush_interval
+        seconds (and at exit). Rendering merges every file in the
+        directory, replacing this process's file with its live values,
+        so any worker can serve the totals of all of them. With no
+        directory only this process is reported.
+        """
+        self.directory = Config.METRICS_DIR if directory is None else directory
+        self.flush_interval = flush_interval or Config.METRICS_FLUSH_INTERVAL
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.collectors = []
+        self._thread = None
+        self._reset_process()
+        os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.flush)
+
+    def _reset_process(self):
+        # A unique file per process; pids are reused after a restart
+        self._file = f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+        self._thread = None
+
+    def _after_fork(self):
+        """Start the child from zero; the parent's counts stay in its own file"""
+        self.lock = threading.Lock()
+        for metric in self.metrics.values():
+            metric.reset()
+        self._reset_process()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def register_collector(self, collect):
+        """Add a callable returning {name: (help, labelnames, {label values: count})}
+
+        For counters kept elsewhere (e.g. cache hit counts), read at
+        snapshot time.
+        """
+        self.collectors.append(collect)
+
+    def snapshot(self):
+        """This process's metrics as a JSON-serializable dict"""
+        data = {}
+        with self.lock:
+            for name, metric in self.metrics.items():
+                data[name] = dict(metric.describe(), samples=[[list(key), value] for key, value in metric.values.items()])
+        for collect in self.collectors:
+            try:
+                for name, (documentation, labelnames, samples) in collect().items():
+                    data[name] = {
+                        'type': 'counter', 'help': documentation, 'labelnames': list(labelnames),
+                        'samples': [[list(key), value] for key, value in samples.items()]
+                    }
+            except Exception as e:
+                logger.error(f"Error collecting metrics: {str(e)}")
+        return data
+
+    def flush(self):
+        """Write this process's snapshot to its file, if it recorded anything"""
+        if not self.directory or self._thread is None:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, self._file)
+            with open(f'{path}.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(f'{path}.tmp', path)
+        except Exception as e:
+            logger.error(f"Error writing metrics: {str(e)}")
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def ensure_flushing(self):
+        """Start the flush thread on first use, once per process"""
+        if self._thread is not None or not self.directory:
+            return
+        with self.lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+                self._thread.start()
+
+    def collect(self):
+        """Merged metrics of every process"""
+        snapshots = []
+        if self.directory:
+            for path in glob.glob(os.path.join(self.directory, '*.json')):
+                if os.path.basename(path) == self._file:
+                    continue
+                try:
+                    with open(path, 'r') as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # removed or being replaced
+        snapshots.append(self.snapshot())
+
+        merged = {}
+        for snapshot in snapshots:
+            for name, data in snapshot.items():
+                target = merged.setdefault(name, dict(data, samples={}))
+                for key, value in data['samples']:
+                    key = tuple(key)
+                    if data['type'] == 'histogram':
+                        current = target['samples'].get(key)
+                        target['samples'][key] = value if current is None else [a + b for a, b in zip(current, value)]
+                    else:
+                        target['samples'][key] = target['samples'].get(key, 0) + value
+        return merged
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, data in sorted(self.collect().items()):
+            labelnames = data['labelnames']
+            lines.append(f"# HELP {name} {data['help']}")
+            lines.append(f"# TYPE {name} {data['type']}")
+            for key, value in sorted(data['samples'].items()):
+                if data['type'] == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(data['buckets'] + [float('inf')], value[:-1]):
+                        cumulative += count
+                        le = format_labels(labelnames, key, f'le="{format_value(float(bound))}"')
+                        lines.append(f'{name}_bucket{le} {cumulative}')
+                    labels = format_labels(labelnames, key)
+                    lines.append(f'{name}_sum{labels} {format_value(float(value[-1]))}')
+                    lines.append(f'{name}_count{labels} {cumulative}')
+                else:
+                    lines.append(f'{name}{format_labels(labelnames, key)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def clear_directory(self):
+        """Remove every process file, e.g. when the server (re)starts"""
+        if not self.directory:
+            return
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+# Global metrics registry instance
+metrics = MetricsRegistry()
+
+def counter(name, documentation, labelnames=()):
+    """Public interface for defining a counter"""
+    return metrics.counter(name, documentation, labelnames)
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """Public interface for defining a histogram"""
+    return metrics.histogram(name, documentation, labelnames, buckets)
+
+def render_metrics():
+    """Public interface for the Prometheus text of all workers"""
+    return metrics.render()
+
+def clear_metrics():
+    """Public interface for dropping metrics left by previous runs"""
+    metrics.clear_directory()
@@ -0,0 +1,149 @@
+# model_registry.py - Versioned model artifacts with a promotable serving pointer
+import json
+import os
+import shutil
+import tempfile
+import logging
+from datetime import datetime
+
+from config import Config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Artifact names inside every version directory
+MODEL_FILE = 'crop_recommendation_model.pkl'
+PIPELINE_FILE = 'feature_pipeline.json'
+FOREST_DIR = 'crop_forest'
+METADATA_FILE = 'metadata.json'
+CURRENT_POINTER = 'CURRENT'
+SHADOW_POINTER = 'SHADOW'
+
+def directory_size(path):
+    """Total size in bytes of every file under path"""
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+class ModelRegistry:
+    def __init__(self, root=None):
+        """Model versions live in root/<version>/; root/CURRENT names the served one"""
+        self.root = root or Config.MODEL_REGISTRY_PATH
+
+    def version_path(self, version):
+        return os.path.join(self.root, version)
+
+    def new_version_id(self):
+        """Sortable, unique version id based on the current time"""
+        base = datetime.now().strftime('%Y%m%d-%H%M%S')
+        version, suffix = base, 1
+        while os.path.exists(self.version_path(version)):
+            suffix += 1
+            version = f'{base}-{suffix}'
+        return version
+
+    def register(self, write_artifacts, metadata):
+        """Create a new version and return its id
+
+        write_artifacts(directory) writes the model files into a staging
+        directory, which is renamed into place only once complete, so a
+        half-written version is never visible.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        version = self.new_version_id()
+        staging = tempfile.mkdtemp(prefix=f'.{version}-', dir=self.root)
+        try:
+            write_artifacts(staging)
+            metadata = dict(metadata, version=version, created_at=datetime.now().isoformat(),
+                            size_bytes=directory_size(staging))
+            with open(os.path.join(staging, METADATA_FILE), 'w') as f:
+                json.dump(metadata, f, indent=2, default=str)
+            os.rename(staging, self.version_path(version))
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        logger.info(f"Registered model version {version}")
+        return version
+
+    def list_versions(self):
+        """Metadata of every registered version, oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        versions = []
+        for name in sorted(os.listdir(self.root)):
+            # Dot-directories are versions still being written
+            if not name.startswith('.') and os.path.exists(os.path.join(self.root, name, METADATA_FILE)):
+                versions.append(self.get_metadata(name))
+        return versions
+
+    def get_metadata(self, version):
+        with open(os.path.join(self.version_path(version), METADATA_FILE), 'r') as f:
+            return json.load(f)
+
+    def read_pointer(self, name):
+        """Version named by a pointer file, or None"""
+        try:
+            with open(os.path.join(self.root, name), 'r') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def write_pointer(self, name, version):
+        """Point name at version; the pointer file is replaced atomically"""
+        if not os.path.exists(os.path.join(self.version_path(version), METADATA_FILE)):
+            raise ValueError(f"Unknown model version: {version}")
+        pointer = os.path.join(self.root, name)
+        staging = f'{pointer}.tmp'
+        with open(staging, 'w') as f:
+            f.write(version + '\n')
+        os.replace(staging, pointer)
+
+    def current_version(self):
+        """Version currently promoted for serving, or None"""
+        return self.read_pointer(CURRENT_POINTER)
+
+    def promote(self, version):
+        """Point serving at version"""
+        self.write_pointer(CURRENT_POINTER, version)
+        logger.info(f"Promoted model version {version}")
+
+    def shadow_version(self):
+        """Candidate version evaluated in shadow mode, or None"""
+        return self.read_pointer(SHADOW_POINTER)
+
+    def set_shadow(self, version):
+        """Evaluate version in shadow mode alongside the served one"""
+        self.write_pointer(SHADOW_POINTER, version)
+        logger.info(f"Shadowing model version {version}")
+
+    def clear_shadow(self):
+        """Turn shadow mode off"""
+        try:
+            os.remove(os.path.join(self.root, SHADOW_POINTER))
+        except FileNotFoundError:
+            pass
+
+    def artifacts(self, version=None):
+        """Artifact paths of a version (default: the promoted one), or None"""
+        version = version or self.current_version()
+        if not version:
+            return None
+        path = self.version_path(version)
+        return {
+            'version': version,
+            'model': os.path.join(path, MODEL_FILE),
+            'pipeline': os.path.join(path, PIPELINE_FILE),
+            'forest': os.path.join(path, FOREST_DIR)
+        }
+
+# Global model registry instance
+model_registry = ModelRegistry()
+
+def get_serving_artifacts():
+    """Public interface for the promoted model's artifact paths"""
+    return model_registry.artifacts()
+
+def promote_model(version):
+    """Public interface for promoting a model version"""
+    model_registry.promote(version)
@@ -0,0 +1,271 @@
+# notification_dispatcher.py - Bulk SMS/WhatsApp fan-out with rate limits and retries
+import asyncio
+import random
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from database.db import fetchall
+from utils.sms_api import notification_api, async_notification_api, is_transient
+from utils.message_templates import content_hash, render_weather_alert, delivery_deduplicator
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cap on individual failures echoed back in dispatch stats
+MAX_REPORTED_FAILURES = 100
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        """Allow rate operations per second with bursts up to capacity
+
+        A rate of 0 or less disables limiting.
+        """
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Take a token if one is available; returns 0, or seconds to wait"""
+        if self.rate <= 0:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Block until a token is available"""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Wait for a token without blocking the event loop"""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+class BulkDispatcher:
+    def __init__(self, api=None, workers=None, sms_rate=None, whatsapp_rate=None,
+                 max_retries=None, backoff_base=None, deduplicator=None):
+        self.api = api or notification_api
+        self.deduplicator = deduplicator or delivery_deduplicator
+        self.workers = workers or Config.NOTIFICATION_WORKERS
+        self.max_retries = Config.NOTIFICATION_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = Config.NOTIFICATION_BACKOFF_BASE if backoff_base is None else backoff_base
+        # One bucket per provider, shared by every dispatch in this process
+        self.buckets = {
+            'sms': TokenBucket(Config.SMS_RATE_LIMIT if sms_rate is None else sms_rate),
+            'whatsapp': TokenBucket(Config.WHATSAPP_RATE_LIMIT if whatsapp_rate is None else whatsapp_rate)
+        }
+        self.senders = {
+            'sms': self.api.send_sms,
+            'whatsapp': self.api.send_whatsapp
+        }
+
+    def farmers_in_district(self, district):
+        """Phone numbers of every registered farmer in a district"""
+        rows = fetchall('SELECT phone FROM farmers WHERE district = ? COLLATE NOCASE', (district,))
+        return [row[0] for row in rows]
+
+    def send_with_retry(self, channel, phone, message):
+        """Send one message, retrying with exponential backoff and jitter
+
+        Only transient failures (timeouts, 429, 5xx) are retried; a
+        permanent error such as an invalid number is returned at once so
+        it does not use up the rate budget. Returns (result, retries).
+        """
+        bucket = self.buckets[channel]
+        send = self.senders[channel]
+        result = None
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            try:
+                result = send(phone, message)
+            except Exception as e:
+                result = {'status': 'error', 'error': str(e), 'retryable': is_transient(e), 'phone': phone}
+            if result.get('status') == 'success' or not result.get('retryable'):
+                return result, attempt
+            if attempt < self.max_retries:
+                time.sleep(self.backoff_base * (2 ** attempt) * (0.5 + random.random()))
+        return result, self.max_retries
+
+    def dispatch(self, message, phones=None, district=None, channels=('sms', 'whatsapp'), message_hash=None):
+        """Send one message to many farmers over every channel in parallel
+
+        Recipients are the given phones, or every farmer registered in the
+        district. Farmers who already received the same content within the
+        de-duplication window are skipped; farmers no channel reached can
+        be sent the same content again. Returns aggregate delivery stats.
+        """
+        message_hash = message_hash or content_hash(message)
+        recipients, phones = self.recipients(phones, district, message_hash)
+
+        stats = {
+            channel: {'sent': 0, 'failed': 0, 'retries': 0}
+            for channel in channels
+        }
+        failures = []
+        delivered = set()
+        stats_lock = threading.Lock()
+        # Bound the number of queued tasks so 50k recipients do not turn
+        # into 100k pending futures at once
+        slots = threading.BoundedSemaphore(self.workers * 4)
+
+        def deliver(channel, phone):
+            try:
+                result, retries = self.send_with_retry(channel, phone, message)
+                with stats_lock:
+                    self.record(stats, failures, delivered, channel, phone, result, retries)
+            finally:
+                slots.release()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='notify') as pool:
+            for phone in phones:
+                # SMS and WhatsApp for the same farmer go out in parallel
+                for channel in channels:
+                    slots.acquire()
+                    pool.submit(deliver, channel, phone)
+        wall_time_ms = (time.perf_counter() - started) * 1000
+
+        self.release_undelivered(phones, delivered, message_hash)
+        return self.summary(recipients, phones, stats, failures, wall_time_ms)
+
+    def recipients(self, phones, district, message_hash):
+        """(all recipients, those not yet sent this content)"""
+        if phones is None:
+            phones = self.farmers_in_district(district) if district else []
+        phones = list(dict.fromkeys(phones))  # de-duplicate, keep order
+        return phones, self.deduplicator.filter(phones, message_hash)
+
+    def record(self, stats, failures, delivered, channel, phone, result, retries):
+        """Add one delivery outcome to the dispatch stats"""
+        channel_stats = stats[channel]
+        channel_stats['retries'] += retries
+        if result.get('status') == 'success':
+            channel_stats['sent'] += 1
+            delivered.add(phone)
+        else:
+            channel_stats['failed'] += 1
+            if len(failures) < MAX_REPORTED_FAILURES:
+                failures.append({'phone': phone, 'channel': channel, 'error': result.get('error')})
+
+    def release_undelivered(self, phones, delivered, message_hash):
+        """Drop the de-duplication claims of farmers no channel reached"""
+        for phone in phones:
+            if phone not in delivered:
+                self.deduplicator.release(phone, message_hash)
+
+    def summary(self, recipients, phones, stats, failures, wall_time_ms):
+        """Aggregate delivery stats of one dispatch"""
+        logger.info(f"Dispatched alert to {len(phones)} recipients in {wall_time_ms:.0f} ms")
+
+        return {
+            'recipients': len(recipients),
+            'duplicates_skipped': len(recipients) - len(phones),
+            'channels': stats,
+            'sent': sum(s['sent'] for s in stats.values()),
+            'failed': sum(s['failed'] for s in stats.values()),
+            'failures': failures,
+            'wall_time_ms': round(wall_time_ms, 1)
+        }
+
+    def dispatch_weather_alert(self, district, alert_data, phones=None):
+        """Render a district's weather alert once and send it to all its farmers"""
+        message_hash, message = render_weather_alert(district, alert_data)
+        return self.dispatch(message, phones=phones, district=district, message_hash=message_hash)
+
+class AsyncBulkDispatcher(BulkDispatcher):
+    def __init__(self, api=None, concurrency=None, **kwargs):
+        """BulkDispatcher for the async mode: sends are coroutines on one loop
+
+        Up to concurrency sends are in flight at once instead of one per
+        worker thread; rate limits, retries and stats are the same.
+        """
+        super().__init__(api=api or async_notification_api, **kwargs)
+        self.concurrency = concurrency or Config.ASYNC_NOTIFICATION_CONCURRENCY
+
+    async def send_with_retry(self, channel, phone, message):
+        """Send one message, retrying transient failures with backoff and jitter"""
+        bucket = self.buckets[channel]
+        send = self.senders[channel]
+        result = None
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire_async()
+            try:
+                result = await send(phone, message)
+            except Exception as e:
+                result = {'status': 'error', 'error': str(e), 'retryable': is_transient(e), 'phone': phone}
+            if result.get('status') == 'success' or not result.get('retryable'):
+                return result, attempt
+            if attempt < self.max_retries:
+                await asyncio.sleep(self.backoff_base * (2 ** attempt) * (0.5 + random.random()))
+        return result, self.max_retries
+
+    async def dispatch(self, message, phones=None, district=None, channels=('sms', 'whatsapp'), message_hash=None):
+        """Send one message to many farmers over every channel concurrently"""
+        if phones is None and district:
+            # The farmer lookup is a blocking SQLite query
+            phones = await asyncio.get_running_loop().run_in_executor(None, self.farmers_in_district, district)
+        message_hash = message_hash or content_hash(message)
+        recipients, phones = self.recipients(phones, district, message_hash)
+
+        stats = {
+            channel: {'sent': 0, 'failed': 0, 'retries': 0}
+            for channel in channels
+        }
+        failures = []
+        delivered = set()
+        # A fixed set of sender coroutines pulls from one iterator, so 50k
+        # recipients do not become 100k tasks at once
+        jobs = ((channel, phone) for phone in phones for channel in channels)
+
+        async def sender():
+            for channel, phone in jobs:
+                result, retries = await self.send_with_retry(channel, phone, message)
+                self.record(stats, failures, delivered, channel, phone, result, retries)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(min(self.concurrency, len(phones) * len(channels)))))
+        wall_time_ms = (time.perf_counter() - started) * 1000
+        self.release_undelivered(phones, delivered, message_hash)
+        return self.summary(recipients, phones, stats, failures, wall_time_ms)
+
+    async def dispatch_weather_alert(self, district, alert_data, phones=None):
+        """Render a district's weather alert once and send it to all its farmers"""
+        message_hash, message = render_weather_alert(district, alert_data)
+        return await self.dispatch(message, phones=phones, district=district, message_hash=message_hash)
+
+# Global bulk dispatcher instance
+bulk_dispatcher = BulkDispatcher()
+async_bulk_dispatcher = AsyncBulkDispatcher()
+
+def dispatch_bulk_alert(message, phones=None, district=None):
+    """Public interface for bulk alert delivery"""
+    return bulk_dispatcher.dispatch(message, phones=phones, district=district)
+
+def dispatch_weather_alert(district, alert_data, phones=None):
+    """Public interface for bulk weather alert delivery"""
+    return bulk_dispatcher.dispatch_weather_alert(district, alert_data, phones=phones)
+
+async def dispatch_bulk_alert_async(message, phones=None, district=None):
+    """Public interface for bulk alert delivery in the async mode"""
+    return await async_bulk_dispatcher.dispatch(message, phones=phones, district=district)
+
+async def dispatch_weather_alert_async(district, alert_data, phones=None):
+    """Public interface for bulk weather alert delivery in the async mode"""
+    return await async_bulk_dispatcher.dispatch_weather_alert(district, alert_data, phones=phones)
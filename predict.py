@@ -1,100 +1,310 @@
 # predict.py - Model prediction interface for crop recommendation
-import pandas as pd
 import numpy as np
-import joblib
+import gc
 import os
+import threading
+import time
 import logging
+from collections import Counter
 from datetime import datetime
+from functools import wraps
+
+from config import Config
+from models.forest_engine import FlatForest
+from models.feature_pipeline import FeaturePipeline, normalize_category
+from models.model_registry import model_registry
+from models.prediction_cache import PredictionCache, quantize
+from utils.request_timing import timed
+from utils.metrics import metrics, histogram, counter
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Target NPK values for different crops (kg/ha)
+CROP_REQUIREMENTS = {
+    'wheat': {'N': 120, 'P': 60, 'K': 60},
+    'rice': {'N': 100, 'P': 50, 'K': 50},
+    'maize': {'N': 150, 'P': 75, 'K': 75},
+    'cotton': {'N': 80, 'P': 40, 'K': 40},
+    'bajra': {'N': 60, 'P': 30, 'K': 30},
+    'mustard': {'N': 80, 'P': 40, 'K': 40},
+    'gram': {'N': 20, 'P': 60, 'K': 20}
+}
+DEFAULT_CROP_REQUIREMENTS = {'N': 100, 'P': 50, 'K': 50}
+
+# Average rainfall (mm) and temperature (°C) per district
+DISTRICT_CLIMATE = {
+    'patiala': {'rainfall': 650, 'temperature': 28},
+    'ludhiana': {'rainfall': 600, 'temperature': 29},
+    'amritsar': {'rainfall': 700, 'temperature': 27},
+    'jalandhar': {'rainfall': 650, 'temperature': 28},
+    'fazilka': {'rainfall': 400, 'temperature': 32},
+    'bathinda': {'rainfall': 450, 'temperature': 31},
+    'moga': {'rainfall': 600, 'temperature': 29},
+    'sangrur': {'rainfall': 550, 'temperature': 30},
+    'firozpur': {'rainfall': 400, 'temperature': 32},
+    'hoshiarpur': {'rainfall': 800, 'temperature': 26}
+}
+DEFAULT_CLIMATE = {'rainfall': 600, 'temperature': 28}
+
+INFERENCE_SECONDS = histogram('smartcrop_model_inference_duration_seconds',
+                              'Single crop prediction latency by method', ['method'])
+PREDICTIONS = counter('smartcrop_model_predictions_total', 'Crop predictions by method', ['method'])
+
+def observe_inference(predict):
+    """Record a single prediction's latency under the method that produced it"""
+    @wraps(predict)
+    def wrapper(self, *args, **kwargs):
+        if not self.record_metrics:
+            return predict(self, *args, **kwargs)
+        started = time.perf_counter()
+        result = predict(self, *args, **kwargs)
+        method = result.get('method', 'default')
+        INFERENCE_SECONDS.observe(time.perf_counter() - started, method=method)
+        PREDICTIONS.inc(method=method)
+        return result
+    return wrapper
+
+def load_pickled(path, mmap_mode=None):
+    """joblib.load, importing joblib (and sklearn, when unpickling) only
+    when a pickled artifact is actually read, not at worker startup"""
+    import joblib
+    return joblib.load(path, mmap_mode=mmap_mode)
+
+class ModelSet:
+    def __init__(self, model=None, pipeline=None, scaler=None, label_encoder=None, model_version=None,
+                 estimator_path=None):
+        """One consistent set of loaded artifacts, swapped in as a unit
+
+        When model is a flat forest, estimator_path names the pickled
+        sklearn model of the same version; it is read on the first large
+        batch and kept as estimator.
+        """
+        self.model = model
+        self.pipeline = pipeline
+        self.scaler = scaler
+        self.label_encoder = label_encoder
+        self.model_version = model_version
+        self.estimator_path = estimator_path
+        self.estimator = None
+
 class CropPredictor:
-    def __init__(self, model_path='models/crop_recommendation_model.pkl', 
-                 scaler_path='models/feature_scaler.pkl',
-                 encoder_path='models/label_encoder.pkl'):
-        self.model_path = model_path
-        self.scaler_path = scaler_path
-        self.encoder_path = encoder_path
-        self.model = None
-        self.scaler = None
-        self.label_encoder = None
-        self.load_models()
+    def __init__(self, model_path=None, scaler_path=None, encoder_path=None, forest_path=None,
+                 pipeline_path=None, mmap_mode=None, lazy=True, registry=None, record_metrics=True):
+        """Crop predictor backed by the trained model artifacts
+
+        With lazy=True nothing is read from disk until the first prediction.
+        mmap_mode='r' memory-maps the numpy arrays inside the artifacts
+        instead of copying them into each process. When a flattened forest
+        has been exported it is used in place of the pickled model, except
+        for batches over FLAT_FOREST_MAX_BATCH rows, and a feature pipeline
+        artifact replaces the separate scaler and encoder.
+        If the registry has a promoted version, its artifacts take
+        precedence over the configured paths. record_metrics=False keeps
+        side traffic (e.g. shadow evaluation) out of the serving metrics.
+        """
+        self.model_path = model_path or Config.MODEL_PATH
+        self.forest_path = forest_path or Config.FOREST_PATH
+        self.scaler_path = scaler_path or Config.SCALER_PATH
+        self.encoder_path = encoder_path or Config.ENCODER_PATH
+        self.pipeline_path = pipeline_path or Config.FEATURE_PIPELINE_PATH
+        self.mmap_mode = mmap_mode
+        self.registry = registry
+        self.record_metrics = record_metrics
+        self.models = ModelSet()
+        self.loaded = False
+        self.version = 0  # bumped on every (re)load
+        self._load_lock = threading.Lock()
+        self._estimator_lock = threading.Lock()
+        if not lazy:
+            self.load_models()
     
-    def load_models(self):
-        """Load trained models"""
-        try:
-            if os.path.exists(self.model_path):
-                self.model = joblib.load(self.model_path)
-                logger.info("Model loaded successfully")
-            else:
-                logger.warning("Model file not found. Using fallback prediction.")
-            
+    @property
+    def model(self):
+        return self.models.model
+    
+    @property
+    def pipeline(self):
+        return self.models.pipeline
+    
+    @property
+    def scaler(self):
+        return self.models.scaler
+    
+    @property
+    def label_encoder(self):
+        return self.models.label_encoder
+    
+    @property
+    def model_version(self):
+        """Registry version being served, if any"""
+        return self.models.model_version
+    
+    @property
+    def reloading(self):
+        return self._load_lock.locked()
+    
+    def ensure_loaded(self):
+        """Load the models on first use, once per process"""
+        if self.loaded:
+            return
+        with self._load_lock:
+            if not self.loaded:
+                self.load_models()
+    
+    def read_models(self):
+        """Read a complete ModelSet from disk without touching the served one"""
+        artifacts = self.registry.artifacts() if self.registry else None
+        if artifacts:
+            logger.info(f"Loading model version {artifacts['version']} from registry")
+            model_path, pipeline_path, forest_path = artifacts['model'], artifacts['pipeline'], artifacts['forest']
+        else:
+            model_path, pipeline_path, forest_path = self.model_path, self.pipeline_path, self.forest_path
+        models = ModelSet(model_version=artifacts['version'] if artifacts else None)
+        
+        if FlatForest.exists(forest_path):
+            models.model = FlatForest.load(forest_path, mmap_mode=self.mmap_mode)
+            if os.path.exists(model_path):
+                models.estimator_path = model_path
+            logger.info("Flat forest model loaded successfully")
+        elif os.path.exists(model_path):
+            models.model = load_pickled(model_path, mmap_mode=self.mmap_mode)
+            logger.info("Model loaded successfully")
+        else:
+            logger.warning("Model file not found. Using fallback prediction.")
+        
+        if os.path.exists(pipeline_path):
+            models.pipeline = FeaturePipeline.load(pipeline_path)
+            logger.info("Feature pipeline loaded successfully")
+        else:
+            # Artifacts trained before the feature pipeline existed
             if os.path.exists(self.scaler_path):
-                self.scaler = joblib.load(self.scaler_path)
+                models.scaler = load_pickled(self.scaler_path, mmap_mode=self.mmap_mode)
                 logger.info("Scaler loaded successfully")
             
             if os.path.exists(self.encoder_path):
-                self.label_encoder = joblib.load(self.encoder_path)
+                models.label_encoder = load_pickled(self.encoder_path, mmap_mode=self.mmap_mode)
                 logger.info("Label encoder loaded successfully")
-                
+        return models
+    
+    def load_models(self):
+        """Load trained models and swap them in with one assignment
+
+        Requests keep using the previous ModelSet until the new one is
+        complete. A failed reload keeps serving the previous models;
+        returns whether a new set was swapped in.
+        """
+        try:
+            models = self.read_models()
         except Exception as e:
             logger.error(f"Error loading models: {str(e)}")
+            if self.loaded:
+                return False
+            models = ModelSet()
+        self.models = models
+        self.loaded = True
+        self.version += 1
+        return True
+    
+    def reload(self):
+        """Re-read the model artifacts, e.g. after retraining"""
+        with self._load_lock:
+            return self.load_models()
+    
+    def reload_async(self):
+        """Reload in a background thread; requests are never blocked"""
+        thread = threading.Thread(target=self.reload, name='model-reload', daemon=True)
+        thread.start()
+        return thread
+    
+    def batch_model(self, models, rows):
+        """Model to score rows with: the flat forest for small batches,
+        the sklearn estimator, loaded on first use, for large ones"""
+        if rows <= Config.FLAT_FOREST_MAX_BATCH or models.estimator_path is None:
+            return models.model
+        if models.estimator is None:
+            with self._estimator_lock:
+                if models.estimator is None:
+                    try:
+                        models.estimator = load_pickled(models.estimator_path, mmap_mode=self.mmap_mode)
+                    except Exception as e:
+                        logger.error(f"Error loading batch model: {str(e)}")
+                        models.estimator_path = None
+                        return models.model
+        return models.estimator
     
     def get_district_features(self, district):
         """Get district-specific features"""
-        district_data = {
-            'patiala': {'rainfall': 650, 'temperature': 28},
-            'ludhiana': {'rainfall': 600, 'temperature': 29},
-            'amritsar': {'rainfall': 700, 'temperature': 27},
-            'jalandhar': {'rainfall': 650, 'temperature': 28},
-            'fazilka': {'rainfall': 400, 'temperature': 32},
-            'bathinda': {'rainfall': 450, 'temperature': 31},
-            'moga': {'rainfall': 600, 'temperature': 29},
-            'sangrur': {'rainfall': 550, 'temperature': 30},
-            'firozpur': {'rainfall': 400, 'temperature': 32},
-            'hoshiarpur': {'rainfall': 800, 'temperature': 26}
+        return DISTRICT_CLIMATE.get(district.lower(), DEFAULT_CLIMATE)
+    
+    def model_features(self, nitrogen, phosphorus, potassium, ph, districts, soil_types, models=None):
+        """Scaled model features for rows the model can score
+
+        Returns (features, known) where known marks rows whose district
+        and soil type were seen in training; features holds only those
+        rows. Returns None when no feature artifacts are loaded. Pass the
+        ModelSet that will score the features so a concurrent reload
+        cannot mix artifacts from two versions.
+        """
+        models = models or self.models
+        climate = [self.get_district_features(district) for district in districts]
+        columns = {
+            'nitrogen': nitrogen,
+            'phosphorus': phosphorus,
+            'potassium': potassium,
+            'ph': ph,
+            'rainfall': [c['rainfall'] for c in climate],
+            'temperature': [c['temperature'] for c in climate],
+            'district': districts,
+            'soil_type': soil_types
         }
         
-        return district_data.get(district.lower(), {'rainfall': 600, 'temperature': 28})
+        if models.pipeline is not None:
+            features, known = models.pipeline.transform(columns)
+            return features[known], known
+        
+        if models.label_encoder is not None and models.scaler is not None:
+            # Legacy artifacts: one LabelEncoder fitted on districts only
+            classes = models.label_encoder.classes_
+            districts = np.asarray(districts, dtype=object)
+            soil_types = np.asarray(soil_types, dtype=object)
+            known = np.isin(districts, classes) & np.isin(soil_types, classes)
+            features = np.column_stack([
+                np.asarray(columns[name], dtype=float)[known]
+                for name in ['nitrogen', 'phosphorus', 'potassium', 'ph', 'rainfall', 'temperature']
+            ] + [
+                models.label_encoder.transform(districts[known]),
+                models.label_encoder.transform(soil_types[known])
+            ])
+            return models.scaler.transform(features), known
+        
+        return None
     
+    @timed('inference')
+    @observe_inference
     def predict_crop(self, nitrogen, phosphorus, potassium, ph, district, soil_type, last_crop=None):
         """Predict best crop for given conditions"""
+        self.ensure_loaded()
+        models = self.models
         try:
-            # Get district features
-            district_features = self.get_district_features(district)
-            
-            # Prepare features
-            features = [
-                float(nitrogen),
-                float(phosphorus),
-                float(potassium),
-                float(ph),
-                district_features['rainfall'],
-                district_features['temperature']
-            ]
-            
-            # Encode district and soil type if encoders available
-            if self.label_encoder and self.scaler and self.model:
+            if models.model is not None:
                 try:
-                    district_encoded = self.label_encoder.transform([district])[0]
-                    soil_type_encoded = self.label_encoder.transform([soil_type])[0]
-                    features.extend([district_encoded, soil_type_encoded])
-                    
-                    # Scale features
-                    features_scaled = self.scaler.transform([features])
+                    encoded = self.model_features(
+                        [float(nitrogen)], [float(phosphorus)], [float(potassium)], [float(ph)],
+                        [district], [soil_type], models
+                    )
                     
                     # Make prediction
-                    crop_prediction = self.model.predict(features_scaled)[0]
-                    probabilities = self.model.predict_proba(features_scaled)[0]
-                    confidence = max(probabilities)
-                    
-                    return {
-                        'crop': crop_prediction,
-                        'confidence': confidence,
-                        'method': 'ml_model',
-                        'probabilities': dict(zip(self.model.classes_, probabilities))
-                    }
+                    if encoded is not None and encoded[1][0]:
+                        probabilities = models.model.predict_proba(encoded[0])[0]
+                        best = probabilities.argmax()
+                        
+                        return {
+                            'crop': models.model.classes_[best],
+                            'confidence': probabilities[best],
+                            'method': 'ml_model',
+                            'probabilities': dict(zip(models.model.classes_, probabilities))
+                        }
                 except Exception as e:
                     logger.warning(f"ML prediction failed, using fallback: {str(e)}")
             
@@ -141,23 +351,120 @@ class CropPredictor:
                 'reasoning': 'Default recommendation due to prediction error'
             }
     
+    @timed('inference')
+    def predict_crops_batch(self, samples):
+        """Predict best crops for many samples with a single model pass
+
+        Each sample is a dict with nitrogen, phosphorus, potassium, ph,
+        district, soil_type and optional last_crop. Results are returned
+        in input order.
+        """
+        if not samples:
+            return []
+        self.ensure_loaded()
+        models = self.models
+        
+        nitrogen = np.array([float(s['nitrogen']) for s in samples])
+        phosphorus = np.array([float(s['phosphorus']) for s in samples])
+        potassium = np.array([float(s['potassium']) for s in samples])
+        ph = np.array([float(s['ph']) for s in samples])
+        districts = np.array([s['district'] for s in samples], dtype=object)
+        soil_types = np.array([s['soil_type'] for s in samples], dtype=object)
+        last_crops = np.array([s.get('last_crop') or '' for s in samples], dtype=object)
+        
+        results = [None] * len(samples)
+        ml_rows = np.zeros(len(samples), dtype=bool)
+        
+        if models.model is not None:
+            try:
+                # Rows with an unseen district or soil type cannot be encoded
+                # and drop through to the rule-based fallback below
+                encoded = self.model_features(nitrogen, phosphorus, potassium, ph, districts, soil_types, models)
+                if encoded is not None:
+                    features_scaled, ml_rows = encoded
+                
+                if ml_rows.any():
+                    # One predict_proba pass for the whole batch
+                    model = self.batch_model(models, len(features_scaled))
+                    probabilities = model.predict_proba(features_scaled)
+                    best = probabilities.argmax(axis=1)
+                    crops = model.classes_[best]
+                    confidences = probabilities[np.arange(len(best)), best]
+                    
+                    for row, crop, confidence, row_probabilities in zip(
+                            np.flatnonzero(ml_rows), crops, confidences, probabilities):
+                        results[row] = {
+                            'crop': crop,
+                            'confidence': float(confidence),
+                            'method': 'ml_model',
+                            'probabilities': dict(zip(model.classes_, row_probabilities.tolist()))
+                        }
+            except Exception as e:
+                logger.warning(f"Batch ML prediction failed, using fallback: {str(e)}")
+                ml_rows = np.zeros(len(samples), dtype=bool)
+        
+        # Fallback rule-based prediction for everything the model did not cover
+        fallback_rows = np.flatnonzero(~ml_rows)
+        if len(fallback_rows):
+            fallback = self.fallback_prediction_batch(
+                ph[fallback_rows], soil_types[fallback_rows], last_crops[fallback_rows]
+            )
+            for row, prediction in zip(fallback_rows, fallback):
+                results[row] = prediction
+        
+        if self.record_metrics:
+            for method, count in Counter(result['method'] for result in results).items():
+                PREDICTIONS.inc(count, method=method)
+        return results
+    
+    def fallback_prediction_batch(self, ph, soil_types, last_crops):
+        """Vectorized version of fallback_prediction"""
+        try:
+            ph = np.asarray(ph, dtype=float)
+            soil = np.char.lower(np.asarray(soil_types, dtype=str))
+            
+            crops = np.select(
+                [
+                    np.isin(soil, ['sandy', 'sandy loam']),
+                    np.isin(soil, ['loamy', 'loam to clay loam']),
+                    (soil == 'alluvial') & (ph > 7.5)
+                ],
+                ['Pearl Millet (Bajra)', 'Rice', 'Wheat'],
+                default='Maize'
+            )
+            
+            # Adjust based on last crop (crop rotation)
+            after_wheat = np.char.find(np.char.lower(np.asarray(last_crops, dtype=str)), 'wheat') >= 0
+            crops = np.where(after_wheat, np.where(crops == 'Wheat', 'Rice', 'Maize'), crops)
+            
+            return [
+                {
+                    'crop': str(crop),
+                    'confidence': 0.75,  # Lower confidence for rule-based
+                    'method': 'rule_based',
+                    'reasoning': f'Based on {soil_type} soil type and regional patterns'
+                }
+                for crop, soil_type in zip(crops, soil_types)
+            ]
+            
+        except Exception as e:
+            logger.error(f"Error in batch fallback prediction: {str(e)}")
+            return [
+                {
+                    'crop': 'Maize',
+                    'confidence': 0.5,
+                    'method': 'default',
+                    'reasoning': 'Default recommendation due to prediction error'
+                }
+                for _ in range(len(soil_types))
+            ]
+    
     def get_fertilizer_recommendation(self, nitrogen, phosphorus, potassium, crop):
         """Get fertilizer recommendations based on soil test and crop"""
         try:
-            # Target NPK values for different crops (kg/ha)
-            crop_requirements = {
-                'wheat': {'N': 120, 'P': 60, 'K': 60},
-                'rice': {'N': 100, 'P': 50, 'K': 50},
-                'maize': {'N': 150, 'P': 75, 'K': 75},
-                'cotton': {'N': 80, 'P': 40, 'K': 40},
-                'bajra': {'N': 60, 'P': 30, 'K': 30},
-                'mustard': {'N': 80, 'P': 40, 'K': 40},
-                'gram': {'N': 20, 'P': 60, 'K': 20}
-            }
-            
             # Get requirements for the crop (case-insensitive)
             crop_lower = crop.lower()
-            requirements = crop_requirements.get(crop_lower, {'N': 100, 'P': 50, 'K': 50})
+            requirements = CROP_REQUIREMENTS.get(crop_lower, DEFAULT_CROP_REQUIREMENTS)
             
             # Calculate gaps
             n_gap = max(0, requirements['N'] - float(nitrogen))
@@ -186,13 +493,166 @@ class CropPredictor:
                 'recommendations': {}
             }
 
-# Global predictor instance
-predictor = CropPredictor()
+    def get_fertilizer_recommendations_batch(self, nitrogen, phosphorus, potassium, crops):
+        """Vectorized fertilizer recommendations, one per crop in input order"""
+        try:
+            requirements = np.array([
+                [req['N'], req['P'], req['K']]
+                for req in (CROP_REQUIREMENTS.get(crop.lower(), DEFAULT_CROP_REQUIREMENTS) for crop in crops)
+            ], dtype=float).reshape(-1, 3)
+            soil = np.column_stack([
+                np.asarray(nitrogen, dtype=float),
+                np.asarray(phosphorus, dtype=float),
+                np.asarray(potassium, dtype=float)
+            ])
+            
+            # Calculate gaps and product quantities (Urea 46% N, DAP 18% P, MOP 60% K)
+            gaps = np.maximum(0, requirements - soil)
+            products = np.round(gaps / np.array([46, 18, 60]) * 100, 1)
+            totals = gaps.sum(axis=1)
+            
+            return [
+                {
+                    'nitrogen_gap': n_gap,
+                    'phosphorus_gap': p_gap,
+                    'potassium_gap': k_gap,
+                    'total_fertilizer': total,
+                    'recommendations': {'urea': urea, 'dap': dap, 'mop': mop}
+                }
+                for (n_gap, p_gap, k_gap), (urea, dap, mop), total
+                in zip(gaps.tolist(), products.tolist(), totals.tolist())
+            ]
+            
+        except Exception as e:
+            logger.error(f"Error calculating batch fertilizer: {str(e)}")
+            return [
+                {
+                    'nitrogen_gap': 0,
+                    'phosphorus_gap': 0,
+                    'potassium_gap': 0,
+                    'total_fertilizer': 0,
+                    'recommendations': {}
+                }
+                for _ in crops
+            ]
+
+# Global predictor instance; models are loaded on first use
+predictor = CropPredictor(mmap_mode=Config.MODEL_MMAP_MODE, registry=model_registry)
+
+def get_predictor():
+    """Public interface for the shared predictor instance"""
+    return predictor
+
+def preload_models():
+    """Load the models now, e.g. in a pre-fork master process
+
+    Objects created before the fork are moved out of the garbage
+    collector's reach so collections in the workers do not write to
+    (and so un-share) their pages.
+    """
+    predictor.ensure_loaded()
+    gc.collect()
+    gc.freeze()
+    return predictor
+
+# Prediction caches; keys include the model version, so a reload
+# invalidates them
+crop_cache = PredictionCache()
+fertilizer_cache = PredictionCache()
+
+# Order of the values _crop_inputs returns
+CROP_INPUTS = ('nitrogen', 'phosphorus', 'potassium', 'ph', 'district', 'soil_type', 'last_crop')
+
+def _quantized_soil(nitrogen, phosphorus, potassium, ph=None):
+    """Soil values snapped to the configured lab resolution"""
+    npk = tuple(quantize(value, Config.PREDICTION_NPK_STEP) for value in (nitrogen, phosphorus, potassium))
+    if ph is None:
+        return npk
+    return npk + (quantize(ph, Config.PREDICTION_PH_STEP),)
+
+def _crop_inputs(nitrogen, phosphorus, potassium, ph, district, soil_type, last_crop=None):
+    """Crop cache key: quantized soil values and normalized categoricals
+
+    Predictions are computed from the key itself, so a cached result
+    never depends on which spelling of a district was seen first.
+    """
+    return _quantized_soil(nitrogen, phosphorus, potassium, ph) + tuple(
+        normalize_category(value) for value in (district, soil_type, last_crop or '')
+    )
 
 def get_crop_recommendation(nitrogen, phosphorus, potassium, ph, district, soil_type, last_crop=None):
     """Public interface for crop recommendation"""
-    return predictor.predict_crop(nitrogen, phosphorus, potassium, ph, district, soil_type, last_crop)
+    try:
+        key = _crop_inputs(nitrogen, phosphorus, potassium, ph, district, soil_type, last_crop)
+    except (TypeError, ValueError):
+        return predictor.predict_crop(nitrogen, phosphorus, potassium, ph, district, soil_type, last_crop)
+    
+    predictor.ensure_loaded()
+    return crop_cache.get_or_compute(key, predictor.version, lambda: predictor.predict_crop(*key))
 
 def get_fertilizer_recommendation(nitrogen, phosphorus, potassium, crop):
     """Public interface for fertilizer recommendation"""
-    return predictor.get_fertilizer_recommendation(nitrogen, phosphorus, potassium, crop)
+    try:
+        nitrogen, phosphorus, potassium = _quantized_soil(nitrogen, phosphorus, potassium)
+    except (TypeError, ValueError):
+        return predictor.get_fertilizer_recommendation(nitrogen, phosphorus, potassium, crop)
+    
+    key = (nitrogen, phosphorus, potassium, str(crop).lower())
+    return fertilizer_cache.get_or_compute(key, predictor.version, lambda: predictor.get_fertilizer_recommendation(
+        nitrogen, phosphorus, potassium, crop
+    ))
+
+def _cache_metrics():
+    """Prediction cache counters for the metrics registry"""
+    caches = {'crop': crop_cache, 'fertilizer': fertilizer_cache}
+    return {
+        'smartcrop_prediction_cache_hits_total': (
+            'Prediction cache hits', ['cache'], {(name,): cache.hits for name, cache in caches.items()}
+        ),
+        'smartcrop_prediction_cache_misses_total': (
+            'Prediction cache misses', ['cache'], {(name,): cache.misses for name, cache in caches.items()}
+        )
+    }
+
+metrics.register_collector(_cache_metrics)
+
+def get_prediction_cache_stats():
+    """Public interface for prediction cache counters"""
+    return {
+        'model_version': predictor.version,
+        'registry_version': predictor.model_version,
+        'crop': crop_cache.stats(),
+        'fertilizer': fertilizer_cache.stats()
+    }
+
+def reload_models(background=False):
+    """Public interface for reloading the models; invalidates the caches"""
+    if background:
+        return predictor.reload_async()
+    return predictor.reload()
+
+def get_crop_recommendations_batch(samples):
+    """Public interface for batch crop recommendation
+
+    Samples are quantized and normalized like get_crop_recommendation's
+    inputs, so both return the same prediction for the same sample.
+    """
+    try:
+        samples = [
+            dict(zip(CROP_INPUTS, _crop_inputs(*(sample[name] for name in CROP_INPUTS[:-1]), sample.get('last_crop'))))
+            for sample in samples
+        ]
+    except (KeyError, TypeError, ValueError):
+        pass  # predict_crops_batch reports the bad sample
+    return predictor.predict_crops_batch(samples)
+
+def get_fertilizer_recommendations_batch(nitrogen, phosphorus, potassium, crops):
+    """Public interface for batch fertilizer recommendation (quantized like the single one)"""
+    try:
+        nitrogen, phosphorus, potassium = (
+            [quantize(value, Config.PREDICTION_NPK_STEP) for value in values]
+            for values in (nitrogen, phosphorus, potassium)
+        )
+    except (TypeError, ValueError):
+        pass
+    return predictor.get_fertilizer_recommendations_batch(nitrogen, phosphorus, potassium, crops)
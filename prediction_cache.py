@@ -0,0 +1,77 @@
+# prediction_cache.py - Bounded LRU/TTL cache for model predictions
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+
+def quantize(value, step):
+    """Snap a measurement to the resolution soil labs report it at"""
+    return round(round(float(value) / step) * step, 6)
+
+class PredictionCache:
+    def __init__(self, max_entries=None, ttl=None):
+        """LRU cache with an optional TTL (seconds, 0 disables expiry)
+
+        Values are deep-copied in and out so callers can never mutate a
+        cached prediction.
+        """
+        self.max_entries = Config.PREDICTION_CACHE_SIZE if max_entries is None else max_entries
+        self.ttl = Config.PREDICTION_CACHE_TTL if ttl is None else ttl
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, version, compute):
+        """Return the cached value for key, computing and storing it on a miss
+
+        version is the model version; a new version drops every entry, so
+        predictions from a previous model are never served.
+        """
+        if self.max_entries <= 0:
+            return compute()
+        now = time.monotonic()
+
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            entry = self._entries.get(key)
+            if entry is not None and (not self.ttl or now - entry[0] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+
+        value = compute()
+
+        with self._lock:
+            self.misses += 1
+            if version == self._version:
+                self._entries[key] = (now, copy.deepcopy(value))
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss/eviction counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
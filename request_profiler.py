@@ -0,0 +1,214 @@
+# request_profiler.py - On-demand cProfile capture of individual requests
+import glob
+import marshal
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import cProfile
+import logging
+
+from flask import request
+
+from config import Config
+from database.write_behind import WriteBehindQueue
+from utils.admin_auth import is_admin_request
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# WSGI environ key holding the active profiler of a request
+PROFILE_KEY = 'smartcrop.profile'
+
+# Sort keys accepted by hottest(), as pstats stat tuple indexes
+SORT_FIELDS = {'tottime': 2, 'cumtime': 3, 'calls': 1}
+
+def endpoint_slug(rule):
+    """File-name-safe form of a URL rule, e.g. /api/soil-data/<district> -> api_soil_data_district"""
+    if not rule:
+        return 'unmatched'
+    return re.sub(r'[^A-Za-z0-9]+', '_', rule).strip('_') or 'root'
+
+def parse_profile_name(name):
+    """Fields encoded in a profile file name"""
+    stamp, pid, method, slug = name[:-len('.prof')].split('-', 3)
+    return {'file': name, 'timestamp': stamp, 'pid': int(pid), 'method': method, 'endpoint': slug}
+
+class RequestProfiler:
+    def __init__(self, directory=None, sample_rate=None, keep=None):
+        """Profile selected requests and write one pstats file per request
+
+        A request is profiled when it carries the X-Profile header and
+        passes the admin check, or when it falls into the sampled share
+        of traffic. Files are written in the marshalled pstats format, so
+        pstats, snakeviz and gprof2dot open them directly. Only one
+        request per process is profiled at a time; requests arriving
+        while a profile runs are served unprofiled.
+        """
+        self.directory = directory or Config.PROFILE_DIR
+        self.sample_rate = Config.PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.keep = keep or Config.PROFILE_KEEP
+        self._active = threading.Lock()
+        # Dumping a profile takes milliseconds; do it off the request
+        self.queue = WriteBehindQueue(
+            self.write_profiles, batch_size=10, flush_interval_ms=100,
+            max_queue_size=100, name='profile-writer', drop_when_full=True
+        )
+        self.profiled = 0
+        self.busy = 0
+
+    def before_request(self):
+        # The app and the blueprint may both be instrumented; profile once
+        current = request._get_current_object()
+        environ = current.environ
+        if PROFILE_KEY in environ:
+            return
+        if environ.get('HTTP_X_PROFILE'):
+            if not is_admin_request(current):
+                return
+        elif not self.sample_rate or random.random() >= self.sample_rate:
+            return
+
+        if not self._active.acquire(blocking=False):
+            self.busy += 1
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) owns the process
+            self._active.release()
+            return
+        environ[PROFILE_KEY] = profile
+
+    def after_request(self, response):
+        current = request._get_current_object()
+        environ = current.environ
+        profile = environ.pop(PROFILE_KEY, None)
+        if profile is None:
+            return response
+        try:
+            profile.disable()
+        finally:
+            self._active.release()
+
+        now = time.time()
+        rule = current.url_rule
+        name = '{}{:03d}-{}-{}-{}.prof'.format(
+            time.strftime('%Y%m%dT%H%M%S', time.gmtime(now)), int(now * 1000) % 1000,
+            os.getpid(), environ.get('REQUEST_METHOD'), endpoint_slug(rule.rule if rule is not None else None)
+        )
+        profile.create_stats()
+        self.queue.put((name, profile.stats))
+        self.profiled += 1
+        response.headers['X-Profile-Id'] = name
+        return response
+
+    def init_app(self, target):
+        """Instrument a Flask app or blueprint"""
+        target.before_request(self.before_request)
+        target.after_request(self.after_request)
+
+    def write_profiles(self, records):
+        """Dump profiles and prune old ones (runs on the writer thread)"""
+        os.makedirs(self.directory, exist_ok=True)
+        for name, stats in records:
+            path = os.path.join(self.directory, name)
+            with open(f'{path}.tmp', 'wb') as f:
+                marshal.dump(stats, f)
+            os.replace(f'{path}.tmp', path)
+        for name in self.list_profiles()[self.keep:]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass  # already pruned by another worker
+
+    def list_profiles(self, endpoint=None):
+        """Profile file names, newest first, optionally for one URL rule"""
+        names = sorted((os.path.basename(path) for path in glob.glob(os.path.join(self.directory, '*.prof'))),
+                       reverse=True)
+        if endpoint:
+            suffix = f'-{endpoint_slug(endpoint)}.prof'
+            names = [name for name in names if name.endswith(suffix)]
+        return names
+
+    def profile_path(self, name):
+        """Path of a stored profile, or None for unknown names"""
+        if name not in self.list_profiles():
+            return None
+        return os.path.join(self.directory, name)
+
+    def hottest(self, limit=20, recent=None, endpoint=None, sort='tottime'):
+        """Functions with the most time summed over the recent profiles
+
+        Raises ValueError for an unknown sort key.
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Unknown sort key: {sort}")
+        recent = recent or Config.PROFILE_AGGREGATE_RECENT
+        names = self.list_profiles(endpoint)[:recent]
+
+        stats = None
+        for name in names:
+            try:
+                loaded = pstats.Stats(os.path.join(self.directory, name))
+            except (OSError, EOFError, ValueError, TypeError):
+                continue  # pruned or unreadable
+            if stats is None:
+                stats = loaded
+            else:
+                stats.add(loaded)
+
+        result = {'profiles': 0, 'sort': sort, 'total_ms': 0.0, 'functions': []}
+        if stats is None:
+            return result
+
+        index = SORT_FIELDS[sort]
+        ranked = sorted(stats.stats.items(), key=lambda item: item[1][index], reverse=True)[:limit]
+        total = stats.total_tt or 1.0
+        result.update(
+            profiles=len(stats.files),
+            total_ms=round(stats.total_tt * 1000, 3),
+            functions=[
+                {
+                    'function': pstats.func_std_string(func),
+                    'calls': nc,
+                    'primitive_calls': cc,
+                    'tottime_ms': round(tt * 1000, 3),
+                    'cumtime_ms': round(ct * 1000, 3),
+                    'per_call_ms': round(tt * 1000 / nc, 4) if nc else None,
+                    'share': round(tt / total, 4)
+                }
+                for func, (cc, nc, tt, ct, _) in ranked
+            ]
+        )
+        return result
+
+    def stats(self):
+        return {
+            'sample_rate': self.sample_rate,
+            'profiled': self.profiled,
+            'skipped_busy': self.busy,
+            'writer': self.queue.stats()
+        }
+
+# Global request profiler instance
+request_profiler = RequestProfiler()
+
+def init_request_profiling(target):
+    """Public interface for profiling the requests of an app or blueprint"""
+    request_profiler.init_app(target)
+
+def get_hottest_functions(limit=20, recent=None, endpoint=None, sort='tottime'):
+    """Public interface for the hottest functions over recent profiles"""
+    return request_profiler.hottest(limit, recent, endpoint, sort)
+
+def list_request_profiles(endpoint=None):
+    """Public interface for the stored profiles, newest first"""
+    return [parse_profile_name(name) for name in request_profiler.list_profiles(endpoint)]
+
+def get_profile_path(name):
+    """Public interface for the path of one stored profile"""
+    return request_profiler.profile_path(name)
@@ -0,0 +1,36 @@
+# request_timing.py - Per-request sub-timings (model inference, database)
+import contextvars
+import time
+from contextlib import contextmanager
+
+# Seconds spent per kind during the current request; None outside a request
+_timings = contextvars.ContextVar('request_timings', default=None)
+
+def start_request():
+    """Begin collecting sub-timings for the current request"""
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+def end_request():
+    """Stop collecting and return what the request accumulated"""
+    timings = _timings.get()
+    _timings.set(None)
+    return timings or {}
+
+@contextmanager
+def timed(kind):
+    """Add the block's wall time to the current request's kind total
+
+    Outside a request (background threads, scripts) this does nothing.
+    Also usable as a decorator.
+    """
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[kind] = timings.get(kind, 0.0) + time.perf_counter() - started
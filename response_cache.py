@@ -0,0 +1,97 @@
+# response_cache.py - Precomputed JSON bodies with ETags for reference data
+import hashlib
+import threading
+import logging
+
+from flask import Response, current_app, request
+
+from config import Config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    def __init__(self, max_age=None, max_entries=None):
+        """Serialized JSON responses keyed by request, tagged with a data version
+
+        A body is built once per key and data version and served as-is
+        until the version changes, so a reload of the underlying data
+        invalidates it. The strong ETag is a hash of the body. Payloads
+        must not carry per-request values (e.g. the current time) so that
+        every worker builds the same bytes, and hence the same ETag.
+        """
+        self.max_age = Config.REFERENCE_CACHE_MAX_AGE if max_age is None else max_age
+        self.max_entries = max_entries or Config.REFERENCE_CACHE_ENTRIES
+        self._entries = {}  # key -> (version, etag, body)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+        self.not_modified = 0
+
+    def get(self, key, version, build):
+        """(etag, body) for key at version, or None when build() returns None
+
+        build() returns the payload to serialize; it is only called when
+        the cached body is missing or was built from another version.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1], entry[2]
+
+        payload = build()
+        if payload is None:
+            return None
+        # Same bytes as jsonify would produce
+        body = current_app.json.response(payload).get_data()
+        etag = hashlib.sha1(body).hexdigest()
+
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                # Evict the oldest entry
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (version, etag, body)
+            self.builds += 1
+        return etag, body
+
+    def respond(self, key, version, build):
+        """Cached JSON response for key, 304 if the client's ETag matches
+
+        Returns None when build() has no payload (e.g. an unknown key).
+        """
+        cached = self.get(key, version, build)
+        if cached is None:
+            return None
+
+        etag, body = cached
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = self.max_age
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            self.not_modified += 1
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'builds': self.builds,
+            'not_modified': self.not_modified
+        }
+
+# Global reference data response cache
+response_cache = ResponseCache()
+
+def cached_json_response(key, version, build):
+    """Public interface for serving a cached JSON body with an ETag"""
+    return response_cache.respond(key, version, build)
+
+def get_response_cache_stats():
+    """Public interface for response cache statistics"""
+    return response_cache.stats()
@@ -0,0 +1,207 @@
+# retrain.py - Incremental retraining from recorded outcomes in SQLite
+import argparse
+import glob
+import json
+import os
+import logging
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+from database.db import db_pool
+from models.feature_pipeline import NUMERIC_FEATURES, CATEGORICAL_FEATURES
+from models.predict import DISTRICT_CLIMATE, DEFAULT_CLIMATE
+from models.model_registry import model_registry
+from models.train_model import CropRecommendationModel
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# One row per recommendation that has a known outcome. The label is the
+# crop the farmer actually grew (first yield record after the
+# recommendation), or the recommended crop when the farmer rated the
+# recommendation as helpful. Keyset pagination on r.id keeps every query
+# bounded to one chunk.
+LABELED_EXAMPLES_SQL = '''
+    SELECT id, district, soil_type, nitrogen, phosphorus, potassium, ph,
+           COALESCE(grown_crop, CASE WHEN helpful THEN recommended_crop END) AS label
+    FROM (
+        SELECT r.id, r.district, r.soil_type, r.nitrogen, r.phosphorus, r.potassium, r.ph,
+               r.recommended_crop,
+               (SELECT y.crop FROM crop_yields y
+                WHERE y.farmer_id = r.farmer_id AND y.created_at >= r.created_at
+                ORDER BY y.created_at LIMIT 1) AS grown_crop,
+               (SELECT MAX(f.is_helpful = 1 OR f.rating >= 4) FROM feedback f
+                WHERE f.recommendation_id = r.id) AS helpful
+        FROM recommendations r
+        WHERE r.id > ? AND r.created_at <= datetime('now', ?)
+          AND r.nitrogen IS NOT NULL AND r.phosphorus IS NOT NULL
+          AND r.potassium IS NOT NULL AND r.ph IS NOT NULL
+        ORDER BY r.id
+        LIMIT ?
+    )
+'''
+
+STATE_FILE = 'state.json'
+COLUMNS = NUMERIC_FEATURES + CATEGORICAL_FEATURES + ['crop']
+
+class TrainingCache:
+    def __init__(self, directory=None):
+        """Append-only columnar store of labeled training rows
+
+        Each extraction chunk becomes one part file holding one array per
+        column; state.json records the recommendation id watermark and
+        how many rows arrived since the last training run.
+        """
+        self.directory = directory or Config.TRAINING_CACHE_PATH
+
+    def load_state(self):
+        try:
+            with open(os.path.join(self.directory, STATE_FILE), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'watermark': 0, 'rows': 0, 'rows_since_train': 0, 'parts': 0}
+
+    def save_state(self, state):
+        """Replace state.json atomically"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, STATE_FILE)
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(f'{path}.tmp', path)
+
+    def append(self, columns, state):
+        """Write one chunk as a new part file"""
+        os.makedirs(self.directory, exist_ok=True)
+        state['parts'] += 1
+        path = os.path.join(self.directory, f"part-{state['parts']:06d}.npz")
+        np.savez(path, **columns)
+        return path
+
+    def part_paths(self):
+        return sorted(glob.glob(os.path.join(self.directory, 'part-*.npz')))
+
+    def read_recent(self, max_rows):
+        """The newest max_rows cached rows as a DataFrame
+
+        Parts are read newest first and reading stops once max_rows are
+        collected, so memory does not grow with the history size.
+        """
+        frames = []
+        remaining = max_rows
+        for path in reversed(self.part_paths()):
+            if remaining <= 0:
+                break
+            with np.load(path, allow_pickle=False) as part:
+                frame = pd.DataFrame({column: part[column] for column in COLUMNS})
+            frames.append(frame.tail(remaining))
+            remaining -= len(frames[-1])
+        if not frames:
+            return pd.DataFrame(columns=COLUMNS)
+        return pd.concat(reversed(frames), ignore_index=True)
+
+def _chunk_columns(rows):
+    """Columnar arrays for a chunk of labeled rows"""
+    climate = [DISTRICT_CLIMATE.get(str(row[1]).lower(), DEFAULT_CLIMATE) for row in rows]
+    return {
+        'nitrogen': np.array([row[3] for row in rows], dtype=np.float32),
+        'phosphorus': np.array([row[4] for row in rows], dtype=np.float32),
+        'potassium': np.array([row[5] for row in rows], dtype=np.float32),
+        'ph': np.array([row[6] for row in rows], dtype=np.float32),
+        'rainfall': np.array([c['rainfall'] for c in climate], dtype=np.float32),
+        'temperature': np.array([c['temperature'] for c in climate], dtype=np.float32),
+        'district': np.array([str(row[1]) for row in rows]),
+        'soil_type': np.array([str(row[2] or '') for row in rows]),
+        'crop': np.array([str(row[7]) for row in rows])
+    }
+
+def extract_new_examples(cache=None, chunk_size=None, settle_days=None, pool=None):
+    """Stream labeled examples added since the last run into the cache
+
+    Only recommendations older than settle_days are read, so their
+    feedback and yields have had time to arrive. Each recommendation is
+    read once: the watermark also moves past the ones still unlabeled,
+    so an outcome recorded more than settle_days after a recommendation
+    is never used. That keeps every run a bounded scan of new ids.
+    Returns the number of new rows.
+    """
+    cache = cache or TrainingCache()
+    pool = pool or db_pool
+    chunk_size = chunk_size or Config.RETRAIN_CHUNK_ROWS
+    settle_days = Config.RETRAIN_SETTLE_DAYS if settle_days is None else settle_days
+    cutoff = f'-{int(settle_days)} days'
+
+    state = cache.load_state()
+    added = 0
+    while True:
+        with pool.connection() as conn:
+            rows = conn.execute(LABELED_EXAMPLES_SQL, (state['watermark'], cutoff, chunk_size)).fetchall()
+        if not rows:
+            break
+        labeled = [row for row in rows if row[7]]
+        if labeled:
+            cache.append(_chunk_columns(labeled), state)
+            added += len(labeled)
+        # Advance past unlabeled rows too; they are never revisited (see above)
+        state['watermark'] = rows[-1][0]
+        state['rows'] += len(labeled)
+        state['rows_since_train'] += len(labeled)
+        cache.save_state(state)
+        if len(rows) < chunk_size:
+            break
+
+    logger.info(f"Extracted {added} new labeled examples (watermark {state['watermark']})")
+    return added
+
+def retrain(force=False, promote=None, cache=None, min_new_rows=None, max_rows=None, seed_path=None, pool=None):
+    """Extract new examples and retrain once enough of them have arrived
+
+    Training uses the seed CSV plus the newest max_rows cached rows.
+    Returns the new registry version, or None when retraining was skipped.
+    """
+    cache = cache or TrainingCache()
+    min_new_rows = Config.RETRAIN_MIN_NEW_ROWS if min_new_rows is None else min_new_rows
+    max_rows = max_rows or Config.RETRAIN_MAX_ROWS
+    promote = Config.RETRAIN_AUTO_PROMOTE if promote is None else promote
+    seed_path = seed_path or Config.TRAINING_DATA_PATH
+
+    extract_new_examples(cache, pool=pool)
+    state = cache.load_state()
+    if not force and state['rows_since_train'] < min_new_rows:
+        logger.info(f"Skipping retrain: {state['rows_since_train']} new rows, need {min_new_rows}")
+        return None
+
+    frames = [cache.read_recent(max_rows)]
+    if seed_path and os.path.exists(seed_path):
+        frames.insert(0, pd.read_csv(seed_path, usecols=COLUMNS))
+    data = pd.concat(frames, ignore_index=True)
+
+    model = CropRecommendationModel()
+    model.data = data
+    if not model.preprocess_data() or not model.train():
+        logger.error("Retraining failed")
+        return None
+
+    version = model.register(metadata={
+        'source': 'retrain',
+        'training_rows': len(data),
+        'cached_rows': state['rows'],
+        'watermark': state['watermark']
+    })
+    state['rows_since_train'] = 0
+    cache.save_state(state)
+
+    if promote:
+        model_registry.promote(version)
+    logger.info(f"Retrained model version {version} on {len(data)} rows")
+    return version
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Retrain the crop model from recorded outcomes')
+    parser.add_argument('--force', action='store_true', help='Retrain even without enough new rows')
+    parser.add_argument('--promote', action='store_true', help='Serve the new version right away')
+    args = parser.parse_args()
+
+    version = retrain(force=args.force, promote=args.promote or None)
+    print(json.dumps({'version': version, 'state': TrainingCache().load_state()}, indent=2))
@@ -15,7 +15,7 @@ CREATE TABLE IF NOT EXISTS farmers (
 -- Recommendations table
 CREATE TABLE IF NOT EXISTS recommendations (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    farmer_id INTEGER NOT NULL,
+    farmer_id INTEGER, -- NULL for anonymous requests
     district TEXT NOT NULL,
     taluk TEXT,
     soil_type TEXT,
@@ -41,7 +41,11 @@ CREATE TABLE IF NOT EXISTS weather_alerts (
     alert_message TEXT NOT NULL,
     severity TEXT, -- 'low', 'medium', 'high', 'critical'
     sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    delivery_status TEXT DEFAULT 'pending', -- 'pending', 'sent', 'failed'
+    delivery_status TEXT DEFAULT 'pending', -- 'pending', 'sending', 'sent', 'failed'
+    attempts INTEGER DEFAULT 0,
+    claimed_at TIMESTAMP, -- when a worker took the row for sending
+    last_error TEXT,
+    message_hash TEXT, -- content hash, for de-duplication
     FOREIGN KEY (farmer_id) REFERENCES farmers (id)
 );
 
@@ -101,6 +105,8 @@ CREATE TABLE IF NOT EXISTS api_logs (
     request_data TEXT,
     response_status INTEGER,
     response_time REAL, -- in milliseconds
+    inference_time REAL, -- model inference share of response_time (ms)
+    db_time REAL, -- database share of response_time (ms)
     ip_address TEXT,
     user_agent TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -127,11 +133,14 @@ CREATE INDEX IF NOT EXISTS idx_recommendations_farmer ON recommendations (farmer
 CREATE INDEX IF NOT EXISTS idx_recommendations_district ON recommendations (district);
 CREATE INDEX IF NOT EXISTS idx_weather_alerts_farmer ON weather_alerts (farmer_id);
 CREATE INDEX IF NOT EXISTS idx_weather_alerts_district ON weather_alerts (district);
+CREATE INDEX IF NOT EXISTS idx_weather_alerts_status ON weather_alerts (delivery_status);
+CREATE INDEX IF NOT EXISTS idx_weather_alerts_dedup ON weather_alerts (farmer_id, message_hash);
 CREATE INDEX IF NOT EXISTS idx_market_prices_commodity ON market_prices (commodity);
 CREATE INDEX IF NOT EXISTS idx_market_prices_date ON market_prices (date);
 CREATE INDEX IF NOT EXISTS idx_soil_reports_farmer ON soil_reports (farmer_id);
 CREATE INDEX IF NOT EXISTS idx_crop_yields_farmer ON crop_yields (farmer_id);
 CREATE INDEX IF NOT EXISTS idx_crop_yields_season_year ON crop_yields (season, year);
+CREATE INDEX IF NOT EXISTS idx_feedback_recommendation ON feedback (recommendation_id);
 CREATE INDEX IF NOT EXISTS idx_api_logs_endpoint ON api_logs (endpoint);
 CREATE INDEX IF NOT EXISTS idx_api_logs_created_at ON api_logs (created_at);
 
@@ -141,9 +150,12 @@ INSERT OR IGNORE INTO farmers (phone, name, district, taluk, village) VALUES
 ('919876543211', 'Shalom Raj', 'Ludhiana', 'Ludhiana', 'Ludhiana'),
 ('919876543212', 'Renuka Prasad', 'Amritsar', 'Amritsar', 'Amritsar');
 
-INSERT OR IGNORE INTO market_prices (mandi_name, commodity, price, unit, district, date, source) VALUES
+-- market_prices has no unique key, so only seed an empty table
+INSERT INTO market_prices (mandi_name, commodity, price, unit, district, date, source)
+SELECT * FROM (VALUES
 ('Patiala Mandi', 'Wheat', 2450, 'quintal', 'Patiala', '2025-01-15', 'manual'),
 ('Amritsar Mandi', 'Rice (Basmati)', 3200, 'quintal', 'Amritsar', '2025-01-15', 'manual'),
 ('Ludhiana Mandi', 'Maize', 1950, 'quintal', 'Ludhiana', '2025-01-15', 'manual'),
 ('Bathinda Mandi', 'Cotton', 6800, 'quintal', 'Bathinda', '2025-01-15', 'manual'),
-('Sangrur Mandi', 'Mustard', 5800, 'quintal', 'Sangrur', '2025-01-15', 'manual');
+('Sangrur Mandi', 'Mustard', 5800, 'quintal', 'Sangrur', '2025-01-15', 'manual'))
+WHERE NOT EXISTS (SELECT 1 FROM market_prices);
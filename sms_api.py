@@ -1,19 +1,81 @@
 # sms_api.py - SMS and WhatsApp notification system
+import asyncio
+import inspect
 import requests
+from requests.adapters import HTTPAdapter
 import logging
+import time
 from datetime import datetime
+from functools import wraps
 import json
 
+from config import Config
+from utils.message_templates import render_weather_alert, render_crop_alert, delivery_deduplicator
+from utils.metrics import histogram, counter
+from utils.async_http import client_pool
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SEND_SECONDS = histogram('smartcrop_notification_send_duration_seconds',
+                         'SMS/WhatsApp send latency by channel and status', ['channel', 'status'])
+SEND_ERRORS = counter('smartcrop_notification_errors_total', 'Failed SMS/WhatsApp sends', ['channel'])
+
+# Error statuses worth retrying besides 5xx; any other 4xx (e.g. an
+# invalid number or bad credentials) fails the same way every time
+RETRYABLE_STATUSES = {408, 429}
+
+def is_transient(error):
+    """True for send failures a retry can fix: timeouts, dropped connections, 429 and 5xx"""
+    # requests.HTTPError carries the response, aiohttp.ClientResponseError the status
+    status = getattr(getattr(error, 'response', None), 'status_code', None) or getattr(error, 'status', None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUSES or status >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError))
+
+def observe_send(channel):
+    """Record latency and failures of a send method returning a result dict
+
+    Works on both the sync and the async (coroutine) send methods.
+    """
+    def record(started, result):
+        status = result.get('status')
+        SEND_SECONDS.observe(time.perf_counter() - started, channel=channel, status=status)
+        if status != 'success':
+            SEND_ERRORS.inc(channel=channel)
+        return result
+    
+    def decorate(send):
+        if inspect.iscoroutinefunction(send):
+            @wraps(send)
+            async def async_wrapper(self, phone_number, message):
+                started = time.perf_counter()
+                return record(started, await send(self, phone_number, message))
+            return async_wrapper
+        
+        @wraps(send)
+        def wrapper(self, phone_number, message):
+            started = time.perf_counter()
+            return record(started, send(self, phone_number, message))
+        return wrapper
+    return decorate
+
 class NotificationAPI:
-    def __init__(self, twilio_sid=None, twilio_token=None, whatsapp_token=None):
+    def __init__(self, twilio_sid=None, twilio_token=None, whatsapp_token=None, twilio_url=None, whatsapp_url=None):
         self.twilio_sid = twilio_sid or "demo_sid"
         self.twilio_token = twilio_token or "demo_token"
         self.whatsapp_token = whatsapp_token or "demo_token"
-        self.twilio_url = "https://api.twilio.com/2010-04-01/Accounts"
+        self.twilio_url = twilio_url or Config.TWILIO_API_URL
+        self.whatsapp_url = whatsapp_url or Config.WHATSAPP_API_URL
+        self.timeout = Config.NOTIFICATION_TIMEOUT
+        
+        # Shared keep-alive session, sized for the bulk dispatcher's workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=Config.NOTIFICATION_WORKERS)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
     
+    @observe_send('sms')
     def send_sms(self, phone_number, message):
         """Send SMS using Twilio API"""
         try:
@@ -21,38 +83,17 @@ class NotificationAPI:
                 return self.send_mock_sms(phone_number, message)
             
             # Real Twilio SMS (when credentials are available)
-            url = f"{self.twilio_url}/{self.twilio_sid}/Messages.json"
-            
-            data = {
-                'From': '+1234567890',  # Your Twilio phone number
-                'To': phone_number,
-                'Body': message
-            }
-            
-            response = requests.post(url, data=data, auth=(self.twilio_sid, self.twilio_token))
+            response = self.session.post(**self.sms_request(phone_number, message), timeout=self.timeout)
             response.raise_for_status()
             
-            result = response.json()
             logger.info(f"SMS sent successfully to {phone_number}")
-            
-            return {
-                'status': 'success',
-                'message_id': result['sid'],
-                'phone': phone_number,
-                'message': message,
-                'timestamp': datetime.now().isoformat()
-            }
+            return self.sent_result(phone_number, message, response.json()['sid'])
             
         except Exception as e:
             logger.error(f"Error sending SMS: {str(e)}")
-            return {
-                'status': 'error',
-                'error': str(e),
-                'phone': phone_number,
-                'message': message,
-                'timestamp': datetime.now().isoformat()
-            }
+            return self.error_result(phone_number, message, e)
     
+    @observe_send('whatsapp')
     def send_whatsapp(self, phone_number, message):
         """Send WhatsApp message using WhatsApp Business API"""
         try:
@@ -60,43 +101,64 @@ class NotificationAPI:
                 return self.send_mock_whatsapp(phone_number, message)
             
             # Real WhatsApp API call (when token is available)
-            url = "https://graph.facebook.com/v17.0/YOUR_PHONE_NUMBER_ID/messages"
+            response = self.session.post(**self.whatsapp_request(phone_number, message), timeout=self.timeout)
+            response.raise_for_status()
             
-            headers = {
+            logger.info(f"WhatsApp message sent successfully to {phone_number}")
+            return self.sent_result(phone_number, message, response.json()['messages'][0]['id'])
+            
+        except Exception as e:
+            logger.error(f"Error sending WhatsApp: {str(e)}")
+            return self.error_result(phone_number, message, e)
+    
+    def sms_request(self, phone_number, message):
+        """Keyword arguments of a Twilio send-message POST"""
+        return {
+            'url': f"{self.twilio_url}/{self.twilio_sid}/Messages.json",
+            'data': {
+                'From': '+1234567890',  # Your Twilio phone number
+                'To': phone_number,
+                'Body': message
+            },
+            'auth': (self.twilio_sid, self.twilio_token)
+        }
+    
+    def whatsapp_request(self, phone_number, message):
+        """Keyword arguments of a WhatsApp Business send-message POST"""
+        return {
+            'url': self.whatsapp_url,
+            'headers': {
                 'Authorization': f'Bearer {self.whatsapp_token}',
                 'Content-Type': 'application/json'
-            }
-            
-            data = {
+            },
+            'json': {
                 'messaging_product': 'whatsapp',
                 'to': phone_number,
                 'type': 'text',
                 'text': {'body': message}
             }
-            
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            
-            result = response.json()
-            logger.info(f"WhatsApp message sent successfully to {phone_number}")
-            
-            return {
-                'status': 'success',
-                'message_id': result['messages'][0]['id'],
-                'phone': phone_number,
-                'message': message,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-        except Exception as e:
-            logger.error(f"Error sending WhatsApp: {str(e)}")
-            return {
-                'status': 'error',
-                'error': str(e),
-                'phone': phone_number,
-                'message': message,
-                'timestamp': datetime.now().isoformat()
-            }
+        }
+    
+    def sent_result(self, phone_number, message, message_id):
+        """Result of a message the provider accepted"""
+        return {
+            'status': 'success',
+            'message_id': message_id,
+            'phone': phone_number,
+            'message': message,
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    def error_result(self, phone_number, message, error):
+        """Result of a failed send; retryable if the error is transient"""
+        return {
+            'status': 'error',
+            'error': str(error),
+            'retryable': is_transient(error),
+            'phone': phone_number,
+            'message': message,
+            'timestamp': datetime.now().isoformat()
+        }
     
     def send_mock_sms(self, phone_number, message):
         """Mock SMS sending for demo purposes"""
@@ -126,27 +188,44 @@ class NotificationAPI:
             'method': 'mock'
         }
     
+    def build_weather_alert_message(self, district, alert_data):
+        """Format a weather alert message"""
+        return render_weather_alert(district, alert_data)[1]
+    
+    def build_crop_alert_message(self, district, crop_data):
+        """Format a crop alert message"""
+        return render_crop_alert(district, crop_data)[1]
+    
+    def _settle(self, phone_number, message_hash, *results):
+        """Release the de-duplication claim unless some channel delivered"""
+        if not any(result.get('status') == 'success' for result in results):
+            delivery_deduplicator.release(phone_number, message_hash)
+    
+    def _duplicate_result(self, phone_number, district):
+        """Result returned when the same alert already reached this farmer"""
+        logger.info(f"Skipping duplicate alert to {phone_number}")
+        return {
+            'status': 'duplicate',
+            'phone': phone_number,
+            'district': district,
+            'timestamp': datetime.now().isoformat()
+        }
+    
     def send_weather_alert(self, phone_number, district, alert_data):
         """Send formatted weather alert"""
         try:
-            message = f"🌦️ Weather Alert for {district}\n\n"
-            message += f"📍 District: {district}\n"
-            message += f"🌡️ Temperature: {alert_data.get('temperature', 'N/A')}°C\n"
-            message += f"💧 Humidity: {alert_data.get('humidity', 'N/A')}%\n\n"
-            
-            if alert_data.get('alerts'):
-                message += "⚠️ Alerts:\n"
-                for alert in alert_data['alerts']:
-                    message += f"• {alert['message']}\n"
-                    if alert.get('recommendation'):
-                        message += f"  💡 {alert['recommendation']}\n"
-            
-            message += f"\n🕒 Time: {datetime.now().strftime('%d-%m-%Y %H:%M')}\n"
-            message += "📱 SmartCrop Advisory System"
+            message_hash, message = render_weather_alert(district, alert_data)
+            if not delivery_deduplicator.claim(phone_number, message_hash):
+                return self._duplicate_result(phone_number, district)
             
             # Send both SMS and WhatsApp
-            sms_result = self.send_sms(phone_number, message)
-            whatsapp_result = self.send_whatsapp(phone_number, message)
+            try:
+                sms_result = self.send_sms(phone_number, message)
+                whatsapp_result = self.send_whatsapp(phone_number, message)
+            except Exception:
+                delivery_deduplicator.release(phone_number, message_hash)
+                raise
+            self._settle(phone_number, message_hash, sms_result, whatsapp_result)
             
             return {
                 'sms': sms_result,
@@ -169,27 +248,18 @@ class NotificationAPI:
     def send_crop_alert(self, phone_number, district, crop_data):
         """Send crop-specific alerts"""
         try:
-            message = f"🌱 Crop Alert for {district}\n\n"
-            message += f"📍 District: {district}\n"
-            message += f"🌾 Recommended Crop: {crop_data.get('crop', 'N/A')}\n"
-            message += f"📊 Confidence: {crop_data.get('confidence', 0)*100:.1f}%\n\n"
-            
-            if crop_data.get('fertilizer_gap'):
-                message += "💊 Fertilizer Recommendations:\n"
-                gap = crop_data['fertilizer_gap']
-                if gap.get('nitrogen_gap', 0) > 0:
-                    message += f"• Nitrogen: {gap['nitrogen_gap']:.1f} kg/ha\n"
-                if gap.get('phosphorus_gap', 0) > 0:
-                    message += f"• Phosphorus: {gap['phosphorus_gap']:.1f} kg/ha\n"
-                if gap.get('potassium_gap', 0) > 0:
-                    message += f"• Potassium: {gap['potassium_gap']:.1f} kg/ha\n"
-            
-            message += f"\n🕒 Time: {datetime.now().strftime('%d-%m-%Y %H:%M')}\n"
-            message += "📱 SmartCrop Advisory System"
+            message_hash, message = render_crop_alert(district, crop_data)
+            if not delivery_deduplicator.claim(phone_number, message_hash):
+                return self._duplicate_result(phone_number, district)
             
             # Send both SMS and WhatsApp
-            sms_result = self.send_sms(phone_number, message)
-            whatsapp_result = self.send_whatsapp(phone_number, message)
+            try:
+                sms_result = self.send_sms(phone_number, message)
+                whatsapp_result = self.send_whatsapp(phone_number, message)
+            except Exception:
+                delivery_deduplicator.release(phone_number, message_hash)
+                raise
+            self._settle(phone_number, message_hash, sms_result, whatsapp_result)
             
             return {
                 'sms': sms_result,
@@ -209,8 +279,96 @@ class NotificationAPI:
                 'timestamp': datetime.now().isoformat()
             }
 
+class AsyncNotificationAPI:
+    def __init__(self, api=None, pool=None):
+        """Async variant of NotificationAPI for the ASGI serving mode
+
+        Uses the credentials, URLs and result format of a NotificationAPI
+        (by default the global one) and sends through a pooled async
+        client, so one process can keep thousands of sends in flight.
+        """
+        self.api = api or notification_api
+        self.pool = pool or client_pool('notifications')
+    
+    async def post(self, request):
+        """POST a request built by the sync API and return the JSON body"""
+        return await self.pool.request_json('POST', timeout=self.api.timeout, **request)
+    
+    @observe_send('sms')
+    async def send_sms(self, phone_number, message):
+        """Send SMS using Twilio API"""
+        try:
+            if self.api.twilio_sid == "demo_sid":
+                return self.api.send_mock_sms(phone_number, message)
+            
+            result = await self.post(self.api.sms_request(phone_number, message))
+            logger.info(f"SMS sent successfully to {phone_number}")
+            return self.api.sent_result(phone_number, message, result['sid'])
+            
+        except Exception as e:
+            logger.error(f"Error sending SMS: {str(e)}")
+            return self.api.error_result(phone_number, message, e)
+    
+    @observe_send('whatsapp')
+    async def send_whatsapp(self, phone_number, message):
+        """Send WhatsApp message using WhatsApp Business API"""
+        try:
+            if self.api.whatsapp_token == "demo_token":
+                return self.api.send_mock_whatsapp(phone_number, message)
+            
+            result = await self.post(self.api.whatsapp_request(phone_number, message))
+            logger.info(f"WhatsApp message sent successfully to {phone_number}")
+            return self.api.sent_result(phone_number, message, result['messages'][0]['id'])
+            
+        except Exception as e:
+            logger.error(f"Error sending WhatsApp: {str(e)}")
+            return self.api.error_result(phone_number, message, e)
+    
+    async def send_alert(self, phone_number, district, rendered):
+        """Send a rendered (message_hash, message) over SMS and WhatsApp at once"""
+        try:
+            message_hash, message = rendered
+            if not delivery_deduplicator.claim(phone_number, message_hash):
+                return self.api._duplicate_result(phone_number, district)
+            
+            try:
+                sms_result, whatsapp_result = await asyncio.gather(
+                    self.send_sms(phone_number, message), self.send_whatsapp(phone_number, message)
+                )
+            except Exception:
+                delivery_deduplicator.release(phone_number, message_hash)
+                raise
+            self.api._settle(phone_number, message_hash, sms_result, whatsapp_result)
+            
+            return {
+                'sms': sms_result,
+                'whatsapp': whatsapp_result,
+                'phone': phone_number,
+                'district': district,
+                'timestamp': datetime.now().isoformat()
+            }
+            
+        except Exception as e:
+            logger.error(f"Error sending alert: {str(e)}")
+            return {
+                'status': 'error',
+                'error': str(e),
+                'phone': phone_number,
+                'district': district,
+                'timestamp': datetime.now().isoformat()
+            }
+    
+    async def send_weather_alert(self, phone_number, district, alert_data):
+        """Send formatted weather alert"""
+        return await self.send_alert(phone_number, district, render_weather_alert(district, alert_data))
+    
+    async def send_crop_alert(self, phone_number, district, crop_data):
+        """Send crop-specific alerts"""
+        return await self.send_alert(phone_number, district, render_crop_alert(district, crop_data))
+
 # Global notification API instance
 notification_api = NotificationAPI()
+async_notification_api = AsyncNotificationAPI(notification_api)
 
 def send_weather_alert_to_farmer(phone_number, district, alert_data):
     """Public interface for sending weather alerts"""
@@ -220,6 +378,10 @@ def send_crop_alert_to_farmer(phone_number, district, crop_data):
     """Public interface for sending crop alerts"""
     return notification_api.send_crop_alert(phone_number, district, crop_data)
 
+def build_weather_alert_message(district, alert_data):
+    """Public interface for formatting weather alerts"""
+    return notification_api.build_weather_alert_message(district, alert_data)
+
 def send_sms_to_farmer(phone_number, message):
     """Public interface for sending SMS"""
     return notification_api.send_sms(phone_number, message)
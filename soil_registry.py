@@ -0,0 +1,139 @@
+# soil_registry.py - In-memory district soil index with hot reload
+import csv
+import os
+import threading
+import time
+import logging
+from datetime import datetime
+
+from config import Config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def normalize_district(district):
+    """Normalize a district name for index lookups"""
+    return (district or '').strip().lower()
+
+def _column_type(values):
+    """int, float or str, whichever holds every non-empty value of a column"""
+    for kind in (int, float):
+        try:
+            for value in values:
+                if value != '':
+                    kind(value)
+            return kind
+        except ValueError:
+            continue
+    return str
+
+def read_csv_records(path):
+    """Read a small CSV into a list of dicts, typing each column like pandas
+
+    Importing pandas costs more than half a second, which would land on
+    the first request of every worker; these files are only tens of rows.
+    Empty cells become None.
+    """
+    with open(path, 'r', newline='') as f:
+        rows = list(csv.DictReader(f))
+    if not rows:
+        return []
+    return typed_records(rows, column_types(rows))
+
+def column_types(rows):
+    """Type of each column of csv.DictReader rows, inferred like pandas"""
+    return {column: _column_type([row[column] for row in rows]) for column in rows[0]}
+
+def typed_records(rows, types):
+    """csv.DictReader rows with every value converted to its column's type
+
+    Raises ValueError when a value does not fit the type.
+    """
+    return [
+        {column: types[column](value) if value != '' else None for column, value in row.items()}
+        for row in rows
+    ]
+
+class SoilRegistry:
+    def __init__(self, data_path=None, check_interval=1.0):
+        self.data_path = data_path or Config.SOIL_DATA_PATH
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._last_check = None
+        # (mtime_ns, records, index) is swapped as a single tuple so readers
+        # never see a half-built index while a reload is in progress
+        self._snapshot = (None, [], {})
+        self.version = 0
+        self.updated_at = None
+
+    def _load(self, mtime_ns):
+        """Parse the soil CSV and build the district index"""
+        records = read_csv_records(self.data_path)
+        index = {}
+        for record in records:
+            # First row wins, matching the old iloc[0] lookup
+            index.setdefault(normalize_district(record['district']), record)
+
+        self._snapshot = (mtime_ns, records, index)
+        self.version += 1
+        # The file's time, so every worker reports the same one
+        self.updated_at = datetime.fromtimestamp(mtime_ns / 1e9).isoformat()
+        logger.info(f"Soil registry loaded {len(records)} districts (version {self.version})")
+
+    def _refresh(self):
+        """Reload the index if the CSV changed on disk"""
+        now = time.monotonic()
+        if self._last_check is not None and now - self._last_check < self.check_interval:
+            return
+
+        with self._lock:
+            if self._last_check is not None and now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+            try:
+                mtime_ns = os.stat(self.data_path).st_mtime_ns
+                if mtime_ns != self._snapshot[0]:
+                    self._load(mtime_ns)
+            except Exception as e:
+                # Keep serving the last good snapshot
+                logger.error(f"Error loading soil data: {str(e)}")
+
+    def get(self, district):
+        """Get the soil record for a district, or None if unknown"""
+        self._refresh()
+        return self._snapshot[2].get(normalize_district(district))
+
+    def all(self):
+        """Get all soil records in file order"""
+        self._refresh()
+        return self._snapshot[1]
+
+    def districts(self):
+        """Get all district names in file order"""
+        return [record['district'] for record in self.all()]
+
+    def data_version(self):
+        """(version, updated_at) of the data, after checking the CSV for changes"""
+        self._refresh()
+        return self.version, self.updated_at
+
+    def reload(self):
+        """Force a reload on the next lookup"""
+        with self._lock:
+            self._snapshot = (None,) + self._snapshot[1:]
+            self._last_check = None
+
+# Global soil registry instance
+soil_registry = SoilRegistry()
+
+def get_district_soil(district):
+    """Public interface for district soil lookups"""
+    return soil_registry.get(district)
+
+def get_all_districts():
+    """Public interface for the full district list"""
+    return soil_registry.all()
+
+def get_soil_data_version():
+    """Public interface for the (version, updated_at) of the soil data"""
+    return soil_registry.data_version()
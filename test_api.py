@@ -1,13 +1,49 @@
 # test_api.py - API tests for SmartCrop Advisory System
 import unittest
+import asyncio
+import importlib.util
 import json
 import os
 import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import requests
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import app
+from config import Config
+from utils.weather_api import WeatherAPI, AsyncWeatherAPI
+from utils.weather_prefetch import prefetch_weather
+from utils.market_store import MarketPriceStore
+from utils.alert_rules import AlertRuleEngine
+from models.forest_engine import export_forest, load_forest
+from models.prediction_cache import PredictionCache
+from models.feature_pipeline import FeaturePipeline
+from models.model_registry import ModelRegistry
+from models.predict import CropPredictor
+from models.hot_swap import RegistryWatcher, ShadowEvaluator
+from models.retrain import TrainingCache, extract_new_examples, retrain
+from benchmarks.bench_hot_paths import compare_to_baseline
+from database.write_behind import WriteBehindQueue
+from utils.api_logger import APILogger
+from utils.request_timing import timed
+from utils.metrics import MetricsRegistry
+from utils.request_profiler import RequestProfiler
+from utils.async_http import AsyncClientPool
+from utils.response_cache import ResponseCache
+from utils.message_templates import MessageRenderer, DeliveryDeduplicator, weather_alert_payload, content_hash
+from utils.notification_dispatcher import BulkDispatcher, TokenBucket
+from utils.sms_api import is_transient
+from utils.alert_outbox import AlertOutbox
+from database.db import ConnectionPool
 
 class TestSmartCropAPI(unittest.TestCase):
     def setUp(self):
@@ -64,6 +100,30 @@ class TestSmartCropAPI(unittest.TestCase):
         data = json.loads(response.data)
         self.assertIn('error', data)
     
+    def test_batch_recommendation(self):
+        """Test batch crop recommendation keeps input order"""
+        payload = {
+            'samples': [
+                {'district': 'patiala', 'nitrogen': 25, 'phosphorus': 18, 'potassium': 220, 'ph': 7.2},
+                {'district': 'invalid', 'nitrogen': 25, 'phosphorus': 18, 'potassium': 220, 'ph': 7.2},
+                {'district': 'fazilka', 'nitrogen': 20, 'phosphorus': 14, 'potassium': 190, 'ph': 7.8}
+            ]
+        }
+        
+        response = self.app.post('/api/recommend/batch',
+                               data=json.dumps(payload),
+                               content_type='application/json')
+        
+        self.assertEqual(response.status_code, 200)
+        
+        data = json.loads(response.data)
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['errors'], 1)
+        self.assertIn('crop', data['results'][0])
+        self.assertIn('error', data['results'][1])
+        self.assertEqual(data['results'][2]['district'], 'Fazilka')
+        self.assertIn('fertilizer_gap', data['results'][2])
+    
     def test_market_prices(self):
         """Test market prices endpoint"""
         response = self.app.get('/api/market-prices')
@@ -102,7 +162,8 @@ class TestSmartCropAPI(unittest.TestCase):
     def test_register_farmer(self):
         """Test farmer registration"""
         payload = {
-            'phone': '919876543210',
+            # Unique, so reruns and the sample farmers do not collide
+            'phone': f'91{uuid.uuid4().int % 10**10:010d}',
             'name': 'Test Farmer',
             'district': 'patiala',
             'taluk': 'samana'
@@ -152,6 +213,32 @@ class TestSmartCropAPI(unittest.TestCase):
         data = json.loads(response.data)
         self.assertEqual(data['status'], 'success')
     
+    def test_send_bulk_alert(self):
+        """Test a bulk alert is queued for the outbox and answered with 202"""
+        payload = {'district': 'Patiala', 'phones': ['919876500001', '919876500002', '919876500001'],
+                   'message': f'Bulk test {uuid.uuid4()}'}
+        response = self.app.post('/api/send-alert/bulk', data=json.dumps(payload), content_type='application/json')
+        
+        self.assertEqual(response.status_code, 202)
+        result = json.loads(response.data)['result']
+        self.assertEqual((result['recipients'], result['queued']), (2, 2))
+        self.assertEqual(result['last_alert_id'] - result['first_alert_id'], 1)
+        
+        missing = self.app.post('/api/send-alert/bulk', data=json.dumps({'message': 'Hi'}),
+                                content_type='application/json')
+        self.assertEqual(missing.status_code, 400)
+    
+    def test_send_weather_alert(self):
+        """Test the weather alert falls back to the district alert and rejects bad messages"""
+        payload = {'phone': f'9198{uuid.uuid4().int % 10**8:08d}', 'district': 'Patiala'}
+        response = self.app.post('/api/weather-alert', data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(json.loads(response.data)['status'], ('success', 'duplicate'))
+        
+        payload['message'] = ''
+        response = self.app.post('/api/weather-alert', data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+    
     def test_get_districts(self):
         """Test getting districts list"""
         response = self.app.get('/api/districts')
@@ -178,5 +265,1248 @@ class TestSmartCropAPI(unittest.TestCase):
         data = json.loads(response.data)
         self.assertIn('error', data)
 
+class StubWeatherHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the OpenWeather current weather endpoint"""
+    requests = 0
+    
+    def do_GET(self):
+        StubWeatherHandler.requests += 1
+        district = parse_qs(urlparse(self.path).query)['q'][0].split(',')[0]
+        if district == 'Broken':
+            self.send_response(500)
+            self.end_headers()
+            return
+        
+        body = json.dumps({
+            'main': {'temp': 30.5, 'humidity': 55, 'pressure': 1010},
+            'weather': [{'description': 'clear sky'}],
+            'wind': {'speed': 3.2}
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+class TestWeatherPrefetch(unittest.TestCase):
+    def setUp(self):
+        """Start a stub weather server"""
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubWeatherHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api = WeatherAPI(
+            api_key='test_key',
+            base_url=f'http://127.0.0.1:{self.server.server_port}'
+        )
+    
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def test_prefetch_populates_cache(self):
+        """Test prefetch fills the cache and reports failures"""
+        report = prefetch_weather(['Patiala', 'Ludhiana', 'Broken'], api=self.api, concurrency=3, timeout=2)
+        
+        self.assertEqual(report['succeeded'], 2)
+        self.assertIn('Broken', report['failures'])
+        self.assertIn('wall_time_ms', report)
+        
+        weather = self.api.get_current_weather('patiala')
+        self.assertEqual(weather['temperature'], 30.5)
+        self.assertEqual(self.api.cache_hits, 1)
+
+class TestWeatherStaleWhileRevalidate(unittest.TestCase):
+    def setUp(self):
+        """A weather client whose upstream fetch is stubbed and can be held"""
+        self.api = WeatherAPI(cache_ttl=60, stale_ttl=600)
+        self.fetches = []
+        self.release = threading.Event()
+        self.release.set()
+        self.fail = False
+        
+        def fetch_weather(district, state="Punjab", country="IN", timeout=10):
+            self.fetches.append(district)
+            self.release.wait(5)
+            if self.fail:
+                raise requests.Timeout('upstream timed out')
+            return self.api.store(district, {'district': district, 'fetch': len(self.fetches)})
+        self.api.fetch_weather = fetch_weather
+    
+    def cache_aged(self, district, seconds, weather_data):
+        self.api._cache[district.lower()] = (time.monotonic() - seconds, weather_data)
+    
+    def wait_for_refreshes(self):
+        deadline = time.monotonic() + 5
+        while self.api._refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+    
+    def test_stale_value_served_during_one_refresh(self):
+        """Test stale weather is served at once while a single refresh per district runs"""
+        self.release.clear()
+        self.cache_aged('Patiala', 120, {'fetch': 'old'})
+        self.cache_aged('Ludhiana', 120, {'fetch': 'old'})
+        
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            served = list(pool.map(self.api.get_current_weather, ['Patiala', 'patiala ', 'Ludhiana'] * 4))
+        
+        self.assertEqual(served, [{'fetch': 'old'}] * 12)
+        self.assertEqual(self.api.stale_hits, 12)
+        self.release.set()
+        self.wait_for_refreshes()
+        self.assertEqual(sorted(district.strip().lower() for district in self.fetches), ['ludhiana', 'patiala'])
+        
+        fresh = self.api.get_current_weather('Patiala')
+        self.assertNotEqual(fresh, {'fetch': 'old'})
+        self.assertEqual((self.api.cache_hits, len(self.fetches)), (1, 2))
+    
+    def test_failed_refresh_keeps_stale_value(self):
+        """Test a failed refresh keeps serving the stale value and is tried again"""
+        self.fail = True
+        self.cache_aged('Patiala', 120, {'fetch': 'old'})
+        
+        self.assertEqual(self.api.get_current_weather('Patiala'), {'fetch': 'old'})
+        self.wait_for_refreshes()
+        self.assertEqual(self.api.get_current_weather('Patiala'), {'fetch': 'old'})
+        self.wait_for_refreshes()
+        self.assertEqual(len(self.fetches), 2)
+    
+    def test_fetch_after_stale_window(self):
+        """Test weather older than the stale window is fetched inline, or mocked on failure"""
+        self.cache_aged('Patiala', 700, {'fetch': 'old'})
+        self.assertEqual(self.api.get_current_weather('Patiala'), {'district': 'Patiala', 'fetch': 1})
+        self.assertEqual((self.api.cache_misses, self.api.stale_hits), (1, 0))
+        
+        self.fail = True
+        self.cache_aged('Ludhiana', 700, {'fetch': 'old'})
+        self.assertEqual(self.api.get_current_weather('Ludhiana')['source'], 'mock_data')
+        self.assertEqual(len(self.fetches), 2)
+
+class TestWeatherCacheBound(unittest.TestCase):
+    def test_least_recently_used_district_is_evicted(self):
+        """Test the cache keeps max_entries districts and evicts the least recently used"""
+        api = WeatherAPI(max_entries=2)
+        for district in ['Patiala', 'Ludhiana']:
+            api.get_current_weather(district)
+        api.get_current_weather('patiala')
+        api.get_current_weather('Nowhere')
+        
+        self.assertEqual(list(api._cache), ['patiala', 'nowhere'])
+        self.assertEqual((api.cache_hits, api.cache_misses), (1, 3))
+
+class TestAlertRules(unittest.TestCase):
+    def test_district_override(self):
+        """Test district overrides change thresholds for that district only"""
+        engine = AlertRuleEngine(overrides={
+            'districts': {'Bathinda': {'heat_wave': {'threshold': 40}}}
+        })
+        weather = {'temperature': 37.0, 'humidity': 50, 'wind_speed': 3.0}
+        
+        alerts = engine.evaluate([weather, weather], districts=['bathinda', 'patiala'])
+        
+        self.assertEqual(alerts[0], [])
+        self.assertEqual([alert['type'] for alert in alerts[1]], ['heat_wave'])
+    
+    def test_exclusive_group(self):
+        """Test only the first matching rule in a group fires"""
+        engine = AlertRuleEngine(rules=[
+            {'type': 'hot', 'field': 'temperature', 'op': '>', 'threshold': 30,
+             'severity': 'high', 'group': 'temperature', 'message': 'Hot {value}'},
+            {'type': 'warm', 'field': 'temperature', 'op': '>', 'threshold': 20,
+             'severity': 'low', 'group': 'temperature', 'message': 'Warm {value}'}
+        ])
+        
+        alerts = engine.evaluate([{'temperature': 35}, {'temperature': 25}, {}], districts=['a', 'b', 'c'])
+        
+        self.assertEqual([[alert['type'] for alert in row] for row in alerts], [['hot'], ['warm'], []])
+
+class TestMarketIndex(unittest.TestCase):
+    def test_lookups_match_pandas_filtering(self):
+        """Test indexed market lookups return the rows pandas filtering would"""
+        import random
+        import pandas as pd
+        
+        rng = random.Random(7)
+        rows = [
+            {'date': f'2025-01-{day:02d}', 'mandi': f'{district} Mandi {mandi}', 'commodity': commodity,
+             'price': rng.randint(1000, 7000), 'unit': 'quintal', 'district': rng.choice([district, district.upper()]),
+             'region': 'Malwa'}
+            for district in ('Patiala', 'Ludhiana', 'Bathinda')
+            for mandi in (1, 2)
+            for commodity in ('Wheat', 'Maize', 'Cotton')
+            for day in rng.sample(range(1, 20), 4)
+        ]
+        rng.shuffle(rows)
+        
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'market_prices.csv')
+            pd.DataFrame(rows).to_csv(path, index=False)
+            store = MarketPriceStore(data_path=path, check_interval=3600)
+            store.data_version()  # load before the file goes away
+            df = pd.read_csv(path)
+        
+        def records(frame):
+            return frame.to_dict('records')
+        
+        for district in ('patiala', 'Ludhiana', 'BATHINDA'):
+            in_district = df[df['district'].str.lower() == district.lower()]
+            self.assertEqual(store.all_prices(district), records(in_district))
+            
+            for date in in_district['date'].unique():
+                self.assertEqual(store.get_prices(district, date), records(in_district[in_district['date'] == date]))
+                for commodity in ('wheat', 'Maize'):
+                    match = in_district[(in_district['date'] == date) & (in_district['commodity'].str.lower() == commodity.lower())]
+                    self.assertEqual(store.get_price(district, commodity, date),
+                                     {row['mandi']: row for row in records(match)})
+            
+            # Without a matching date: the newest price per mandi and commodity
+            latest = in_district.sort_values('date', ascending=False).drop_duplicates(['mandi', 'commodity'])
+            view = store.get_prices(district, '1999-01-01')
+            self.assertEqual(sorted(view, key=lambda r: (r['mandi'], r['commodity'])),
+                             records(latest.sort_values(['mandi', 'commodity'])))
+            self.assertEqual([r['date'] for r in view], sorted((r['date'] for r in view), reverse=True))
+        
+        self.assertEqual(store.all_prices(), records(df))
+        self.assertEqual(len(store.get_prices()), len(df.drop_duplicates(['mandi', 'commodity'])))
+    
+    def test_appended_rows_are_indexed_incrementally(self):
+        """Test rows appended to the CSV update the views in place; a rewrite reloads"""
+        header = 'date,mandi,commodity,price,unit,district,region\n'
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'market_prices.csv')
+            mtime = [1_700_000_000 * 10**9]
+            
+            def write(text, mode='a'):
+                with open(path, mode) as f:
+                    f.write(text)
+                mtime[0] += 10**9
+                os.utime(path, ns=(mtime[0], mtime[0]))
+            
+            write(header + '2025-01-15,Patiala Mandi,Wheat,2450,quintal,Patiala,Malwa\n'
+                  '2025-01-15,Ludhiana Mandi,Maize,1950,quintal,Ludhiana,Malwa\n', 'w')
+            store = MarketPriceStore(data_path=path, check_interval=0)
+            self.assertEqual([r['price'] for r in store.get_prices('Patiala')], [2450])
+            index, version = store._index, store.version
+            
+            write('2025-01-16,Patiala Mandi,Wheat,2500,quintal,Patiala,Malwa\n2025-01-16,Patiala Mandi,Ri')
+            self.assertEqual([r['price'] for r in store.get_prices('Patiala')], [2500])
+            self.assertIs(store._index, index)
+            self.assertEqual(store.version, version + 1)
+            self.assertEqual(store.get_price('patiala', 'wheat', '2025-01-15')['Patiala Mandi']['price'], 2450)
+            
+            # The partly written line is indexed once it is complete
+            write('ce,3100,quintal,Patiala,Malwa\n')
+            self.assertEqual([(r['commodity'], r['price']) for r in store.get_prices('Patiala', '2025-01-16')],
+                             [('Wheat', 2500), ('Rice', 3100)])
+            self.assertEqual(len(store.all_prices()), 4)
+            self.assertIs(store._index, index)
+            
+            # A value that does not fit the column types falls back to a full reload
+            write('2025-01-17,Moga Mandi,Wheat,2475.5,quintal,Moga,Malwa\n')
+            self.assertEqual(store.get_prices('Moga')[0]['price'], 2475.5)
+            self.assertIsNot(store._index, index)
+            self.assertEqual(len(store.all_prices()), 5)
+            
+            # A rewritten file is reloaded in full
+            write(header + '2025-02-01,Bathinda Mandi,Cotton,6800,quintal,Bathinda,Malwa\n', 'w')
+            self.assertEqual([r['district'] for r in store.all_prices()], ['Bathinda'])
+            self.assertEqual(store.get_prices('Patiala'), [])
+
+class TestSoilRegistry(unittest.TestCase):
+    def test_rewritten_csv_is_hot_reloaded(self):
+        """Test a CSV rewritten on disk is served after its mtime changes"""
+        from utils.soil_registry import SoilRegistry
+        header = 'district,soil_type,ph_min,ph_max\n'
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'soil.csv')
+            with open(path, 'w') as f:
+                f.write(header + 'Patiala,alluvial,6.8,7.6\n')
+            registry = SoilRegistry(path, check_interval=0)
+            
+            self.assertEqual(registry.get('patiala')['soil_type'], 'alluvial')
+            self.assertIsNone(registry.get('Moga'))
+            
+            with open(path, 'w') as f:
+                f.write(header + 'Patiala,loamy,6.5,7.2\nMoga,sandy,7.0,8.0\n')
+            mtime = os.stat(path).st_mtime_ns + 10 ** 9
+            os.utime(path, ns=(mtime, mtime))
+            
+            self.assertEqual(registry.get('Patiala')['soil_type'], 'loamy')
+            self.assertEqual(registry.get(' moga ')['ph_max'], 8.0)
+            self.assertEqual(registry.districts(), ['Patiala', 'Moga'])
+            self.assertEqual(registry.version, 2)
+
+class TestForestEngine(unittest.TestCase):
+    def test_matches_sklearn(self):
+        """Test the flat forest gives the same probabilities as sklearn"""
+        import numpy as np
+        from sklearn.ensemble import RandomForestClassifier
+        
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(500, 8))
+        y = rng.choice(['Wheat', 'Rice', 'Maize'], size=500)
+        model = RandomForestClassifier(n_estimators=20, random_state=0).fit(X, y)
+        
+        with tempfile.TemporaryDirectory() as directory:
+            export_forest(model, directory)
+            forest = load_forest(directory)
+            
+            X_test = rng.normal(size=(200, 8))
+            np.testing.assert_array_equal(forest.predict_proba(X_test), model.predict_proba(X_test))
+            np.testing.assert_array_equal(forest.predict(X_test[:1]), model.predict(X_test[:1]))
+    
+    def test_large_batches_use_sklearn(self):
+        """Test single rows use the flat forest and large batches the pickled model, with equal results"""
+        import joblib
+        import numpy as np
+        from sklearn.ensemble import RandomForestClassifier
+        
+        rng = np.random.default_rng(0)
+        model = RandomForestClassifier(n_estimators=10, random_state=0).fit(
+            rng.normal(size=(300, 8)), rng.choice(['Wheat', 'Rice', 'Maize'], size=300))
+        encodings = FeaturePipeline.fit_encodings({'district': ['patiala'], 'soil_type': ['alluvial']})
+        
+        with tempfile.TemporaryDirectory() as directory:
+            paths = {name: os.path.join(directory, name) for name in ('model.pkl', 'forest', 'pipeline.json')}
+            joblib.dump(model, paths['model.pkl'])
+            export_forest(model, paths['forest'])
+            FeaturePipeline(encodings, mean=[50.0] * 8, scale=[50.0] * 8).save(paths['pipeline.json'])
+            predictor = CropPredictor(model_path=paths['model.pkl'], forest_path=paths['forest'],
+                                      pipeline_path=paths['pipeline.json'], record_metrics=False)
+            
+            samples = [{'nitrogen': float(n), 'phosphorus': 40, 'potassium': 40, 'ph': 6.5,
+                        'district': 'Patiala', 'soil_type': 'alluvial'} for n in range(Config.FLAT_FOREST_MAX_BATCH + 50)]
+            small = predictor.predict_crops_batch(samples[:5])
+            self.assertIsNone(predictor.models.estimator)
+            single = predictor.predict_crop(**samples[0])
+            self.assertIsNone(predictor.models.estimator)
+            
+            large = predictor.predict_crops_batch(samples)
+            self.assertIsInstance(predictor.models.estimator, RandomForestClassifier)
+            self.assertEqual(large[:5], small)
+            self.assertEqual(single['crop'], small[0]['crop'])
+            self.assertEqual([r['method'] for r in large], ['ml_model'] * len(samples))
+
+class TestModelLoading(unittest.TestCase):
+    def setUp(self):
+        """Flat forest, pickled model and pipeline artifacts in a temporary directory"""
+        import joblib
+        import numpy as np
+        from sklearn.ensemble import RandomForestClassifier
+        
+        rng = np.random.default_rng(0)
+        model = RandomForestClassifier(n_estimators=5, random_state=0).fit(
+            rng.normal(size=(100, 8)), rng.choice(['Wheat', 'Rice'], size=100))
+        encodings = FeaturePipeline.fit_encodings({'district': ['patiala'], 'soil_type': ['alluvial']})
+        self.directory = tempfile.TemporaryDirectory()
+        self.paths = {name: os.path.join(self.directory.name, name) for name in ('model.pkl', 'forest', 'pipeline.json')}
+        joblib.dump(model, self.paths['model.pkl'])
+        export_forest(model, self.paths['forest'])
+        FeaturePipeline(encodings, mean=[50.0] * 8, scale=[50.0] * 8).save(self.paths['pipeline.json'])
+        self.sample = {'nitrogen': 40, 'phosphorus': 40, 'potassium': 40, 'ph': 6.5,
+                       'district': 'Patiala', 'soil_type': 'alluvial'}
+    
+    def tearDown(self):
+        self.directory.cleanup()
+    
+    def predictor(self, **kwargs):
+        return CropPredictor(model_path=self.paths['model.pkl'], forest_path=self.paths['forest'],
+                             pipeline_path=self.paths['pipeline.json'], record_metrics=False, **kwargs)
+    
+    def test_models_load_on_first_prediction(self):
+        """Test nothing is read from disk until the first prediction"""
+        predictor = self.predictor()
+        self.assertFalse(predictor.loaded)
+        self.assertIsNone(predictor.model)
+        
+        self.assertEqual(predictor.predict_crop(**self.sample)['method'], 'ml_model')
+        self.assertTrue(predictor.loaded)
+        self.assertEqual(predictor.version, 1)
+    
+    def test_concurrent_first_calls_load_once(self):
+        """Test concurrent first predictions share one load under _load_lock"""
+        predictor = self.predictor()
+        read_models = predictor.read_models
+        reads = []
+        
+        def slow_read():
+            reads.append(threading.current_thread().name)
+            time.sleep(0.2)
+            return read_models()
+        predictor.read_models = slow_read
+        
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: predictor.predict_crop(**self.sample), range(8)))
+        
+        self.assertEqual(len(reads), 1)
+        self.assertEqual(predictor.version, 1)
+        self.assertEqual({result['method'] for result in results}, {'ml_model'})
+    
+    def test_mmap_mode_maps_forest_arrays(self):
+        """Test mmap_mode='r' maps the forest arrays read-only and None loads private copies"""
+        mapped = self.predictor(mmap_mode='r', lazy=False).model
+        copied = self.predictor(mmap_mode=None, lazy=False).model
+        
+        import mmap
+        self.assertFalse(mapped.threshold.flags.writeable)
+        base = mapped.threshold
+        while base is not None and not isinstance(base, mmap.mmap):
+            base = getattr(base, 'base', None)
+        self.assertIsNotNone(base)  # backed by the .npy file's mapping
+        self.assertTrue(copied.threshold.flags.writeable)
+        self.assertEqual(mapped.predict_proba([[0.1] * 8]).tolist(), copied.predict_proba([[0.1] * 8]).tolist())
+
+class TestPredictionCache(unittest.TestCase):
+    def test_lru_and_version_invalidation(self):
+        """Test hits, LRU eviction and invalidation on a new model version"""
+        cache = PredictionCache(max_entries=2, ttl=0)
+        calls = []
+        compute = lambda key: lambda: calls.append(key) or {'crop': key}
+        
+        cache.get_or_compute('a', 1, compute('a'))
+        cache.get_or_compute('b', 1, compute('b'))
+        self.assertEqual(cache.get_or_compute('a', 1, compute('a')), {'crop': 'a'})
+        cache.get_or_compute('c', 1, compute('c'))  # evicts 'b'
+        cache.get_or_compute('b', 1, compute('b'))
+        self.assertEqual(calls, ['a', 'b', 'c', 'b'])
+        
+        cache.get_or_compute('a', 2, compute('a'))  # new model version
+        stats = cache.stats()
+        self.assertEqual(calls[-1], 'a')
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 5, 1))
+        self.assertEqual(stats['evictions'], 2)
+
+    def test_key_normalizes_categories_and_matches_batch(self):
+        """Test spellings of one input share a cache entry and the batch path agrees"""
+        from models.predict import crop_cache, get_crop_recommendation, get_crop_recommendations_batch
+        sample = {'nitrogen': 137.0, 'phosphorus': 41.0, 'potassium': 233.0, 'ph': 7.1,
+                  'district': 'Patiala', 'soil_type': 'Alluvial', 'last_crop': 'Wheat'}
+        
+        first = get_crop_recommendation(**sample)
+        hits = crop_cache.stats()['hits']
+        second = get_crop_recommendation(**dict(sample, nitrogen=137.2, district=' PATIALA',
+                                                soil_type='alluvial ', last_crop='wheat'))
+        
+        self.assertEqual(crop_cache.stats()['hits'], hits + 1)
+        self.assertEqual(second, first)
+        batch = get_crop_recommendations_batch([dict(sample, nitrogen=137.2)])[0]
+        self.assertEqual((batch['crop'], batch['method']), (first['crop'], first['method']))
+        self.assertAlmostEqual(batch['confidence'], first['confidence'])
+
+class TestFeaturePipeline(unittest.TestCase):
+    def test_round_trip_and_unknown_categories(self):
+        """Test a saved pipeline encodes both categoricals and flags unseen values"""
+        encodings = FeaturePipeline.fit_encodings({
+            'district': ['Patiala', 'Ludhiana', 'patiala'],
+            'soil_type': ['alluvial', 'Sandy']
+        })
+        pipeline = FeaturePipeline(encodings, mean=[1.0] * 8, scale=[2.0] * 8)
+        
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'feature_pipeline.json')
+            pipeline.save(path)
+            loaded = FeaturePipeline.load(path)
+        
+        features, known = loaded.transform({
+            'nitrogen': [3, 3], 'phosphorus': [3, 3], 'potassium': [3, 3], 'ph': [3, 3],
+            'rainfall': [3, 3], 'temperature': [3, 3],
+            'district': ['PATIALA', 'Mars'], 'soil_type': ['sandy', 'alluvial']
+        })
+        
+        self.assertEqual(known.tolist(), [True, False])
+        self.assertEqual(features[0].tolist(), [1.0] * 6 + [(1 - 1) / 2, (1 - 1) / 2])
+
+    def test_build_follows_feature_order(self):
+        """Test columns are built in the stored feature_order and unknown names are rejected"""
+        encodings = FeaturePipeline.fit_encodings({'district': ['Patiala'], 'soil_type': ['Sandy']})
+        order = ['district_encoded', 'ph', 'nitrogen', 'soil_type_encoded',
+                 'phosphorus', 'potassium', 'rainfall', 'temperature']
+        pipeline = FeaturePipeline(encodings, mean=[0.0] * 8, scale=[1.0] * 8, feature_order=order)
+        
+        features, known = pipeline.build({
+            'nitrogen': [1], 'phosphorus': [2], 'potassium': [3], 'ph': [4],
+            'rainfall': [5], 'temperature': [6], 'district': ['Patiala'], 'soil_type': ['Mars']
+        })
+        
+        self.assertEqual(features[0].tolist(), [0, 4, 1, -1, 2, 3, 5, 6])
+        self.assertEqual(known.tolist(), [False])
+        with self.assertRaises(ValueError):
+            FeaturePipeline(encodings, mean=[0.0] * 8, scale=[1.0] * 8, feature_order=order[:-1] + ['humidity'])
+
+class TestModelRegistry(unittest.TestCase):
+    def register_stub(self, registry, accuracy):
+        """Register a version with metadata only"""
+        def write(directory):
+            with open(os.path.join(directory, 'crop_recommendation_model.pkl'), 'wb') as f:
+                f.write(b'stub')
+        return registry.register(write, {'metrics': {'accuracy': accuracy}, 'params': {}})
+    
+    def test_promote_and_rollback_pointers(self):
+        """Test promote, rollback and shadow pointers name only complete versions"""
+        with tempfile.TemporaryDirectory() as directory:
+            registry = ModelRegistry(directory)
+            self.assertIsNone(registry.current_version())
+            self.assertIsNone(registry.artifacts())
+            
+            first = self.register_stub(registry, 0.8)
+            second = self.register_stub(registry, 0.9)
+            self.assertNotEqual(first, second)
+            self.assertEqual([m['version'] for m in registry.list_versions()], [first, second])
+            self.assertGreater(registry.get_metadata(first)['size_bytes'], 0)
+            
+            registry.promote(second)
+            self.assertEqual(registry.artifacts()['model'],
+                             os.path.join(directory, second, 'crop_recommendation_model.pkl'))
+            # Rolling back is promoting the earlier version again
+            registry.promote(first)
+            self.assertEqual(registry.current_version(), first)
+            with self.assertRaises(ValueError):
+                registry.promote('20000101-000000')
+            self.assertEqual(registry.current_version(), first)
+            
+            registry.set_shadow(second)
+            self.assertEqual((registry.current_version(), registry.shadow_version()), (first, second))
+            registry.clear_shadow()
+            registry.clear_shadow()
+            self.assertIsNone(registry.shadow_version())
+            
+            def broken(directory):
+                raise RuntimeError('disk full')
+            with self.assertRaises(RuntimeError):
+                registry.register(broken, {})
+            self.assertEqual(sorted(os.listdir(directory)), sorted([first, second, 'CURRENT']))
+    
+    def test_training_cli(self):
+        """Test the CLI trains with a search, registers, lists, promotes and rolls back"""
+        import subprocess
+        root = os.path.dirname(os.path.abspath(__file__))
+        
+        with tempfile.TemporaryDirectory() as directory:
+            def cli(*args):
+                return subprocess.run(
+                    [sys.executable, os.path.join('models', 'train_model.py'), *args],
+                    cwd=root, env=dict(os.environ, MODEL_REGISTRY_PATH=directory),
+                    capture_output=True, text=True, timeout=300
+                )
+            
+            trained = cli('train', '--search', 'random', '--n-iter', '2', '--cv', '2', '--jobs', '2', '--promote')
+            self.assertEqual(trained.returncode, 0, trained.stderr)
+            metadata = json.loads(trained.stdout)
+            self.assertEqual((metadata['search'], len(metadata['candidates'])), ('random', 2))
+            self.assertIn('fit_seconds', metadata['candidates'][0])
+            for key in ('metrics', 'inference_latency', 'size_bytes', 'params'):
+                self.assertIn(key, metadata)
+            
+            registry = ModelRegistry(directory)
+            first = metadata['version']
+            self.assertEqual(registry.current_version(), first)
+            second = self.register_stub(registry, 0.5)
+            
+            listing = cli('list').stdout.splitlines()
+            self.assertEqual([line.split()[:2] for line in listing], [['*', first], [second, 'accuracy=0.500']])
+            
+            self.assertEqual(cli('promote', second).returncode, 0)
+            self.assertEqual(registry.current_version(), second)
+            self.assertEqual(cli('promote', first).returncode, 0)
+            self.assertEqual(registry.current_version(), first)
+            self.assertEqual(cli('promote', 'missing').returncode, 1)
+            self.assertEqual(registry.current_version(), first)
+
+class TestModelHotSwap(unittest.TestCase):
+    def register_version(self, registry, crop):
+        """Register a forest that always predicts crop"""
+        import numpy as np
+        from sklearn.ensemble import RandomForestClassifier
+        
+        encodings = FeaturePipeline.fit_encodings({'district': ['patiala'], 'soil_type': ['alluvial']})
+        pipeline = FeaturePipeline(encodings, mean=[0.0] * 8, scale=[1.0] * 8)
+        model = RandomForestClassifier(n_estimators=2, random_state=0).fit(np.zeros((2, 8)), [crop, crop])
+        
+        def write(directory):
+            pipeline.save(os.path.join(directory, 'feature_pipeline.json'))
+            export_forest(model, os.path.join(directory, 'crop_forest'))
+        return registry.register(write, {})
+    
+    def test_watcher_swaps_and_shadow_compares(self):
+        """Test a promotion is picked up without a restart and shadow stats are recorded"""
+        inputs = {'nitrogen': 20, 'phosphorus': 10, 'potassium': 200, 'ph': 7.0,
+                  'district': 'Patiala', 'soil_type': 'alluvial'}
+        
+        with tempfile.TemporaryDirectory() as directory:
+            registry = ModelRegistry(directory)
+            wheat = self.register_version(registry, 'Wheat')
+            rice = self.register_version(registry, 'Rice')
+            registry.promote(wheat)
+            
+            predictor = CropPredictor(model_path=os.path.join(directory, 'missing.pkl'), registry=registry)
+            shadow = ShadowEvaluator(sample_rate=1.0, registry=registry)
+            watcher = RegistryWatcher(predictor, shadow, registry, interval=0)
+            self.assertEqual(predictor.predict_crop(**inputs)['crop'], 'Wheat')
+            
+            registry.set_shadow(rice)
+            self.assertTrue(watcher.check())
+            primary = predictor.predict_crop(**inputs)
+            self.assertTrue(shadow.submit(inputs, primary, 0.001))
+            shadow.shutdown()
+            stats = shadow.stats()
+            self.assertEqual((stats['candidate_version'], stats['compared'], stats['agreement_rate']), (rice, 1, 0.0))
+            
+            registry.promote(rice)
+            registry.clear_shadow()
+            self.assertTrue(watcher.check())
+            self.assertEqual(predictor.model_version, rice)
+            self.assertEqual(predictor.predict_crop(**inputs)['crop'], 'Rice')
+            self.assertIsNone(shadow.candidate)
+
+class TestBenchmarkBaseline(unittest.TestCase):
+    def test_regression_threshold(self):
+        """Test only gated metrics beyond both the threshold and the noise floor regress"""
+        baseline = {'results': {
+            'api.recommend': {'p50_ms': 1.0, 'p95_ms': 2.0, 'p99_ms': 3.0, 'alloc_peak_kb': 50.0},
+            'predict.fertilizer': {'p50_ms': 0.002, 'p95_ms': 0.003, 'alloc_peak_kb': 0.1}
+        }}
+        report = {'results': {
+            'api.recommend': {'p50_ms': 1.2, 'p95_ms': 3.0, 'p99_ms': 9.0, 'alloc_peak_kb': 80.0},
+            'predict.fertilizer': {'p50_ms': 0.004, 'p95_ms': 0.006, 'alloc_peak_kb': 0.1},
+            'messages.crop_alert': {'p50_ms': 5.0, 'p95_ms': 5.0, 'alloc_peak_kb': 5.0}
+        }}
+        
+        regressions = compare_to_baseline(report, baseline, threshold=0.25)
+        
+        self.assertEqual([(r['benchmark'], r['metric']) for r in regressions],
+                         [('api.recommend', 'p95_ms'), ('api.recommend', 'alloc_peak_kb')])
+
+class TestWriteBehindQueue(unittest.TestCase):
+    def collector(self):
+        """flush_fn recording each batch and the thread that wrote it"""
+        batches = []
+        def flush(batch):
+            batches.append((threading.current_thread().name, list(batch)))
+        return batches, flush
+    
+    def test_full_batches_then_remainder(self):
+        """Test records are written in batches of batch_size, the rest after the interval"""
+        batches, flush = self.collector()
+        writer = WriteBehindQueue(flush, batch_size=3, flush_interval_ms=100, name='test-batches')
+        writer.put_many(list(range(7)))
+        time.sleep(0.3)
+        
+        self.assertEqual([batch for _, batch in batches], [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual({thread for thread, _ in batches}, {'test-batches'})
+        self.assertEqual((writer.stats()['flushed'], writer.stats()['batches'], writer.depth()), (7, 3, 0))
+        writer.shutdown()
+    
+    def test_interval_flush(self):
+        """Test a partial batch is written once the flush interval passes"""
+        batches, flush = self.collector()
+        writer = WriteBehindQueue(flush, batch_size=100, flush_interval_ms=20)
+        writer.put('a')
+        writer.put('b')
+        deadline = time.monotonic() + 2
+        while not batches and time.monotonic() < deadline:
+            time.sleep(0.01)
+        
+        self.assertEqual([batch for _, batch in batches], [['a', 'b']])
+        writer.shutdown()
+    
+    def test_shutdown_drains_queue(self):
+        """Test shutdown writes every queued record before the interval passes"""
+        batches, flush = self.collector()
+        writer = WriteBehindQueue(flush, batch_size=100, flush_interval_ms=60000)
+        writer.put_many(list(range(5)))
+        
+        started = time.perf_counter()
+        writer.shutdown()
+        self.assertLess(time.perf_counter() - started, 5)
+        self.assertEqual(sum(len(batch) for _, batch in batches), 5)
+        self.assertEqual(writer.stats()['queue_depth'], 0)
+    
+    def test_full_queue_writes_inline(self):
+        """Test overflow is written on the caller's thread, or dropped when allowed"""
+        batches, flush = self.collector()
+        release = threading.Event()
+        def blocking_flush(batch):
+            if threading.current_thread().name == 'test-full':
+                release.wait(5)
+            flush(batch)
+        writer = WriteBehindQueue(blocking_flush, batch_size=1, flush_interval_ms=10,
+                                  max_queue_size=2, name='test-full')
+        writer.put('first')
+        time.sleep(0.05)  # the writer thread is now blocked on 'first'
+        writer.put_many(['a', 'b', 'c', 'd'])
+        
+        self.assertEqual(batches, [(threading.current_thread().name, ['c', 'd'])])
+        release.set()
+        writer.shutdown()
+        self.assertEqual(writer.stats()['flushed'], 5)
+        
+        hold = threading.Event()
+        dropping = WriteBehindQueue(lambda batch: hold.wait(5) and None, batch_size=1,
+                                    flush_interval_ms=10, max_queue_size=2, drop_when_full=True)
+        dropping.put('first')
+        time.sleep(0.05)
+        dropping.put_many(['a', 'b', 'c', 'd'])
+        self.assertEqual(dropping.stats()['dropped'], 2)
+        hold.set()
+        dropping.shutdown()
+        self.assertEqual(dropping.stats()['flushed'], 3)
+    
+    def test_failures_are_counted(self):
+        """Test raised errors and rejected rows of a history batch count as failed"""
+        from api.endpoints import write_recommendations_to_db
+        writer = WriteBehindQueue(write_recommendations_to_db, flush_interval_ms=10)
+        writer.put(({'nitrogen': 50}, {'crop': 'Rice'}))  # no district
+        writer.shutdown()
+        self.assertEqual((writer.stats()['failed'], writer.stats()['flushed']), (1, 0))
+        
+        partial = WriteBehindQueue(lambda batch: 1, flush_interval_ms=10)
+        partial.put_many(['a', 'b', 'c'])
+        partial.shutdown()
+        self.assertEqual((partial.stats()['failed'], partial.stats()['flushed']), (1, 2))
+
+class TestRequestTiming(unittest.TestCase):
+    def test_one_record_per_request_with_sub_timings(self):
+        """Test an app and blueprint both instrumented log each request once"""
+        from flask import Flask, Blueprint
+        
+        records = []
+        api_logger = APILogger(enabled=True)
+        api_logger.queue = WriteBehindQueue(records.extend, flush_interval_ms=10)
+        
+        bp = Blueprint('timed', __name__, url_prefix='/api')
+        
+        @bp.route('/work/<name>')
+        def work(name):
+            with timed('inference'):
+                pass
+            with timed('db'):
+                pass
+            return name
+        
+        app = Flask(__name__)
+        api_logger.init_app(app)
+        api_logger.init_app(bp)
+        app.register_blueprint(bp)
+        client = app.test_client()
+        
+        client.get('/api/work/a', headers={'User-Agent': 'test'})
+        client.get('/missing')
+        api_logger.queue.shutdown()
+        
+        self.assertEqual([record[:3] for record in records], [('/api/work/<name>', 'GET', 200), ('/missing', 'GET', 404)])
+        endpoint, method, status, elapsed, inference, db, ip_address, user_agent, logged_at = records[0]
+        self.assertGreaterEqual(elapsed, inference + db)
+        self.assertEqual(user_agent, 'test')
+        self.assertIsNone(records[1][4])
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_workers_are_summed_in_prometheus_text(self):
+        """Test counters and histograms from two worker registries are merged"""
+        with tempfile.TemporaryDirectory() as directory:
+            workers = [MetricsRegistry(directory, flush_interval=60) for _ in range(2)]
+            for worker, seconds in zip(workers, (0.003, 0.2)):
+                worker.counter('sends_total', 'Sends', ['channel']).inc(channel='sms')
+                worker.histogram('latency_seconds', 'Latency', buckets=(0.01, 0.1)).observe(seconds)
+            workers[1].flush()
+            
+            text = workers[0].render()
+        
+        self.assertIn('sends_total{channel="sms"} 2\n', text)
+        self.assertIn('latency_seconds_bucket{le="0.01"} 1\n', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 2\n', text)
+        self.assertIn('latency_seconds_count 2\n', text)
+
+class TestRequestProfiler(unittest.TestCase):
+    def test_profiled_request_is_aggregated(self):
+        """Test an X-Profile request writes a pstats file and shows up in the summary"""
+        from flask import Flask
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = RequestProfiler(directory, sample_rate=0, keep=5)
+            test_app = Flask(__name__)
+            profiler.init_app(test_app)
+            
+            @test_app.route('/api/work')
+            def work():
+                return {'total': sum(range(1000))}
+            
+            client = test_app.test_client()
+            response = client.get('/api/work', headers={'X-Profile': '1'})
+            unprofiled = client.get('/api/work')
+            profiler.queue.shutdown()
+            
+            self.assertIn('X-Profile-Id', response.headers)
+            self.assertNotIn('X-Profile-Id', unprofiled.headers)
+            self.assertEqual(profiler.list_profiles('/api/work'), [response.headers['X-Profile-Id']])
+            summary = profiler.hottest(limit=50)
+            self.assertEqual(summary['profiles'], 1)
+            self.assertTrue(any('(work)' in entry['function'] for entry in summary['functions']))
+
+class FakeNotificationAPI:
+    """Stand-in for NotificationAPI; each channel returns its queued outcomes, then success"""
+    def __init__(self):
+        self.sent = []
+        self.outcomes = {'sms': [], 'whatsapp': []}
+        self.failing = set()  # (channel, phone) pairs that always fail permanently
+        self.flaky = set()  # (channel, phone) pairs that always time out
+        self._lock = threading.Lock()
+    
+    def send(self, channel, phone, message):
+        with self._lock:
+            self.sent.append((channel, phone))
+            queued = self.outcomes[channel]
+            outcome = queued.pop(0) if queued else {'status': 'success'}
+            if (channel, phone) in self.failing:
+                outcome = {'status': 'error', 'error': 'invalid number', 'retryable': False}
+            if (channel, phone) in self.flaky:
+                outcome = {'status': 'error', 'error': 'timed out', 'retryable': True}
+        if isinstance(outcome, Exception):
+            raise outcome
+        return dict(outcome, phone=phone)
+    
+    def send_sms(self, phone, message):
+        return self.send('sms', phone, message)
+    
+    def send_whatsapp(self, phone, message):
+        return self.send('whatsapp', phone, message)
+
+class TestDeliveryDeduplication(unittest.TestCase):
+    def test_payload_is_rendered_once(self):
+        """Test identical payloads share one rendering and hash"""
+        renderer = MessageRenderer(ttl=60)
+        alert = {'temperature': 41, 'humidity': 20, 'alerts': [{'message': 'Heat wave', 'recommendation': 'Irrigate'}]}
+        first = renderer.render(weather_alert_payload('Patiala', alert))
+        again = renderer.render(weather_alert_payload('Patiala', alert))
+        other = renderer.render(weather_alert_payload('Ludhiana', alert))
+        
+        self.assertEqual(first, again)
+        self.assertNotEqual(first[0], other[0])
+        self.assertIn('Heat wave', first[1])
+        self.assertEqual((renderer.hits, renderer.misses), (1, 2))
+    
+    def test_failed_send_does_not_block_retry(self):
+        """Test a failed delivery can be retried and a successful one is de-duplicated"""
+        api = FakeNotificationAPI()
+        dispatcher = BulkDispatcher(api=api, workers=2, sms_rate=0, whatsapp_rate=0, max_retries=0,
+                                    backoff_base=0, deduplicator=DeliveryDeduplicator(window=3600))
+        api.outcomes['sms'].append({'status': 'error', 'error': 'invalid number'})
+        api.outcomes['whatsapp'].append({'status': 'error', 'error': 'invalid number'})
+        phones = ['919800000001']
+        
+        failed = dispatcher.dispatch('Frost tonight', phones=phones)
+        retried = dispatcher.dispatch('Frost tonight', phones=phones)
+        repeated = dispatcher.dispatch('Frost tonight', phones=phones)
+        
+        self.assertEqual((failed['failed'], failed['duplicates_skipped']), (2, 0))
+        self.assertEqual((retried['sent'], retried['duplicates_skipped']), (2, 0))
+        self.assertEqual((repeated['sent'], repeated['duplicates_skipped']), (0, 1))
+        self.assertEqual(len(api.sent), 4)
+
+class TestBulkDispatcher(unittest.TestCase):
+    def dispatcher(self, api, **kwargs):
+        options = dict(workers=2, sms_rate=0, whatsapp_rate=0, max_retries=2, backoff_base=0,
+                       deduplicator=DeliveryDeduplicator(window=3600))
+        options.update(kwargs)
+        return BulkDispatcher(api=api, **options)
+    
+    def test_token_bucket_rate(self):
+        """Test the bucket allows a burst, then paces to its rate; 0 is unlimited"""
+        bucket = TokenBucket(rate=100, capacity=2)
+        self.assertEqual((bucket.try_acquire(), bucket.try_acquire()), (0, 0))
+        self.assertGreater(bucket.try_acquire(), 0)
+        
+        started = time.perf_counter()
+        for _ in range(5):
+            bucket.acquire()
+        self.assertGreaterEqual(time.perf_counter() - started, 0.04)
+        
+        unlimited = TokenBucket(rate=0)
+        self.assertTrue(all(unlimited.try_acquire() == 0 for _ in range(1000)))
+    
+    def test_only_transient_failures_are_retried(self):
+        """Test timeouts and 5xx are retried with backoff, permanent errors are not"""
+        api = FakeNotificationAPI()
+        dispatcher = self.dispatcher(api)
+        timeout = {'status': 'error', 'error': 'timed out', 'retryable': True}
+        api.outcomes['sms'] += [timeout, ConnectionError('reset')]
+        result, retries = dispatcher.send_with_retry('sms', '919800000001', 'Frost tonight')
+        self.assertEqual((result['status'], retries, len(api.sent)), ('success', 2, 3))
+        
+        api.outcomes['sms'] += [timeout] * 3
+        result, retries = dispatcher.send_with_retry('sms', '919800000001', 'Frost tonight')
+        self.assertEqual((result['status'], retries, len(api.sent)), ('error', 2, 6))
+        
+        api.outcomes['sms'].append({'status': 'error', 'error': 'invalid number', 'retryable': False})
+        result, retries = dispatcher.send_with_retry('sms', '919800000001', 'Frost tonight')
+        self.assertEqual((result['error'], retries, len(api.sent)), ('invalid number', 0, 7))
+        
+        # Backoff doubles per attempt, with jitter of 0.5x to 1.5x
+        dispatcher.backoff_base = 0.01
+        api.outcomes['sms'] += [timeout] * 2
+        started = time.perf_counter()
+        dispatcher.send_with_retry('sms', '919800000001', 'Frost tonight')
+        self.assertGreaterEqual(time.perf_counter() - started, 0.015)
+    
+    def test_provider_errors_are_classified(self):
+        """Test 429, 5xx and timeouts are transient while other 4xx are permanent"""
+        def http_error(status):
+            response = requests.Response()
+            response.status_code = status
+            return requests.HTTPError(response=response)
+        
+        self.assertTrue(all(is_transient(http_error(status)) for status in (429, 500, 503)))
+        self.assertFalse(any(is_transient(http_error(status)) for status in (400, 401, 404)))
+        self.assertTrue(is_transient(requests.Timeout()))
+        self.assertTrue(is_transient(ConnectionError()))
+        self.assertFalse(is_transient(KeyError('sid')))
+    
+    def test_dispatch_is_bounded_and_counted(self):
+        """Test sends run at most workers at a time and every outcome is counted"""
+        api = FakeNotificationAPI()
+        in_flight, peak = [0], [0]
+        lock = threading.Lock()
+        send = api.send
+        
+        def slow_send(channel, phone, message):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.002)
+            with lock:
+                in_flight[0] -= 1
+            return send(channel, phone, message)
+        api.send = slow_send
+        
+        dispatcher = self.dispatcher(api)
+        phones = [f'9198000{i:05d}' for i in range(50)]
+        dispatcher.deduplicator.claim(phones[0], content_hash('Frost tonight'))
+        api.failing.add(('whatsapp', phones[1]))
+        api.outcomes['sms'].append({'status': 'error', 'error': 'timed out', 'retryable': True})
+        
+        stats = dispatcher.dispatch('Frost tonight', phones=phones + phones[:5])
+        
+        self.assertLessEqual(peak[0], dispatcher.workers)
+        self.assertEqual((stats['recipients'], stats['duplicates_skipped']), (50, 1))
+        self.assertEqual(stats['channels']['sms'], {'sent': 49, 'failed': 0, 'retries': 1})
+        self.assertEqual(stats['channels']['whatsapp'], {'sent': 48, 'failed': 1, 'retries': 0})
+        self.assertEqual(stats['failures'], [{'phone': phones[1], 'channel': 'whatsapp', 'error': 'invalid number'}])
+        self.assertEqual(len(api.sent), 49 * 2 + 1)
+
+class TestConnectionPool(unittest.TestCase):
+    def test_pragmas_and_connection_reuse(self):
+        """Test pooled connections get the pool's pragmas and are returned for reuse"""
+        import sqlite3
+        with tempfile.TemporaryDirectory() as directory:
+            pool = ConnectionPool(os.path.join(directory, 'pool.db'), pool_size=2, busy_timeout=150)
+            with pool.connection() as conn:
+                first = conn
+                self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+                self.assertEqual(conn.execute('PRAGMA synchronous').fetchone()[0], 1)  # NORMAL
+                self.assertEqual(conn.execute('PRAGMA busy_timeout').fetchone()[0], 150)
+                conn.execute('CREATE TABLE t (x INTEGER)')
+                conn.execute('INSERT INTO t VALUES (1)')  # left uncommitted
+            
+            with pool.connection() as conn:
+                self.assertIs(conn, first)
+                self.assertEqual(conn.execute('SELECT COUNT(*) FROM t').fetchone()[0], 0)
+                with pool.connection() as other:
+                    self.assertIsNot(other, first)
+                    with self.assertRaises(sqlite3.OperationalError):
+                        pool.acquire()
+            self.assertEqual(pool._created, 2)
+            pool.close_all()
+
+def schema_database(directory):
+    """Path of a new SQLite database built from schema.sql"""
+    import sqlite3
+    path = os.path.join(directory, 'test.db')
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'schema.sql')) as f:
+        conn = sqlite3.connect(path)
+        conn.executescript(f.read())
+        conn.close()
+    return path
+
+class TestAlertOutbox(unittest.TestCase):
+    def setUp(self):
+        """An outbox on a temporary database, without its background worker"""
+        self.directory = tempfile.TemporaryDirectory()
+        self.pool = ConnectionPool(schema_database(self.directory.name), pool_size=2)
+        self.api = FakeNotificationAPI()
+        dispatcher = BulkDispatcher(api=self.api, workers=2, sms_rate=0, whatsapp_rate=0,
+                                    max_retries=0, backoff_base=0)
+        self.outbox = AlertOutbox(dispatcher=dispatcher, pool=self.pool, lease_seconds=60,
+                                  max_attempts=2, dedup_window=3600)
+    
+    def tearDown(self):
+        self.pool.close_all()
+        self.directory.cleanup()
+    
+    def status(self, alert_id):
+        return self.outbox.get_status(alert_id)['delivery_status']
+    
+    def test_claimed_rows_are_leased(self):
+        """Test claimed rows are skipped until their lease expires"""
+        first = self.outbox.enqueue('919800000001', 'Patiala', 'Frost tonight', message_hash='a')
+        self.outbox.enqueue('919800000002', 'Patiala', 'Frost tonight', message_hash='a')
+        
+        claimed = self.outbox.claim_batch()
+        self.assertEqual([row[4] for row in claimed], [0, 0])
+        self.assertEqual(self.status(first), 'sending')
+        self.assertEqual(self.outbox.claim_batch(), [])
+        
+        # As if the claiming process died an hour ago
+        with self.pool.transaction() as conn:
+            conn.execute("UPDATE weather_alerts SET claimed_at = datetime('now', '-1 hour')")
+        self.assertEqual([row[4] for row in self.outbox.claim_batch()], [1, 1])
+    
+    def test_batch_statuses_and_retry_to_failed(self):
+        """Test one batch records sent, partial, retried and invalid alerts, then gives up"""
+        sent = self.outbox.enqueue('919800000001', 'Patiala', 'Frost tonight', message_hash='a')
+        partial = self.outbox.enqueue('919800000002', 'Patiala', 'Frost tonight', message_hash='a')
+        broken = self.outbox.enqueue('919800000003', 'Patiala', 'Frost tonight', message_hash='a')
+        invalid = self.outbox.enqueue('919800000004', 'Patiala', 'Frost tonight', message_hash='a')
+        self.api.failing |= {('whatsapp', '919800000002'), ('sms', '919800000004'), ('whatsapp', '919800000004')}
+        self.api.flaky |= {('sms', '919800000003'), ('whatsapp', '919800000003')}
+        
+        self.assertEqual(self.outbox.process_batch(), 4)
+        self.assertEqual(self.status(sent), 'sent')
+        self.assertEqual(self.status(partial), 'sent')
+        self.assertIn('whatsapp: invalid number', self.outbox.get_status(partial)['last_error'])
+        self.assertEqual(self.status(broken), 'pending')
+        # A permanent error on every channel is not retried
+        self.assertEqual(self.status(invalid), 'failed')
+        
+        self.assertEqual(self.outbox.process_batch(), 1)
+        self.assertEqual(self.outbox.get_status(broken)['delivery_status'], 'failed')
+        self.assertEqual(self.outbox.get_status(broken)['attempts'], 2)
+        self.assertEqual(self.outbox.process_batch(), 0)
+    
+    def test_bulk_enqueue(self):
+        """Test one bulk insert queues every district farmer once, skipping duplicates"""
+        with self.pool.transaction() as conn:
+            conn.executemany('INSERT INTO farmers (phone, district) VALUES (?, ?)',
+                             [('919800000001', 'Moga'), ('919800000002', 'moga'), ('919800000003', 'Sangrur')])
+        
+        queued = self.outbox.enqueue_many('Frost tonight', 'Moga', message_hash='a')
+        self.assertEqual((queued['recipients'], queued['queued'], queued['duplicates_skipped']), (2, 2, 0))
+        self.assertEqual(queued['last_alert_id'] - queued['first_alert_id'], 1)
+        self.assertEqual(self.outbox.enqueue_many('Frost tonight', 'Moga', message_hash='a')['queued'], 0)
+        
+        # Given phones: known ones are reused, new ones registered in the district
+        queued = self.outbox.enqueue_many('Frost tonight', 'Moga', message_hash='a',
+                                          phones=['919800000003', '919800000004', '919800000001', '919800000003'])
+        self.assertEqual((queued['recipients'], queued['queued'], queued['duplicates_skipped']), (3, 2, 1))
+        with self.pool.connection() as conn:
+            self.assertEqual(conn.execute("SELECT district FROM farmers WHERE phone = '919800000004'").fetchone()[0],
+                             'Moga')
+        
+        self.assertEqual(self.outbox.process_batch(), 4)
+        self.assertEqual(self.status(queued['last_alert_id']), 'sent')
+        self.assertEqual(len(self.api.sent), 8)
+    
+    def test_duplicates_skip_only_queued_or_sent(self):
+        """Test the same content is not queued twice, but a failed alert can be re-queued"""
+        self.outbox.max_attempts = 1
+        self.api.failing |= {('sms', '919800000003'), ('whatsapp', '919800000003')}
+        self.assertIsNotNone(self.outbox.enqueue('919800000001', 'Patiala', 'Frost tonight', message_hash='a'))
+        self.assertIsNotNone(self.outbox.enqueue('919800000003', 'Patiala', 'Frost tonight', message_hash='a'))
+        self.assertIsNone(self.outbox.enqueue('919800000001', 'Patiala', 'Frost tonight', message_hash='a'))
+        
+        self.outbox.process_batch()
+        self.assertIsNone(self.outbox.enqueue('919800000001', 'Patiala', 'Frost tonight', message_hash='a'))
+        self.assertIsNotNone(self.outbox.enqueue('919800000003', 'Patiala', 'Frost tonight', message_hash='a'))
+        self.assertIsNotNone(self.outbox.enqueue('919800000001', 'Patiala', 'Thaw tomorrow', message_hash='b'))
+
+class TestIncrementalRetrain(unittest.TestCase):
+    def setUp(self):
+        """Recommendations with outcomes in a temporary database"""
+        self.directory = tempfile.TemporaryDirectory()
+        self.pool = ConnectionPool(schema_database(self.directory.name), pool_size=2)
+        self.cache = TrainingCache(os.path.join(self.directory.name, 'training_cache'))
+        with self.pool.transaction() as conn:
+            conn.execute("INSERT INTO farmers (phone, district) VALUES ('919800000001', 'Patiala')")
+            for crop in ['Wheat', 'Rice', 'Maize', 'Cotton', 'Wheat', 'Rice']:
+                self.recommend(conn, crop, days_ago=200)
+            # Helpful feedback labels 1-5; a poor rating leaves 6 unlabeled
+            conn.executemany('INSERT INTO feedback (recommendation_id, rating, is_helpful) VALUES (?, ?, ?)',
+                             [(i, 5, 1) for i in range(1, 6)] + [(6, 2, 0)])
+            # The farmer grew something else after recommendation 7
+            self.recommend(conn, 'Wheat', days_ago=200, farmer_id=1)
+            conn.execute("INSERT INTO crop_yields (farmer_id, season, year, crop, area, district, created_at) "
+                         "VALUES (1, 'kharif', 2025, 'Sugarcane', 2, 'Patiala', datetime('now', '-150 days'))")
+            # Too recent for its outcome to be known
+            self.recommend(conn, 'Maize', days_ago=10)
+            conn.execute('INSERT INTO feedback (recommendation_id, rating, is_helpful) VALUES (8, 5, 1)')
+    
+    def tearDown(self):
+        self.pool.close_all()
+        self.directory.cleanup()
+    
+    def recommend(self, conn, crop, days_ago, farmer_id=None):
+        conn.execute(
+            "INSERT INTO recommendations (farmer_id, district, soil_type, nitrogen, phosphorus, potassium, ph, "
+            "recommended_crop, created_at) VALUES (?, 'Patiala', 'Alluvial', 80, 40, 40, 6.8, ?, datetime('now', ?))",
+            (farmer_id, crop, f'-{days_ago} days')
+        )
+    
+    def extract(self):
+        return extract_new_examples(self.cache, chunk_size=2, settle_days=120, pool=self.pool)
+    
+    def test_chunks_and_watermark(self):
+        """Test settled rows are read in keyset chunks once, past unlabeled ones"""
+        self.assertEqual(self.extract(), 6)
+        state = self.cache.load_state()
+        self.assertEqual((state['watermark'], state['rows'], state['rows_since_train']), (7, 6, 6))
+        # Chunks of ids [1, 2], [3, 4], [5, 6] and [7]
+        self.assertEqual(len(self.cache.part_paths()), 4)
+        self.assertEqual(list(self.cache.read_recent(100)['crop']),
+                         ['Wheat', 'Rice', 'Maize', 'Cotton', 'Wheat', 'Sugarcane'])
+        self.assertEqual(list(self.cache.read_recent(2)['crop']), ['Wheat', 'Sugarcane'])
+        
+        self.assertEqual(self.extract(), 0)
+        with self.pool.transaction() as conn:
+            # Late feedback on a row behind the watermark is not picked up
+            conn.execute('UPDATE feedback SET rating = 5, is_helpful = 1 WHERE recommendation_id = 6')
+            conn.execute("UPDATE recommendations SET created_at = datetime('now', '-130 days') WHERE id = 8")
+        self.assertEqual(self.extract(), 1)
+        self.assertEqual(self.cache.load_state()['watermark'], 8)
+        self.assertEqual(list(self.cache.read_recent(1)['crop']), ['Maize'])
+    
+    def test_skips_until_enough_new_rows(self):
+        """Test retraining is skipped until min_new_rows labeled rows have arrived"""
+        version = retrain(cache=self.cache, min_new_rows=7, pool=self.pool)
+        
+        self.assertIsNone(version)
+        self.assertEqual(self.cache.load_state()['rows_since_train'], 6)
+
+class TestSchemaMigration(unittest.TestCase):
+    def test_legacy_tables_gain_schema_columns(self):
+        """Test a database from the old init_db is migrated to schema.sql in place"""
+        import sqlite3
+        from app import SCHEMA_PATH, migrate_tables
+        with open(SCHEMA_PATH) as f:
+            schema_sql = f.read()
+        
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE farmers (id INTEGER PRIMARY KEY AUTOINCREMENT, phone TEXT UNIQUE, '
+                     'district TEXT, taluk TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+        conn.execute("INSERT INTO farmers (phone, district) VALUES ('919800000001', 'Patiala')")
+        for _ in range(2):
+            migrate_tables(conn, schema_sql)
+            conn.executescript(schema_sql)
+        
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(farmers)')}
+        self.assertTrue({'name', 'village', 'updated_at'} <= columns)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM farmers').fetchone()[0], 4)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM market_prices').fetchone()[0], 5)
+        conn.execute("INSERT INTO recommendations (farmer_id, district, nitrogen, ph, recommended_crop) "
+                     "VALUES (1, 'Patiala', 25, 7.2, 'Wheat')")
+        conn.close()
+
+class TestAPILogger(unittest.TestCase):
+    def test_records_are_flushed_to_api_logs(self):
+        """Test queued request records are written to api_logs in milliseconds"""
+        with tempfile.TemporaryDirectory() as directory:
+            pool = ConnectionPool(schema_database(directory), pool_size=1)
+            logger = APILogger(enabled=True, flush_interval_ms=10, pool=pool)
+            logger.record('/api/health', '/api/health', 'GET', 200, 0.0123, {'db': 0.002}, '127.0.0.1', 'test')
+            logger.queue.shutdown()
+            
+            with pool.connection() as conn:
+                rows = conn.execute('SELECT endpoint, response_status, response_time, db_time FROM api_logs').fetchall()
+            pool.close_all()
+        
+        self.assertEqual(logger.queue.stats()['failed'], 0)
+        self.assertEqual(rows, [('/api/health', 200, 12.3, 2.0)])
+
+class TestReferenceDataCaching(unittest.TestCase):
+    def test_conditional_get_returns_304(self):
+        """Test reference endpoints send ETags and answer If-None-Match with 304"""
+        client = app.test_client()
+        for url in ['/api/districts', '/api/soil-data/Patiala', '/api/market-prices?district=Patiala']:
+            first = client.get(url)
+            self.assertEqual(first.status_code, 200)
+            self.assertIn('max-age', first.headers['Cache-Control'])
+            etag = first.headers['ETag']
+            self.assertFalse(etag.startswith('W/'))
+            
+            revalidated = client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(revalidated.status_code, 304)
+            self.assertEqual(revalidated.data, b'')
+            self.assertEqual(client.get(url).data, first.data)
+    
+    def test_new_version_rebuilds_body(self):
+        """Test a data version change replaces the cached body and ETag"""
+        from flask import Flask
+        cache = ResponseCache(max_age=60, max_entries=2)
+        data = {'version': 1}
+        test_app = Flask(__name__)
+        
+        @test_app.route('/data')
+        def serve():
+            return cache.respond(('data',), data['version'], lambda: dict(data))
+        
+        client = test_app.test_client()
+        etag = client.get('/data').headers['ETag']
+        self.assertEqual(client.get('/data', headers={'If-None-Match': etag}).status_code, 304)
+        
+        data['version'] = 2
+        response = client.get('/data', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'version': 2})
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(cache.stats()['builds'], 2)
+
+def installed(*modules):
+    return all(importlib.util.find_spec(name) is not None for name in modules)
+
+class TestAsyncServing(unittest.TestCase):
+    @unittest.skipUnless(installed('aiohttp'), 'async mode requirements not installed')
+    def test_concurrent_misses_share_one_fetch(self):
+        """Test concurrent requests for one district make a single upstream call"""
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubWeatherHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        weather = WeatherAPI(api_key='test_key', base_url=f'http://127.0.0.1:{server.server_port}')
+        api = AsyncWeatherAPI(weather, pool=AsyncClientPool(timeout=2, name='test'))
+        
+        async def fetch_all():
+            try:
+                return await asyncio.gather(*[api.get_current_weather(name) for name in ['Patiala'] * 5 + ['Broken']])
+            finally:
+                await api.pool.aclose()
+        
+        StubWeatherHandler.requests = 0
+        try:
+            results = asyncio.run(fetch_all())
+        finally:
+            server.shutdown()
+            server.server_close()
+        
+        self.assertEqual(StubWeatherHandler.requests, 2)
+        self.assertTrue(all(result['temperature'] == 30.5 for result in results[:5]))
+        self.assertEqual(results[5]['district'], 'Broken')  # mock fallback
+        self.assertEqual(weather.get_current_weather('Patiala')['temperature'], 30.5)
+    
+    @unittest.skipUnless(installed('starlette', 'a2wsgi', 'httpx'), 'async mode requirements not installed')
+    def test_asgi_app_serves_async_and_flask_routes(self):
+        """Test the ASGI app answers async endpoints and falls through to Flask"""
+        from starlette.testclient import TestClient
+        from asgi import create_asgi_app
+        
+        with TestClient(create_asgi_app()) as client:
+            weather = client.get('/api/weather?district=Patiala')
+            missing = client.get('/api/weather')
+            health = client.get('/api/health', headers={'Origin': 'http://example.com'})
+            bulk = client.post('/api/send-alert/bulk', json={'district': 'Patiala', 'phones': ['919876500003'],
+                                                            'message': f'Bulk test {uuid.uuid4()}'})
+        
+        self.assertEqual(weather.status_code, 200)
+        self.assertEqual(weather.json()['district'], 'Patiala')
+        self.assertEqual(missing.status_code, 400)
+        self.assertEqual(health.status_code, 200)
+        self.assertEqual(health.headers['access-control-allow-origin'], '*')
+        self.assertEqual(bulk.status_code, 202)
+        self.assertEqual(bulk.json()['result']['queued'], 1)
+
 if __name__ == '__main__':
     unittest.main()
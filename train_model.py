@@ -2,22 +2,112 @@
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.preprocessing import StandardScaler
+from sklearn.model_selection import train_test_split, ParameterGrid, ParameterSampler, StratifiedKFold, KFold
 from sklearn.metrics import accuracy_score, classification_report
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
 import joblib
+import json
 import os
+import sys
+import time
 import logging
 
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from models.forest_engine import export_forest, load_forest
+from models.feature_pipeline import FeaturePipeline, NUMERIC_FEATURES, CATEGORICAL_FEATURES
+from models.model_registry import model_registry, MODEL_FILE, PIPELINE_FILE, FOREST_DIR
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+DEFAULT_PARAMS = {'n_estimators': 100, 'random_state': 42}
+
+# Hyperparameter search space for the random forest
+PARAM_GRID = {
+    'n_estimators': [50, 100, 200],
+    'max_depth': [None, 8, 16],
+    'min_samples_leaf': [1, 2, 4],
+    'max_features': ['sqrt', 0.5]
+}
+
+# Training data for search worker processes, set once per process
+_search_data = {}
+
+def _init_search_worker(X, y):
+    _search_data['X'] = X
+    _search_data['y'] = y
+
+def _fit_fold(candidate, params, train_index, test_index):
+    """Fit and score one (candidate, fold) pair inside a worker process"""
+    X, y = _search_data['X'], _search_data['y']
+    started = time.perf_counter()
+    model = RandomForestClassifier(**dict(DEFAULT_PARAMS, **params, n_jobs=1))
+    model.fit(X[train_index], y[train_index])
+    fit_seconds = time.perf_counter() - started
+    return candidate, accuracy_score(y[test_index], model.predict(X[test_index])), fit_seconds
+
+def make_folds(y, cv):
+    """Stratified folds when every class is large enough, plain folds otherwise"""
+    _, counts = np.unique(y, return_counts=True)
+    cv = max(2, min(cv, len(y)))
+    splitter = StratifiedKFold if counts.min() >= cv else KFold
+    return list(splitter(n_splits=cv, shuffle=True, random_state=42).split(np.zeros(len(y)), y))
+
+def search_hyperparameters(X, y, candidates, cv=5, jobs=None):
+    """Cross-validate every candidate in a process pool
+
+    Every (candidate, fold) pair is a separate task, so all cores stay
+    busy even with few candidates. Returns one result per candidate,
+    best mean accuracy first.
+    """
+    candidates = list(candidates)
+    folds = make_folds(y, cv)
+    scores = {index: [] for index in range(len(candidates))}
+    fit_times = {index: [] for index in range(len(candidates))}
+    
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_search_worker, initargs=(X, y)) as pool:
+        futures = [
+            pool.submit(_fit_fold, index, params, train_index, test_index)
+            for index, params in enumerate(candidates)
+            for train_index, test_index in folds
+        ]
+        for future in as_completed(futures):
+            index, accuracy, fit_seconds = future.result()
+            scores[index].append(accuracy)
+            fit_times[index].append(fit_seconds)
+    wall_seconds = time.perf_counter() - started
+    
+    results = [
+        {
+            'params': params,
+            'mean_accuracy': float(np.mean(scores[index])),
+            'std_accuracy': float(np.std(scores[index])),
+            'fit_seconds': round(sum(fit_times[index]), 3),
+            'mean_fold_fit_seconds': round(float(np.mean(fit_times[index])), 4)
+        }
+        for index, params in enumerate(candidates)
+    ]
+    results.sort(key=lambda result: (-result['mean_accuracy'], result['fit_seconds']))
+    logger.info(
+        f"Searched {len(candidates)} candidates x {len(folds)} folds in {wall_seconds:.1f}s; "
+        f"best accuracy {results[0]['mean_accuracy']:.3f} with {results[0]['params']}"
+    )
+    return results, wall_seconds
+
 class CropRecommendationModel:
-    def __init__(self):
-        self.model = RandomForestClassifier(n_estimators=100, random_state=42)
+    def __init__(self, params=None):
+        self.params = dict(DEFAULT_PARAMS, **(params or {}))
+        self.model = RandomForestClassifier(**self.params)
         self.scaler = StandardScaler()
-        self.label_encoder = LabelEncoder()
-        self.feature_columns = ['nitrogen', 'phosphorus', 'potassium', 'ph', 'rainfall', 'temperature']
+        self.metrics = {}
+        self.pipeline = None
+        self.feature_columns = NUMERIC_FEATURES
         
     def load_data(self, data_path):
         """Load training data from CSV"""
@@ -33,16 +123,22 @@ class CropRecommendationModel:
         """Preprocess the training data"""
         try:
             # Handle missing values
-            self.data = self.data.fillna(self.data.mean())
+            self.data = self.data.fillna(self.data.mean(numeric_only=True))
             
-            # Encode categorical variables
-            self.data['district_encoded'] = self.label_encoder.fit_transform(self.data['district'])
-            self.data['soil_type_encoded'] = LabelEncoder().fit_transform(self.data['soil_type'])
+            # Encode categorical variables with the same lookup tables serving uses;
+            # the scaler statistics are filled in by train()
+            encodings = FeaturePipeline.fit_encodings(self.data)
+            self.pipeline = FeaturePipeline(encodings, mean=0.0, scale=1.0)
             
             # Prepare features and target
-            feature_cols = self.feature_columns + ['district_encoded', 'soil_type_encoded']
-            self.X = self.data[feature_cols]
-            self.y = self.data['crop']
+            columns = {name: self.data[name].values for name in NUMERIC_FEATURES + CATEGORICAL_FEATURES}
+            self.X, _ = self.pipeline.build(columns)
+            self.y = self.data['crop'].values
+            
+            # Split data
+            self.X_train, self.X_test, self.y_train, self.y_test = train_test_split(
+                self.X, self.y, test_size=0.2, random_state=42
+            )
             
             logger.info(f"Preprocessed data shape: {self.X.shape}")
             return True
@@ -53,21 +149,28 @@ class CropRecommendationModel:
     def train(self):
         """Train the model"""
         try:
-            # Split data
-            X_train, X_test, y_train, y_test = train_test_split(
-                self.X, self.y, test_size=0.2, random_state=42
-            )
+            X_train, X_test, y_train, y_test = self.X_train, self.X_test, self.y_train, self.y_test
             
             # Scale features
-            X_train_scaled = self.scaler.fit_transform(X_train)
-            X_test_scaled = self.scaler.transform(X_test)
+            self.scaler.fit(X_train)
+            self.pipeline = FeaturePipeline(self.pipeline.encodings, self.scaler.mean_, self.scaler.scale_)
+            X_train_scaled = self.pipeline.scale_features(X_train)
+            X_test_scaled = self.pipeline.scale_features(X_test)
             
             # Train model
+            started = time.perf_counter()
             self.model.fit(X_train_scaled, y_train)
+            training_seconds = time.perf_counter() - started
             
             # Evaluate model
             y_pred = self.model.predict(X_test_scaled)
             accuracy = accuracy_score(y_test, y_pred)
+            self.metrics = {
+                'accuracy': float(accuracy),
+                'train_samples': len(y_train),
+                'test_samples': len(y_test),
+                'training_seconds': round(training_seconds, 3)
+            }
             
             logger.info(f"Model accuracy: {accuracy:.3f}")
             logger.info("Classification Report:")
@@ -78,13 +181,15 @@ class CropRecommendationModel:
             logger.error(f"Error training model: {str(e)}")
             return False
     
-    def save_model(self, model_path, scaler_path):
-        """Save trained model and scaler"""
+    def save_model(self, model_path, pipeline_path, forest_path=None):
+        """Save trained model and feature pipeline, plus the flat forest if forest_path is given"""
         try:
-            os.makedirs(os.path.dirname(model_path), exist_ok=True)
+            if os.path.dirname(model_path):
+                os.makedirs(os.path.dirname(model_path), exist_ok=True)
             joblib.dump(self.model, model_path)
-            joblib.dump(self.scaler, scaler_path)
-            joblib.dump(self.label_encoder, 'models/label_encoder.pkl')
+            self.pipeline.save(pipeline_path)
+            if forest_path:
+                export_forest(self.model, forest_path)
             logger.info("Model saved successfully")
             return True
         except Exception as e:
@@ -99,7 +204,7 @@ class CropRecommendationModel:
                 raise ValueError("Invalid number of features")
             
             # Scale features
-            features_scaled = self.scaler.transform([features])
+            features_scaled = self.pipeline.scale_features(np.array([features], dtype=float))
             
             # Make prediction
             prediction = self.model.predict(features_scaled)[0]
@@ -114,28 +219,125 @@ class CropRecommendationModel:
             logger.error(f"Error making prediction: {str(e)}")
             return None
 
-def train_crop_model():
-    """Main function to train the crop recommendation model"""
+    def measure_latency(self, forest_path, repeats=200):
+        """Single-row inference latency of the exported forest and of sklearn, in ms"""
+        forest = load_forest(forest_path)
+        rows = self.pipeline.scale_features(self.X_test if len(self.X_test) else self.X_train)
+        timings = {'flat_forest': [], 'sklearn': []}
+        for i in range(repeats):
+            row = rows[i % len(rows)][None, :]
+            for name, predict_proba in (('flat_forest', forest.predict_proba), ('sklearn', self.model.predict_proba)):
+                started = time.perf_counter()
+                predict_proba(row)
+                timings[name].append((time.perf_counter() - started) * 1000)
+        return {
+            name: {'p50_ms': round(float(np.percentile(values, 50)), 3),
+                   'p95_ms': round(float(np.percentile(values, 95)), 3)}
+            for name, values in timings.items()
+        }
+    
+    def register(self, registry=None, metadata=None):
+        """Save this model as a new registry version and return its id"""
+        registry = registry or model_registry
+        metadata = dict(metadata or {}, params=self.params, metrics=self.metrics,
+                        feature_order=self.pipeline.feature_order)
+        
+        def write_artifacts(directory):
+            if not self.save_model(os.path.join(directory, MODEL_FILE),
+                                   os.path.join(directory, PIPELINE_FILE),
+                                   os.path.join(directory, FOREST_DIR)):
+                raise RuntimeError('Saving model artifacts failed')
+            metadata['inference_latency'] = self.measure_latency(os.path.join(directory, FOREST_DIR))
+        
+        return registry.register(write_artifacts, metadata)
+
+def train_crop_model(data_path=None, search=None, n_iter=20, cv=5, jobs=None, promote=True, registry=None):
+    """Main function to train the crop recommendation model
+
+    With search='grid' or 'random' the hyperparameters are chosen by
+    parallel cross-validation first. Returns the registered version id,
+    or False on failure.
+    """
+    data_path = data_path or Config.TRAINING_DATA_PATH
+    registry = registry or model_registry
     model = CropRecommendationModel()
     
     # Load data
-    if not model.load_data('../datasets/training_data.csv'):
+    if not model.load_data(data_path):
         return False
     
     # Preprocess data
     if not model.preprocess_data():
         return False
     
+    # Pick hyperparameters
+    metadata = {'data_path': data_path, 'search': search or 'none'}
+    if search:
+        if search == 'grid':
+            candidates = list(ParameterGrid(PARAM_GRID))
+        else:
+            candidates = list(ParameterSampler(PARAM_GRID, n_iter=n_iter, random_state=42))
+        results, wall_seconds = search_hyperparameters(model.X_train, model.y_train, candidates, cv, jobs)
+        model.params = dict(DEFAULT_PARAMS, **results[0]['params'])
+        model.model = RandomForestClassifier(**model.params)
+        metadata.update(search_seconds=round(wall_seconds, 3), cv_folds=cv,
+                        cv_accuracy=results[0]['mean_accuracy'], candidates=results)
+    
     # Train model
     if not model.train():
         return False
     
     # Save model
-    if not model.save_model('crop_recommendation_model.pkl', 'feature_scaler.pkl'):
+    try:
+        version = model.register(registry, metadata)
+    except Exception as e:
+        logger.error(f"Error registering model: {str(e)}")
         return False
     
-    logger.info("Model training completed successfully!")
-    return True
+    if promote:
+        registry.promote(version)
+    
+    logger.info(f"Model training completed successfully! Version {version}")
+    return version
+
+def main():
+    parser = argparse.ArgumentParser(description='Train and manage crop recommendation models')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    train_parser = commands.add_parser('train', help='Train a model and add it to the registry')
+    train_parser.add_argument('--data', default=Config.TRAINING_DATA_PATH)
+    train_parser.add_argument('--search', choices=['grid', 'random'], default=None,
+                              help='Hyperparameter search strategy (default: fixed parameters)')
+    train_parser.add_argument('--n-iter', type=int, default=20, help='Candidates for random search')
+    train_parser.add_argument('--cv', type=int, default=5)
+    train_parser.add_argument('--jobs', type=int, default=os.cpu_count())
+    train_parser.add_argument('--promote', action='store_true', help='Serve the new version right away')
+    
+    commands.add_parser('list', help='List registered model versions')
+    
+    promote_parser = commands.add_parser('promote', help='Serve a registered model version')
+    promote_parser.add_argument('version')
+    
+    args = parser.parse_args()
+    
+    if args.command == 'train':
+        version = train_crop_model(args.data, args.search, args.n_iter, args.cv, args.jobs, args.promote)
+        if not version:
+            sys.exit(1)
+        print(json.dumps(model_registry.get_metadata(version), indent=2, default=str))
+    elif args.command == 'list':
+        current = model_registry.current_version()
+        for metadata in model_registry.list_versions():
+            marker = '*' if metadata['version'] == current else ' '
+            print(f"{marker} {metadata['version']}  accuracy={metadata['metrics'].get('accuracy', 0):.3f}  "
+                  f"size={metadata['size_bytes'] / 1024:.0f}KB  params={metadata['params']}")
+    elif args.command == 'promote':
+        try:
+            model_registry.promote(args.version)
+        except ValueError as e:
+            logger.error(str(e))
+            sys.exit(1)
+        print(f"Serving model version {args.version}")
 
 if __name__ == "__main__":
-    train_crop_model()
+    main()
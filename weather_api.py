@@ -1,51 +1,169 @@
 # weather_api.py - Weather API integration and alert system
+import asyncio
 import requests
+from requests.adapters import HTTPAdapter
 import logging
+import threading
+import time
 from datetime import datetime, timedelta
 import json
+from collections import OrderedDict
+
+from config import Config
+from utils.alert_rules import evaluate_alerts
+from utils.metrics import metrics, histogram, counter
+from utils.async_http import client_pool
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+WEATHER_FETCH_SECONDS = histogram('smartcrop_weather_fetch_duration_seconds',
+                                  'Upstream weather fetch latency by outcome (api, mock, error)', ['outcome'])
+WEATHER_MOCK_FALLBACKS = counter('smartcrop_weather_mock_fallback_total',
+                                 'Weather served from mock data instead of the API', ['reason'])
+
 class WeatherAPI:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, cache_ttl=None, stale_ttl=None, base_url=None, max_entries=None):
         self.api_key = api_key or "demo_key"  # Replace with actual OpenWeather API key
-        self.base_url = "http://api.openweathermap.org/data/2.5"
+        self.base_url = base_url or "http://api.openweathermap.org/data/2.5"
+        
+        # Cached weather is fresh for cache_ttl seconds; after that it is
+        # still served for up to stale_ttl seconds while a background
+        # refresh fetches a new value. Districts come from request input,
+        # so at most max_entries are kept, least recently used first out
+        self.cache_ttl = Config.WEATHER_CACHE_TTL if cache_ttl is None else cache_ttl
+        self.stale_ttl = Config.WEATHER_STALE_TTL if stale_ttl is None else stale_ttl
+        self.max_entries = max_entries or Config.WEATHER_CACHE_ENTRIES
+        self._cache = OrderedDict()  # district -> (fetched_at, weather_data)
+        self._refreshing = set()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.stale_hits = 0
+        self.cache_misses = 0
+        
+        # Shared keep-alive session so repeated calls reuse connections
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=Config.WEATHER_HTTP_POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
     
     def get_current_weather(self, district, state="Punjab", country="IN"):
-        """Get current weather for a district"""
+        """Get current weather for a district, served from cache when possible"""
+        weather_data, stale = self.lookup_cache(district)
+        if weather_data is not None:
+            if stale:
+                self.refresh_in_background(district, state, country)
+            return weather_data
+        
         try:
-            # For demo purposes, return mock data
-            if self.api_key == "demo_key":
-                return self.get_mock_weather(district)
-            
-            # Real API call (when API key is available)
-            url = f"{self.base_url}/weather"
-            params = {
-                'q': f"{district},{state},{country}",
-                'appid': self.api_key,
-                'units': 'metric'
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            return {
-                'temperature': data['main']['temp'],
-                'humidity': data['main']['humidity'],
-                'pressure': data['main']['pressure'],
-                'description': data['weather'][0]['description'],
-                'wind_speed': data['wind']['speed'],
-                'district': district,
-                'timestamp': datetime.now().isoformat()
-            }
-            
+            return self.fetch_weather(district, state, country)
         except Exception as e:
             logger.error(f"Error fetching weather data: {str(e)}")
+            WEATHER_MOCK_FALLBACKS.inc(reason='error')
             return self.get_mock_weather(district)
     
+    def lookup_cache(self, district):
+        """(weather_data, stale) from the cache, or (None, False) on a miss"""
+        key = district.strip().lower()
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            
+            if entry is not None:
+                age = time.monotonic() - entry[0]
+                if age < self.stale_ttl:
+                    self._cache.move_to_end(key)
+                if age < self.cache_ttl:
+                    self.cache_hits += 1
+                    return entry[1], False
+                if age < self.stale_ttl:
+                    self.stale_hits += 1
+                    return entry[1], True
+            
+            self.cache_misses += 1
+            return None, False
+    
+    def weather_request(self, district, state="Punjab", country="IN"):
+        """URL and query parameters of an upstream current-weather call"""
+        return f"{self.base_url}/weather", {
+            'q': f"{district},{state},{country}",
+            'appid': self.api_key,
+            'units': 'metric'
+        }
+    
+    def parse_weather(self, data, district):
+        """Weather record from an upstream current-weather response"""
+        return {
+            'temperature': data['main']['temp'],
+            'humidity': data['main']['humidity'],
+            'pressure': data['main']['pressure'],
+            'description': data['weather'][0]['description'],
+            'wind_speed': data['wind']['speed'],
+            'district': district,
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    def store(self, district, weather_data):
+        """Cache a freshly fetched weather record"""
+        key = district.strip().lower()
+        with self._cache_lock:
+            self._cache[key] = (time.monotonic(), weather_data)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return weather_data
+    
+    def mock_fetch(self, district):
+        """Mock weather when no API key is configured"""
+        WEATHER_MOCK_FALLBACKS.inc(reason='no_api_key')
+        return self.get_mock_weather(district)
+    
+    def fetch_weather(self, district, state="Punjab", country="IN", timeout=10):
+        """Fetch current weather from upstream and store it in the cache"""
+        started = time.perf_counter()
+        # For demo purposes, return mock data
+        if self.api_key == "demo_key":
+            weather_data = self.mock_fetch(district)
+            outcome = 'mock'
+        else:
+            try:
+                # Real API call (when API key is available)
+                url, params = self.weather_request(district, state, country)
+                response = self.session.get(url, params=params, timeout=timeout)
+                response.raise_for_status()
+                weather_data = self.parse_weather(response.json(), district)
+            except Exception:
+                WEATHER_FETCH_SECONDS.observe(time.perf_counter() - started, outcome='error')
+                raise
+            outcome = 'api'
+        WEATHER_FETCH_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+        
+        return self.store(district, weather_data)
+    
+    def refresh_in_background(self, district, state="Punjab", country="IN"):
+        """Refresh a district's cached weather without blocking the caller"""
+        key = district.strip().lower()
+        with self._cache_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        
+        def refresh():
+            try:
+                self.fetch_weather(district, state, country)
+            except Exception as e:
+                # Keep serving the stale value until the next attempt
+                logger.error(f"Error refreshing weather data: {str(e)}")
+            finally:
+                with self._cache_lock:
+                    self._refreshing.discard(key)
+        
+        threading.Thread(target=refresh, name=f'weather-refresh-{key}', daemon=True).start()
+    
+    def clear_cache(self):
+        """Drop all cached weather"""
+        with self._cache_lock:
+            self._cache.clear()
+    
     def get_mock_weather(self, district):
         """Return mock weather data for demo"""
         import random
@@ -78,57 +196,7 @@ class WeatherAPI:
         """Generate weather alerts based on current conditions"""
         try:
             weather_data = self.get_current_weather(district)
-            alerts = []
-            
-            # Temperature alerts
-            if weather_data['temperature'] > 35:
-                alerts.append({
-                    'type': 'heat_wave',
-                    'severity': 'high',
-                    'message': f'High temperature alert: {weather_data["temperature"]:.1f}°C. Increase irrigation frequency.',
-                    'recommendation': 'Water crops early morning or late evening to prevent heat stress.'
-                })
-            elif weather_data['temperature'] < 5:
-                alerts.append({
-                    'type': 'frost',
-                    'severity': 'high',
-                    'message': f'Frost warning: {weather_data["temperature"]:.1f}°C. Protect tender crops.',
-                    'recommendation': 'Cover crops with protective sheets or use irrigation to prevent frost damage.'
-                })
-            
-            # Humidity alerts
-            if weather_data['humidity'] > 80:
-                alerts.append({
-                    'type': 'high_humidity',
-                    'severity': 'medium',
-                    'message': f'High humidity: {weather_data["humidity"]}%. Watch for fungal diseases.',
-                    'recommendation': 'Apply preventive fungicide and ensure proper ventilation.'
-                })
-            elif weather_data['humidity'] < 30:
-                alerts.append({
-                    'type': 'low_humidity',
-                    'severity': 'medium',
-                    'message': f'Low humidity: {weather_data["humidity"]}%. Increase irrigation.',
-                    'recommendation': 'Water crops more frequently to maintain soil moisture.'
-                })
-            
-            # Wind alerts
-            if weather_data['wind_speed'] > 15:
-                alerts.append({
-                    'type': 'strong_wind',
-                    'severity': 'medium',
-                    'message': f'Strong winds: {weather_data["wind_speed"]:.1f} m/s. Secure farm equipment.',
-                    'recommendation': 'Tie down loose equipment and check for wind damage.'
-                })
-            
-            # Rainfall alerts
-            if weather_data.get('rainfall', 0) > 10:
-                alerts.append({
-                    'type': 'heavy_rain',
-                    'severity': 'high',
-                    'message': f'Heavy rainfall: {weather_data["rainfall"]:.1f}mm. Check drainage.',
-                    'recommendation': 'Ensure proper drainage and cover harvested crops.'
-                })
+            alerts = evaluate_alerts([weather_data], districts=[district])[0]
             
             return {
                 'district': district,
@@ -146,6 +214,22 @@ class WeatherAPI:
                 'timestamp': datetime.now().isoformat()
             }
     
+    def get_weather_alerts_for_districts(self, districts):
+        """Generate weather alerts for many districts in a single rule pass"""
+        weather_records = [self.get_current_weather(district) for district in districts]
+        all_alerts = evaluate_alerts(weather_records, districts=districts)
+        timestamp = datetime.now().isoformat()
+        
+        return {
+            district: {
+                'district': district,
+                'alerts': alerts,
+                'weather_data': weather_data,
+                'timestamp': timestamp
+            }
+            for district, weather_data, alerts in zip(districts, weather_records, all_alerts)
+        }
+    
     def get_forecast(self, district, days=7):
         """Get weather forecast for next few days"""
         try:
@@ -176,8 +260,126 @@ class WeatherAPI:
             logger.error(f"Error getting forecast: {str(e)}")
             return None
 
+class AsyncWeatherAPI:
+    def __init__(self, weather=None, pool=None):
+        """Async variant of WeatherAPI for the ASGI serving mode
+
+        Shares the cache, counters and parsing of a WeatherAPI (by default
+        the global one, so the prefetch job warms both modes) and calls
+        upstream through a pooled async client. Concurrent misses for the
+        same district share one upstream call.
+        """
+        self.weather = weather or weather_api
+        self.pool = pool or client_pool('weather')
+        self._inflight = {}  # district key -> fetch task
+        self._loop = None
+    
+    async def get_current_weather(self, district, state="Punjab", country="IN"):
+        """Get current weather for a district, served from cache when possible"""
+        weather_data, stale = self.weather.lookup_cache(district)
+        if weather_data is not None:
+            if stale:
+                self.shared_fetch(district, state, country).add_done_callback(self._log_refresh_error)
+            return weather_data
+        
+        try:
+            # Shielded: a disconnecting client must not cancel a fetch
+            # other requests are waiting on
+            return await asyncio.shield(self.shared_fetch(district, state, country))
+        except Exception as e:
+            logger.error(f"Error fetching weather data: {str(e)}")
+            WEATHER_MOCK_FALLBACKS.inc(reason='error')
+            return self.weather.get_mock_weather(district)
+    
+    def shared_fetch(self, district, state="Punjab", country="IN"):
+        """The running fetch task for a district, starting one if needed"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._inflight, self._loop = {}, loop
+        key = district.strip().lower()
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = loop.create_task(self.fetch_weather(district, state, country))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+    
+    def _log_refresh_error(self, task):
+        # Keep serving the stale value until the next attempt
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Error refreshing weather data: {str(task.exception())}")
+    
+    async def fetch_weather(self, district, state="Punjab", country="IN", timeout=10):
+        """Fetch current weather from upstream and store it in the cache"""
+        started = time.perf_counter()
+        if self.weather.api_key == "demo_key":
+            weather_data = self.weather.mock_fetch(district)
+            outcome = 'mock'
+        else:
+            try:
+                url, params = self.weather.weather_request(district, state, country)
+                data = await self.pool.request_json('GET', url, params=params, timeout=timeout)
+                weather_data = self.weather.parse_weather(data, district)
+            except Exception:
+                WEATHER_FETCH_SECONDS.observe(time.perf_counter() - started, outcome='error')
+                raise
+            outcome = 'api'
+        WEATHER_FETCH_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+        
+        return self.weather.store(district, weather_data)
+    
+    async def get_weather_alerts(self, district):
+        """Generate weather alerts based on current conditions"""
+        try:
+            weather_data = await self.get_current_weather(district)
+            alerts = evaluate_alerts([weather_data], districts=[district])[0]
+            
+            return {
+                'district': district,
+                'alerts': alerts,
+                'weather_data': weather_data,
+                'timestamp': datetime.now().isoformat()
+            }
+            
+        except Exception as e:
+            logger.error(f"Error generating weather alerts: {str(e)}")
+            return {
+                'district': district,
+                'alerts': [],
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            }
+    
+    async def get_weather_alerts_for_districts(self, districts):
+        """Generate weather alerts for many districts, fetching them concurrently"""
+        weather_records = await asyncio.gather(*(self.get_current_weather(district) for district in districts))
+        all_alerts = evaluate_alerts(weather_records, districts=districts)
+        timestamp = datetime.now().isoformat()
+        
+        return {
+            district: {
+                'district': district,
+                'alerts': alerts,
+                'weather_data': weather_data,
+                'timestamp': timestamp
+            }
+            for district, weather_data, alerts in zip(districts, weather_records, all_alerts)
+        }
+
 # Global weather API instance
 weather_api = WeatherAPI()
+async_weather_api = AsyncWeatherAPI(weather_api)
+
+def _cache_metrics():
+    """Weather cache counters for the metrics registry"""
+    return {
+        'smartcrop_weather_cache_requests_total': ('Weather lookups by cache result', ['result'], {
+            ('hit',): weather_api.cache_hits,
+            ('stale',): weather_api.stale_hits,
+            ('miss',): weather_api.cache_misses
+        })
+    }
+
+metrics.register_collector(_cache_metrics)
 
 def get_weather_for_district(district):
     """Public interface for weather data"""
@@ -187,6 +389,18 @@ def get_alerts_for_district(district):
     """Public interface for weather alerts"""
     return weather_api.get_weather_alerts(district)
 
+def get_alerts_for_districts(districts):
+    """Public interface for weather alerts across many districts"""
+    return weather_api.get_weather_alerts_for_districts(districts)
+
 def get_forecast_for_district(district, days=7):
     """Public interface for weather forecast"""
     return weather_api.get_forecast(district, days)
+
+async def get_weather_for_district_async(district):
+    """Public interface for weather data in the async mode"""
+    return await async_weather_api.get_current_weather(district)
+
+async def get_alerts_for_district_async(district):
+    """Public interface for weather alerts in the async mode"""
+    return await async_weather_api.get_weather_alerts(district)
@@ -0,0 +1,70 @@
+# weather_prefetch.py - Concurrent all-district weather prefetch
+import argparse
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import Config
+from utils.soil_registry import soil_registry
+from utils.weather_api import weather_api
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def _fetch_one(api, district, timeout):
+    """Fetch one district and return how long it took in milliseconds"""
+    started = time.perf_counter()
+    api.fetch_weather(district, timeout=timeout)
+    return (time.perf_counter() - started) * 1000
+
+def prefetch_weather(districts=None, api=None, concurrency=None, timeout=None):
+    """Fetch weather for many districts concurrently and fill the cache
+
+    Defaults to every district in the soil registry. Returns a report
+    with the total wall time and the error for each failed district.
+    """
+    api = api or weather_api
+    districts = list(districts) if districts is not None else soil_registry.districts()
+    concurrency = concurrency or Config.WEATHER_PREFETCH_CONCURRENCY
+    timeout = timeout or Config.WEATHER_PREFETCH_TIMEOUT
+
+    started = time.perf_counter()
+    timings = {}
+    failures = {}
+
+    if districts:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='weather-prefetch') as pool:
+            futures = {pool.submit(_fetch_one, api, district, timeout): district for district in districts}
+            for future in as_completed(futures):
+                district = futures[future]
+                try:
+                    timings[district] = future.result()
+                except Exception as e:
+                    failures[district] = str(e)
+                    logger.error(f"Weather prefetch failed for {district}: {str(e)}")
+
+    wall_time_ms = (time.perf_counter() - started) * 1000
+    logger.info(
+        f"Prefetched weather for {len(timings)}/{len(districts)} districts "
+        f"in {wall_time_ms:.0f} ms ({len(failures)} failed)"
+    )
+
+    return {
+        'districts': len(districts),
+        'succeeded': len(timings),
+        'failed': len(failures),
+        'failures': failures,
+        'wall_time_ms': round(wall_time_ms, 1),
+        'slowest_ms': round(max(timings.values()), 1) if timings else 0,
+        'concurrency': concurrency
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Prefetch weather for all districts')
+    parser.add_argument('--concurrency', type=int, default=Config.WEATHER_PREFETCH_CONCURRENCY)
+    parser.add_argument('--timeout', type=float, default=Config.WEATHER_PREFETCH_TIMEOUT)
+    args = parser.parse_args()
+
+    report = prefetch_weather(concurrency=args.concurrency, timeout=args.timeout)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,163 @@
+# write_behind.py - Background batching queue for database inserts
+import os
+import queue
+import threading
+import time
+import atexit
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Sentinel telling the writer thread to drain and exit
+_STOP = object()
+
+class WriteBehindQueue:
+    def __init__(self, flush_fn, batch_size=200, flush_interval_ms=250,
+                 max_queue_size=10000, name='write-behind', drop_when_full=False):
+        """Buffer records in memory and hand them to flush_fn in batches
+
+        flush_fn receives a list of records and is called from a
+        background thread, either when batch_size records are waiting or
+        flush_interval_ms after the first record of a batch arrived. When
+        the queue is full, the caller writes its overflow inline with
+        flush_fn (so flush_fn must be safe to call from several threads),
+        or with drop_when_full the overflow is counted and discarded (for
+        data not worth slowing a request for).
+
+        A batch whose flush_fn raises counts as failed; flush_fn may also
+        return the number of records it rejected from a partial write.
+        """
+        self.flush_fn = flush_fn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.name = name
+        self.drop_when_full = drop_when_full
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self.in_flight = 0
+        self.flushed = 0
+        self.failed = 0
+        self.batches = 0
+        self.dropped = 0
+        atexit.register(self.shutdown)
+
+    def _ensure_started(self):
+        """Start the writer thread lazily, once per process"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # Forked child: the parent's thread and buffered records
+                # do not belong to this process
+                self._queue = queue.Queue(maxsize=self.max_queue_size)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def put(self, record):
+        """Queue one record for writing"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.put_many([record])
+
+    def put_many(self, records):
+        """Queue several records for writing"""
+        self._ensure_started()
+        for index, record in enumerate(records):
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                if self.drop_when_full:
+                    with self._stats_lock:
+                        self.dropped += len(records) - index
+                    return
+                # Apply backpressure instead of dropping history
+                logger.warning(f"{self.name} queue full, writing {len(records) - index} records inline")
+                self._flush(list(records[index:]))
+                return
+
+    def depth(self):
+        """Number of records waiting to be written"""
+        return self._queue.qsize() + self.in_flight
+
+    def stats(self):
+        """Queue depth and lifetime counters"""
+        return {
+            'queue_depth': self.depth(),
+            'flushed': self.flushed,
+            'failed': self.failed,
+            'batches': self.batches,
+            'dropped': self.dropped
+        }
+
+    def _flush(self, batch):
+        """Hand a batch to flush_fn and update counters"""
+        if not batch:
+            return
+        with self._stats_lock:
+            self.in_flight += len(batch)
+        try:
+            rejected = self.flush_fn(batch) or 0
+        except Exception as e:
+            rejected = None
+            logger.error(f"Error flushing {self.name} batch: {str(e)}")
+        with self._stats_lock:
+            self.in_flight -= len(batch)
+            if rejected is None:
+                self.failed += len(batch)
+            else:
+                self.flushed += len(batch) - rejected
+                self.failed += rejected
+                self.batches += 1
+
+    def _run(self):
+        """Writer loop: collect a batch, flush it, repeat"""
+        work_queue = self._queue
+        while True:
+            first = work_queue.get()
+            if first is _STOP:
+                return
+
+            batch = [first]
+            stopping = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    record = work_queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    stopping = True
+                    break
+                batch.append(record)
+
+            self._flush(batch)
+            if stopping:
+                return
+
+    def shutdown(self, timeout=10.0):
+        """Flush everything still queued and stop the writer thread"""
+        thread = self._thread
+        if thread is None or self._pid != os.getpid() or not thread.is_alive():
+            return
+
+        # The sentinel lands behind every queued record, so the writer
+        # drains the queue before exiting
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.error(f"{self.name} did not finish flushing within {timeout}s")
+        self._thread = None